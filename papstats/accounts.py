@@ -0,0 +1,237 @@
+"""Resolution of IMP account names to users."""
+
+# Standard Library
+import unicodedata
+from collections import defaultdict
+
+# Django
+from django.contrib.auth.models import User
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.app_settings import PAPSTATS_BULK_BATCH_SIZE
+from papstats.models import NormalizedCharacterName, UnknownAccount
+
+logger = get_extension_logger(__name__)
+
+
+def batched(items: list, size: int = None):
+    """Yields the items of a list in batches, to keep ``__in`` lookups small."""
+    size = size or PAPSTATS_BULK_BATCH_SIZE
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def normalize_account_name(name: str) -> str:
+    """Returns a name casefolded, without diacritics and with single spaces."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(name.casefold().split())[:255]
+
+
+def index_character_name(character: EveCharacter):
+    """Add or update the normalized name of a character."""
+    NormalizedCharacterName.objects.update_or_create(
+        character_id=character.pk,
+        defaults={"normalized_name": normalize_account_name(character.character_name)},
+    )
+
+
+def rebuild_name_index() -> tuple:
+    """
+    Rebuild the normalized names of all characters and UnknownAccounts.
+
+    :return: number of indexed characters and UnknownAccounts
+    """
+    NormalizedCharacterName.objects.all().delete()
+    characters = EveCharacter.objects.values_list("pk", "character_name")
+    index = [
+        NormalizedCharacterName(
+            character_id=pk, normalized_name=normalize_account_name(name)
+        )
+        for pk, name in characters.iterator(chunk_size=PAPSTATS_BULK_BATCH_SIZE)
+    ]
+    NormalizedCharacterName.objects.bulk_create(
+        index, batch_size=PAPSTATS_BULK_BATCH_SIZE
+    )
+
+    unknown_accounts = list(UnknownAccount.objects.only("pk", "account_name"))
+    for unknown_account in unknown_accounts:
+        unknown_account.normalized_name = normalize_account_name(
+            unknown_account.account_name
+        )
+    UnknownAccount.objects.bulk_update(
+        unknown_accounts, ["normalized_name"], batch_size=PAPSTATS_BULK_BATCH_SIZE
+    )
+    return len(index), len(unknown_accounts)
+
+
+def get_known_corporations(corporation_ids) -> set:
+    """Returns those of the given corporation ids which are known to Auth."""
+    known = set()
+    for batch in batched(list(set(corporation_ids))):
+        known.update(
+            EveCorporationInfo.objects.filter(corporation_id__in=batch).values_list(
+                "corporation_id", flat=True
+            )
+        )
+    return known
+
+
+def get_owned_characters(character_names: list) -> dict:
+    """
+    Returns the owner and corporation of owned characters in known corporations.
+
+    :return: mapping of character name to (user_id, corporation_id)
+    """
+    owned = {}
+    for batch in batched(character_names):
+        owned.update(
+            (name, (user_id, corporation_id))
+            for name, user_id, corporation_id in EveCharacter.objects.filter(
+                character_name__in=batch, character_ownership__isnull=False
+            ).values_list(
+                "character_name", "character_ownership__user_id", "corporation_id"
+            )
+        )
+    known_corporations = get_known_corporations(
+        corporation_id for _, corporation_id in owned.values()
+    )
+    return {
+        name: account
+        for name, account in owned.items()
+        if account[1] in known_corporations
+    }
+
+
+def get_unique_matches(queryset, field: str, value_field: str, keys: list) -> dict:
+    """
+    Look up the values matching the given keys in a field.
+
+    :return: mapping of key to value, for keys which match exactly one value
+    """
+    matches = defaultdict(set)
+    for batch in batched(keys):
+        for key, value in queryset.filter(**{f"{field}__in": batch}).values_list(
+            field, value_field
+        ):
+            matches[key].add(value)
+    return {key: values.pop() for key, values in matches.items() if len(values) == 1}
+
+
+def resolve_normalized_names(names: list) -> tuple:
+    """
+    Resolve account names by their normalized name, as a secondary lookup.
+
+    A normalized name must match a single character or a single mapped user.
+
+    :return: mapping of account name to (user_id, corporation_id) of characters
+        and mapping of account name to the user_id of mapped UnknownAccounts
+    """
+    normalized = defaultdict(list)
+    for name in names:
+        key = normalize_account_name(name)
+        if key:
+            normalized[key].append(name)
+
+    character_names = get_unique_matches(
+        NormalizedCharacterName.objects.all(),
+        "normalized_name",
+        "character__character_name",
+        list(normalized),
+    )
+    # Characters named exactly like an account have been looked up already
+    owned = get_owned_characters(list(set(character_names.values()).difference(names)))
+    accounts = {
+        name: owned[character_name]
+        for key, character_name in character_names.items()
+        if character_name in owned
+        for name in normalized[key]
+    }
+
+    remaining = [key for key in normalized if normalized[key][0] not in accounts]
+    mapped_users = get_unique_matches(
+        UnknownAccount.objects.filter(user_id__isnull=False),
+        "normalized_name",
+        "user_id",
+        remaining,
+    )
+    mapped = {
+        name: user_id
+        for key, user_id in mapped_users.items()
+        for name in normalized[key]
+    }
+
+    if accounts or mapped:
+        logger.debug(
+            f"Resolved {len(accounts) + len(mapped)} accounts by normalized name."
+        )
+    return accounts, mapped
+
+
+def resolve_accounts(names, create_unknown: bool = True) -> dict:
+    """
+    Resolve IMP account names to users with a few bulk queries.
+
+    A name resolves to the owner of the character with that name and that
+    character's corporation. Other names fall back to the user an UnknownAccount
+    is mapped to and that user's main corporation. Names which still can not be
+    resolved are matched the same way by their normalized name, which ignores
+    case, whitespace and diacritics. UnknownAccounts are created for names which
+    can not be resolved yet, so they can be mapped later.
+    Only corporations known to Auth are counted.
+
+    :param names: account names, may contain duplicates
+    :param create_unknown: create UnknownAccounts for names which can not be resolved
+    :return: mapping of account name to (user_id, corporation_id)
+        for every name that could be resolved
+    """
+    names = list({name for name in names if name})
+
+    accounts = get_owned_characters(names)
+
+    unresolved = [name for name in names if name not in accounts]
+    mapped = {}
+    for batch in batched(unresolved):
+        mapped.update(
+            UnknownAccount.objects.filter(
+                account_name__in=batch, user_id__isnull=False
+            ).values_list("account_name", "user_id")
+        )
+
+    normalized_accounts, normalized_mapped = resolve_normalized_names(
+        [name for name in unresolved if name not in mapped]
+    )
+    accounts.update(normalized_accounts)
+    mapped.update(normalized_mapped)
+
+    if create_unknown:
+        UnknownAccount.objects.bulk_create(
+            [
+                UnknownAccount(
+                    account_name=name, normalized_name=normalize_account_name(name)
+                )
+                for name in unresolved
+                if name not in accounts and name not in mapped
+            ],
+            batch_size=PAPSTATS_BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    main_corporations = {}
+    for batch in batched(list(set(mapped.values()))):
+        main_corporations.update(
+            User.objects.filter(
+                pk__in=batch, profile__main_character__isnull=False
+            ).values_list("pk", "profile__main_character__corporation_id")
+        )
+    known_corporations = get_known_corporations(main_corporations.values())
+    for name, user_id in mapped.items():
+        corporation_id = main_corporations.get(user_id)
+        if corporation_id in known_corporations:
+            accounts[name] = (user_id, corporation_id)
+
+    return accounts
@@ -1,5 +1,14 @@
 """Admin site."""
 
-# from django.contrib import admin
+# Django
+from django.contrib import admin
 
-# Register your models for the admin site here.
+# Pap Stats
+from papstats.models import UnknownAccount
+
+
+@admin.register(UnknownAccount)
+class UnknownAccountAdmin(admin.ModelAdmin):
+    list_display = ("account_name", "user_id")
+    list_editable = ("user_id",)
+    search_fields = ("account_name",)
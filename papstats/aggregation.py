@@ -0,0 +1,375 @@
+"""Set-based aggregation of AFAT data."""
+
+# Standard Library
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Third Party
+from afat.models import Fat, FatLink, FleetType
+
+# Django
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils.timezone import make_aware
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.app_settings import PAPSTATS_INGESTION_CHUNK_SIZE
+from papstats.models import AggregationWatermark, MonthlyCreatorStats
+from papstats.utils import (
+    get_aggregated_months,
+    get_fence_source,
+    get_monthly_fleet_types,
+)
+
+logger = get_extension_logger(__name__)
+
+UNKNOWN_FLEET_TYPE = "Unknown"
+
+# Lookups from a Fat to the owner of its character and that owner's main
+FAT_USER = "character__character_ownership__user_id"
+FAT_MAIN = "character__character_ownership__user__profile__main_character"
+
+
+def get_month_bounds(month: int, year: int):
+    """Returns the start (inclusive) and end (exclusive) datetimes of a month."""
+    start_date = make_aware(datetime(year, month, 1))
+    end_date = make_aware(
+        datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+    )
+    return start_date, end_date
+
+
+def get_day_bounds(day: int, month: int, year: int):
+    """Returns the start (inclusive) and end (exclusive) datetimes of a day."""
+    start_date = make_aware(datetime(year, month, day))
+    return start_date, start_date + timedelta(days=1)
+
+
+def get_afat_fleet_types(month: int, year: int, names=None) -> dict:
+    """
+    Make sure the AFAT fleet types for a month exist
+    and return them as a mapping of name to MonthlyFleetType id.
+
+    :param names: only create the fleet types these names resolve to,
+        all AFAT fleet types by default
+    """
+    afat_names = set(FleetType.objects.values_list("name", flat=True))
+    if names is None:
+        needed = afat_names | {UNKNOWN_FLEET_TYPE}
+    else:
+        needed = afat_names & set(names)
+        if set(names) - afat_names:
+            needed.add(UNKNOWN_FLEET_TYPE)
+    return get_monthly_fleet_types(needed, "afat", month, year)
+
+
+def count_fats_by_month(fats) -> dict:
+    """
+    Count fats per month of their fatlink, user, main corporation and fleet type.
+
+    Only fats whose owner has a main character in ``STATS_ALLIANCE_ID`` are counted.
+    All months are computed by a single grouped query.
+
+    :param fats: Fat queryset to count
+    :return: mapping of (year, month) to a mapping of
+        (user_id, corporation_id, fleet type name) to total fats
+    """
+    rows = (
+        fats.filter(**{f"{FAT_MAIN}__alliance_id": settings.STATS_ALLIANCE_ID})
+        .values_list(
+            ExtractYear("fatlink__created"),
+            ExtractMonth("fatlink__created"),
+            FAT_USER,
+            f"{FAT_MAIN}__corporation_id",
+            "fatlink__fleet_type",
+        )
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+
+    totals = defaultdict(dict)
+    for year, month, user_id, corporation_id, fleet_type_name, total in rows.iterator(
+        chunk_size=PAPSTATS_INGESTION_CHUNK_SIZE
+    ):
+        totals[(year, month)][(user_id, corporation_id, fleet_type_name)] = total
+
+    return totals
+
+
+def count_fatlinks_by_month(fatlinks) -> dict:
+    """
+    Count fatlinks per month, creator and fleet type.
+
+    :param fatlinks: FatLink queryset to count
+    :return: mapping of (year, month) to a mapping of
+        (creator_id, fleet type name) to total fatlinks
+    """
+    rows = (
+        fatlinks.values_list(
+            ExtractYear("created"), ExtractMonth("created"), "creator_id", "fleet_type"
+        )
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+
+    totals = defaultdict(dict)
+    for year, month, creator_id, fleet_type_name, total in rows.iterator(
+        chunk_size=PAPSTATS_INGESTION_CHUNK_SIZE
+    ):
+        totals[(year, month)][(creator_id, fleet_type_name)] = total
+
+    return totals
+
+
+def get_afat_fats(
+    start_date: datetime,
+    end_date: datetime,
+    max_fat_id: int = None,
+    min_fat_id: int = None,
+):
+    """
+    Returns the fats of fatlinks created in a date range.
+
+    :param max_fat_id: only include fats up to this id
+    :param min_fat_id: only include fats after this id
+    """
+    fats = Fat.objects.filter(
+        fatlink__created__gte=start_date, fatlink__created__lt=end_date
+    )
+    if max_fat_id is not None:
+        fats = fats.filter(id__lte=max_fat_id)
+    if min_fat_id is not None:
+        fats = fats.filter(id__gt=min_fat_id)
+    return fats
+
+
+def aggregate_afat_fats(
+    start_date: datetime,
+    end_date: datetime,
+    max_fat_id: int = None,
+    min_fat_id: int = None,
+) -> dict:
+    """
+    Count the fats of fatlinks created in a date range
+    per month, user, main corporation and fleet type.
+
+    :param max_fat_id: only count fats up to this id
+    :param min_fat_id: only count fats after this id
+    :return: mapping of (year, month) to a mapping of
+        (user_id, corporation_id, fleet type name) to total fats
+    """
+    return count_fats_by_month(
+        get_afat_fats(start_date, end_date, max_fat_id, min_fat_id)
+    )
+
+
+def count_skipped_fats(fats) -> tuple:
+    """
+    Count the fats which are not aggregated, by reason, with a single query.
+
+    :param fats: Fat queryset to check
+    :return: number of fats scanned and a mapping of skip reason to fats skipped
+    """
+    has_ownership = Q(character__character_ownership__isnull=False)
+    has_main = Q(**{f"{FAT_MAIN}__isnull": False})
+    counts = fats.aggregate(
+        scanned=Count("id"),
+        no_ownership=Count("id", filter=~has_ownership),
+        no_main=Count("id", filter=has_ownership & ~has_main),
+        wrong_alliance=Count(
+            "id",
+            filter=has_main
+            & ~Q(**{f"{FAT_MAIN}__alliance_id": settings.STATS_ALLIANCE_ID}),
+        ),
+    )
+    scanned = counts.pop("scanned")
+    return scanned, counts
+
+
+def count_unknown_fleet_types(month_totals: dict, fleet_types: dict) -> int:
+    """
+    Count the fats or fatlinks of a month's totals with a fleet type name
+    that is not one of the month's fleet types. They are counted as 'Unknown'.
+
+    :param month_totals: fat or fatlink totals keyed by tuples ending with the
+        fleet type name
+    """
+    return sum(
+        total
+        for key, total in month_totals.items()
+        if key[-1] and key[-1] not in fleet_types
+    )
+
+
+def aggregate_afat_fatlinks(
+    start_date: datetime,
+    end_date: datetime,
+    max_fatlink_id: int = None,
+    min_fatlink_id: int = None,
+) -> dict:
+    """
+    Count the fatlinks created in a date range per creator, month and fleet type.
+
+    :param max_fatlink_id: only count fatlinks up to this id
+    :param min_fatlink_id: only count fatlinks after this id
+    :return: mapping of (year, month) to a mapping of
+        (creator_id, fleet type name) to total fatlinks
+    """
+    fatlinks = FatLink.objects.filter(created__gte=start_date, created__lt=end_date)
+    if max_fatlink_id is not None:
+        fatlinks = fatlinks.filter(id__lte=max_fatlink_id)
+    if min_fatlink_id is not None:
+        fatlinks = fatlinks.filter(id__gt=min_fatlink_id)
+
+    return count_fatlinks_by_month(fatlinks)
+
+
+def resolve_fat_totals(month_totals: dict, fleet_types: dict) -> dict:
+    """
+    Replace the fleet type names of a month's fat totals with MonthlyFleetType ids.
+
+    :return: mapping of (user_id, corporation_id, fleet_type_id) to total fats
+    """
+    totals = defaultdict(int)
+    for (user_id, corporation_id, name), total in month_totals.items():
+        fleet_type_id = resolve_fleet_type(fleet_types, name, total)
+        totals[(user_id, corporation_id, fleet_type_id)] += total
+    return totals
+
+
+def resolve_fleet_type(fleet_types: dict, name: str, total: int = 1) -> int:
+    """
+    Returns the MonthlyFleetType id for an AFAT fleet type name,
+    falling back to 'Unknown' for empty or unknown names.
+    """
+    if name in fleet_types:
+        return fleet_types[name]
+    if name:
+        logger.warning(
+            f"Fleet type '{name}' not found in MonthlyFleetType, counting {total} as 'Unknown'."
+        )
+    return fleet_types[UNKNOWN_FLEET_TYPE]
+
+
+def corp_totals_from_user_totals(user_totals: dict) -> dict:
+    """
+    Roll user totals up to corporation totals.
+
+    :return: mapping of (corporation_id, fleet_type_id) to total fats
+    """
+    totals = defaultdict(int)
+    for (_, corporation_id, fleet_type_id), total in user_totals.items():
+        totals[(corporation_id, fleet_type_id)] += total
+    return totals
+
+
+def lock_watermark(source: str):
+    """
+    Lock the incremental aggregation watermark of a source until the end of the
+    current transaction.
+
+    :return: the watermark or None if incremental aggregation has not been started
+    """
+    return (
+        AggregationWatermark.objects.select_for_update().filter(source=source).first()
+    )
+
+
+def get_watermark_id(source: str):
+    """Returns the last id of a watermark without locking it, or None if there is none."""
+    return (
+        AggregationWatermark.objects.filter(source=source)
+        .values_list("last_id", flat=True)
+        .first()
+    )
+
+
+def set_month_fence(source: str, month: int, year: int, last_id: int):
+    """
+    Store the last AFAT row of a source counted by the full aggregation of a month.
+
+    Live deltas of rows up to the fence are already included in the month's stats.
+    The fats fence also marks the month as aggregated, see ``get_aggregated_months``.
+    """
+    AggregationWatermark.objects.update_or_create(
+        source=get_fence_source(source, month, year), defaults={"last_id": last_id}
+    )
+
+
+def claim_month_fence(source: str, month: int, year: int, last_id: int) -> bool:
+    """
+    Create the fence of a month, see ``set_month_fence``, unless it exists.
+
+    A transaction creating the same fence waits for the first one to finish,
+    so only one of two concurrent aggregations of a month claims it.
+
+    :return: whether the fence has been created
+    """
+    try:
+        with transaction.atomic():
+            AggregationWatermark.objects.create(
+                source=get_fence_source(source, month, year), last_id=last_id
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def get_month_fences(source: str, months) -> dict:
+    """
+    Returns the fences of a source for months, see ``set_month_fence``.
+
+    :return: mapping of (year, month) to the last counted id, for months with a fence
+    """
+    sources = {
+        get_fence_source(source, month, year): (year, month) for year, month in months
+    }
+    return {
+        sources[fence_source]: last_id
+        for fence_source, last_id in AggregationWatermark.objects.filter(
+            source__in=sources
+        ).values_list("source", "last_id")
+    }
+
+
+def find_missing_months(months: list) -> dict:
+    """
+    Find the months with AFAT data which have not been aggregated yet.
+
+    A month misses its AFAT stats until its full aggregation wrote the fats fence,
+    creator stats alone do not count.
+
+    :param months: (year, month) tuples to check
+    :return: mapping of source ('afat', 'creator') to the (year, month) tuples
+        missing for it, in the order given
+    """
+    if not months:
+        return {"afat": [], "creator": []}
+
+    start_date, _ = get_month_bounds(months[0][1], months[0][0])
+    _, end_date = get_month_bounds(months[-1][1], months[-1][0])
+    years = {year for year, _ in months}
+
+    with_data = set(
+        FatLink.objects.filter(created__gte=start_date, created__lt=end_date)
+        .values_list(ExtractYear("created"), ExtractMonth("created"))
+        .distinct()
+    )
+    aggregated = get_aggregated_months(months)
+    with_creator_stats = set(
+        MonthlyCreatorStats.objects.filter(year__in=years)
+        .values_list("year", "month")
+        .distinct()
+    )
+
+    return {
+        "afat": [ym for ym in months if ym in with_data and ym not in aggregated],
+        "creator": [
+            ym for ym in months if ym in with_data and ym not in with_creator_stats
+        ],
+    }
@@ -2,6 +2,52 @@
 
 # Django
 from django.apps import apps
+from django.conf import settings
+
+# Number of rows written per query by the bulk stats writer
+PAPSTATS_BULK_BATCH_SIZE = getattr(settings, "PAPSTATS_BULK_BATCH_SIZE", 500)
+
+# Number of rows fetched at a time when streaming AFAT data during aggregation
+PAPSTATS_INGESTION_CHUNK_SIZE = getattr(settings, "PAPSTATS_INGESTION_CHUNK_SIZE", 2000)
+
+# Split the monthly AFAT aggregation into one task per day (needs a Celery result backend)
+PAPSTATS_SHARDED_AGGREGATION = getattr(settings, "PAPSTATS_SHARDED_AGGREGATION", False)
+
+# Number of days aggregation runs are kept in the run ledger
+PAPSTATS_RUN_LEDGER_DAYS = getattr(settings, "PAPSTATS_RUN_LEDGER_DAYS", 90)
+
+# Number of lines of an uploaded CSV stored per staging chunk
+PAPSTATS_CSV_CHUNK_LINES = getattr(settings, "PAPSTATS_CSV_CHUNK_LINES", 1000)
+
+# Split large CSV imports into parts parsed by parallel tasks (needs a Celery result backend)
+PAPSTATS_PARALLEL_CSV_IMPORT = getattr(settings, "PAPSTATS_PARALLEL_CSV_IMPORT", False)
+
+# Number of CSV lines parsed per task by parallel CSV imports
+PAPSTATS_CSV_TASK_LINES = getattr(settings, "PAPSTATS_CSV_TASK_LINES", 20000)
+
+# Apply new and deleted AFAT fats and fatlinks to the stats as they happen
+PAPSTATS_LIVE_STATS = getattr(settings, "PAPSTATS_LIVE_STATS", False)
+
+# Seconds live stat changes are buffered before they are written
+PAPSTATS_LIVE_FLUSH_DELAY = getattr(settings, "PAPSTATS_LIVE_FLUSH_DELAY", 10)
+
+# Cache rendered charts, invalidated when the stats of a month they show change
+PAPSTATS_CHART_CACHE = getattr(settings, "PAPSTATS_CHART_CACHE", True)
+
+# Django cache shared by all workers for rendered charts, e.g. a file based cache
+PAPSTATS_CHART_CACHE_ALIAS = getattr(settings, "PAPSTATS_CHART_CACHE_ALIAS", "default")
+
+# Seconds rendered charts are kept in the shared cache, which also bounds how long
+# they show outdated corporation memberships
+PAPSTATS_CHART_CACHE_TIMEOUT = getattr(settings, "PAPSTATS_CHART_CACHE_TIMEOUT", 86400)
+
+# Bytes of rendered charts kept in the memory of each process
+PAPSTATS_CHART_CACHE_MEMORY = getattr(
+    settings, "PAPSTATS_CHART_CACHE_MEMORY", 32 * 1024 * 1024
+)
+
+# Render the charts of a month in a Celery task after it is aggregated or imported
+PAPSTATS_PRERENDER_CHARTS = getattr(settings, "PAPSTATS_PRERENDER_CHARTS", True)
 
 
 def corpstats_active():
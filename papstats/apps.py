@@ -10,3 +10,7 @@ class ExampleConfig(AppConfig):
     name = "papstats"
     label = "papstats"
     verbose_name = _(f"Pap Stats v{__version__}")
+
+    def ready(self):
+        # Pap Stats
+        import papstats.signals  # noqa: F401
@@ -0,0 +1,365 @@
+"""Synthetic data generator and benchmarks for the ingestion tasks."""
+
+# Standard Library
+import calendar
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+
+# Third Party
+from afat.models import Fat, FatLink, FleetType
+
+# Django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+# Alliance Auth
+from allianceauth.authentication.models import CharacterOwnership, UserProfile
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.aggregation import get_month_bounds, set_month_fence
+from papstats.app_settings import PAPSTATS_CSV_CHUNK_LINES, PAPSTATS_LIVE_STATS
+from papstats.models import AggregationWatermark, CSVUpload
+from papstats.staging import get_chunk_ranges, stage_csv
+from papstats.tasks import (
+    aggregate_afat_shard_task,
+    merge_afat_shards_task,
+    merge_csv_parts_task,
+    process_afat_data_task,
+    process_afat_incremental_task,
+    process_creator_stats,
+    process_csv_task,
+    read_csv_part_task,
+)
+from papstats.utils import (
+    FATLINKS_WATERMARK,
+    FATS_WATERMARK,
+    get_aggregated_months,
+)
+
+logger = get_extension_logger(__name__)
+
+# Synthetic ids start far above the ids of real EVE entities
+ID_OFFSET = 2_100_000_000
+BATCH_SIZE = 2000
+
+DEFAULT_SCALE = {
+    "corporations": 50,
+    "users": 5000,
+    "alts_per_user": 2,
+    "fleet_types": 8,
+    "fatlinks": 6000,
+    "fats": 300_000,
+    "unknown_accounts": 100,
+}
+
+# Share of the generated fats and fatlinks left to the incremental aggregation
+INCREMENTAL_SHARE = 0.1
+
+
+def generate_auth_data(
+    rng: random.Random, corporations: int, users: int, alts_per_user: int
+) -> dict:
+    """
+    Create corporations, users with a main and alts, their ownerships and profiles.
+
+    All mains are in ``STATS_ALLIANCE_ID``, alts are spread over random corporations.
+
+    :return: mapping of user id to the ids of the user's characters, main first
+    """
+    alliance_id = settings.STATS_ALLIANCE_ID
+    corporation_ids = [ID_OFFSET + idx for idx in range(corporations)]
+    EveCorporationInfo.objects.bulk_create(
+        [
+            EveCorporationInfo(
+                corporation_id=corporation_id,
+                corporation_name=f"Benchmark Corporation {corporation_id}",
+                corporation_ticker=f"B{idx}"[:5],
+                member_count=0,
+            )
+            for idx, corporation_id in enumerate(corporation_ids)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    user_objs = User.objects.bulk_create(
+        [User(username=f"benchmark_{idx}") for idx in range(users)],
+        batch_size=BATCH_SIZE,
+    )
+    if user_objs and user_objs[0].pk is None:
+        user_objs = list(
+            User.objects.filter(username__startswith="benchmark_").order_by("pk")
+        )
+
+    characters = []
+    character_id = ID_OFFSET
+    for user in user_objs:
+        for alt in range(alts_per_user + 1):
+            corporation_id = rng.choice(corporation_ids)
+            character_id += 1
+            characters.append(
+                EveCharacter(
+                    character_id=character_id,
+                    character_name=f"Benchmark {user.username} {alt}",
+                    corporation_id=corporation_id,
+                    corporation_name=f"Benchmark Corporation {corporation_id}",
+                    corporation_ticker="BENCH",
+                    alliance_id=alliance_id,
+                    alliance_name="Benchmark Alliance",
+                )
+            )
+    EveCharacter.objects.bulk_create(characters, batch_size=BATCH_SIZE)
+    character_pks = dict(
+        EveCharacter.objects.filter(character_id__gt=ID_OFFSET).values_list(
+            "character_id", "pk"
+        )
+    )
+
+    characters_per_user = {}
+    ownerships = []
+    profiles = []
+    per_user = alts_per_user + 1
+    for idx, user in enumerate(user_objs):
+        pks = [
+            character_pks[character.character_id]
+            for character in characters[idx * per_user : (idx + 1) * per_user]
+        ]
+        characters_per_user[user.pk] = pks
+        ownerships += [
+            CharacterOwnership(
+                character_id=pk, user_id=user.pk, owner_hash=f"benchmark_{pk}"
+            )
+            for pk in pks
+        ]
+        profiles.append(UserProfile(user_id=user.pk, main_character_id=pks[0]))
+
+    CharacterOwnership.objects.bulk_create(ownerships, batch_size=BATCH_SIZE)
+    UserProfile.objects.bulk_create(profiles, batch_size=BATCH_SIZE)
+    return characters_per_user
+
+
+def generate_afat_data(
+    rng: random.Random,
+    month: int,
+    year: int,
+    characters_per_user: dict,
+    fleet_types: int,
+    fatlinks: int,
+    fats: int,
+) -> list:
+    """
+    Create AFAT fleet types, and fatlinks with their fats spread over a month.
+
+    Some fatlinks have no fleet type, like real data.
+
+    :return: the names of the fleet types
+    """
+    names = [f"Benchmark Fleet {idx}" for idx in range(fleet_types)]
+    FleetType.objects.bulk_create([FleetType(name=name) for name in names])
+    link_names = names + [""]
+
+    start_date, end_date = get_month_bounds(month, year)
+    seconds = int((end_date - start_date).total_seconds())
+    creators = list(characters_per_user)[: max(1, len(characters_per_user) // 50)]
+    FatLink.objects.bulk_create(
+        [
+            FatLink(
+                created=start_date + timedelta(seconds=rng.randrange(seconds)),
+                fleet=f"Benchmark Fleet {idx}",
+                hash=f"benchmark_{year}_{month}_{idx}",
+                creator_id=rng.choice(creators),
+                fleet_type=rng.choice(link_names),
+            )
+            for idx in range(fatlinks)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    fatlink_ids = list(
+        FatLink.objects.filter(hash__startswith=f"benchmark_{year}_{month}_")
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+    all_characters = [pk for pks in characters_per_user.values() for pk in pks]
+    per_fatlink = min(len(all_characters), max(1, fats // max(1, fatlinks)))
+    batch = []
+    for fatlink_id in fatlink_ids:
+        for character_id in rng.sample(all_characters, per_fatlink):
+            batch.append(
+                Fat(
+                    character_id=character_id,
+                    fatlink_id=fatlink_id,
+                    system="Jita",
+                    shiptype="Rifter",
+                )
+            )
+        if len(batch) >= BATCH_SIZE:
+            Fat.objects.bulk_create(batch)
+            batch = []
+    Fat.objects.bulk_create(batch)
+    return names
+
+
+def generate_imp_csv(
+    rng: random.Random, characters_per_user: dict, columns: list, unknown_accounts: int
+) -> list:
+    """
+    Generate the lines of an IMP CSV export with a row per main and some unknown accounts.
+    """
+    mains = EveCharacter.objects.filter(
+        pk__in=[pks[0] for pks in characters_per_user.values()]
+    ).values_list("character_name", flat=True)
+    accounts = list(mains) + [
+        f"Benchmark Unknown {idx}" for idx in range(unknown_accounts)
+    ]
+
+    lines = [",".join(["Account"] + columns)]
+    for account in accounts:
+        lines.append(",".join([account] + [str(rng.randrange(0, 10)) for _ in columns]))
+    return lines
+
+
+def set_incremental_watermarks(model, source: str, first_id: int):
+    """
+    Put the watermark of a source before the last generated rows of a model,
+    so the full aggregation leaves them to the incremental aggregation.
+    """
+    last_id = model.objects.aggregate(Max("id"))["id__max"] or 0
+    cut = last_id - int((last_id - first_id) * INCREMENTAL_SHARE)
+    AggregationWatermark.objects.create(source=source, last_id=cut)
+
+
+def run_sharded_aggregation(month: int, year: int):
+    """Run the day shards of a month and their merge in-process, like the chord."""
+    max_fat_id = AggregationWatermark.objects.get(source=FATS_WATERMARK).last_id
+    days = calendar.monthrange(year, month)[1]
+    shard_results = [
+        aggregate_afat_shard_task(day, month, year, max_fat_id)
+        for day in range(1, days + 1)
+    ]
+    merge_afat_shards_task(shard_results, month, year, max_fat_id, rebuild=True)
+
+
+def run_parallel_csv_import(upload_id: int, column_mapping: dict):
+    """Parse every staged chunk of an upload as a part and merge them in-process."""
+    upload = CSVUpload.objects.get(pk=upload_id)
+    part_results = [
+        read_csv_part_task(upload_id, chunk_range, column_mapping)
+        for chunk_range in get_chunk_ranges(upload, PAPSTATS_CSV_CHUNK_LINES)
+    ]
+    merge_csv_parts_task(part_results, upload_id, column_mapping)
+
+
+def measure(func, *args, **kwargs) -> dict:
+    """Run a function and return its wall time, query count and peak memory."""
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            func(*args, **kwargs)
+            wall_time = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_time_seconds": round(wall_time, 4),
+        "queries": len(queries),
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def run_benchmark(month: int, year: int, seed: int = 0, **scale) -> dict:
+    """
+    Generate synthetic data and measure the AFAT, creator and IMP ingestion paths.
+
+    The full and sharded AFAT aggregation count the fats up to the incremental
+    watermarks, which are put before the last ``INCREMENTAL_SHARE`` of the
+    generated data, and the incremental aggregation applies the rest. The IMP
+    CSV is imported into the month and, parsed in parts, into the next month.
+    Sharded and parallel parts run in-process one after another.
+
+    Everything runs in a transaction which is rolled back at the end,
+    so the database is left as it was. Use a development database though,
+    as the stats watermarks are replaced and locked while the benchmark runs.
+
+    :param scale: overrides of ``DEFAULT_SCALE``
+    :return: the scale and one result per ingestion path
+    """
+    scale = {**DEFAULT_SCALE, **scale}
+    rng = random.Random(seed)
+    results = {}
+
+    with transaction.atomic():
+        AggregationWatermark.objects.all().delete()
+        first_fat_id = Fat.objects.aggregate(Max("id"))["id__max"] or 0
+        first_fatlink_id = FatLink.objects.aggregate(Max("id"))["id__max"] or 0
+
+        started = time.perf_counter()
+        characters_per_user = generate_auth_data(
+            rng, scale["corporations"], scale["users"], scale["alts_per_user"]
+        )
+        names = generate_afat_data(
+            rng,
+            month,
+            year,
+            characters_per_user,
+            scale["fleet_types"],
+            scale["fatlinks"],
+            scale["fats"],
+        )
+        csv_data = generate_imp_csv(
+            rng, characters_per_user, names, scale["unknown_accounts"]
+        )
+        generation_time = time.perf_counter() - started
+        logger.info(f"Generated benchmark data in {generation_time:.1f}s.")
+        set_incremental_watermarks(Fat, FATS_WATERMARK, first_fat_id)
+        set_incremental_watermarks(FatLink, FATLINKS_WATERMARK, first_fatlink_id)
+
+        results["process_afat_data_task"] = measure(
+            process_afat_data_task, month, year, rebuild=True, sharded=False
+        )
+        results["process_creator_stats"] = measure(process_creator_stats, month, year)
+        results["sharded_afat_aggregation"] = measure(
+            run_sharded_aggregation, month, year
+        )
+        if PAPSTATS_LIVE_STATS:
+            logger.warning(
+                "Live stats are enabled, skipping the incremental aggregation."
+            )
+        else:
+            # Otherwise the incremental aggregation aggregates the current month
+            today = now()
+            if not get_aggregated_months({(today.year, today.month)}):
+                set_month_fence(FATS_WATERMARK, today.month, today.year, 0)
+            results["process_afat_incremental_task"] = measure(
+                process_afat_incremental_task
+            )
+
+        column_mapping = {name: name for name in names}
+        upload = stage_csv(csv_data, month, year)
+        results["process_csv_task"] = measure(
+            process_csv_task, upload.id, column_mapping, parallel=False
+        )
+        upload = stage_csv(csv_data, month % 12 + 1, year + month // 12)
+        results["parallel_csv_import"] = measure(
+            run_parallel_csv_import, upload.id, column_mapping
+        )
+
+        transaction.set_rollback(True)
+
+    return {
+        "month": month,
+        "year": year,
+        "seed": seed,
+        "scale": scale,
+        "generation_time_seconds": round(generation_time, 4),
+        "results": results,
+    }
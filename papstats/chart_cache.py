@@ -0,0 +1,184 @@
+"""Two-tier cache of rendered charts, keyed by per-month data versions."""
+
+# Standard Library
+import threading
+import time
+from collections import OrderedDict
+
+# Django
+from django.core.cache import caches
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.app_settings import (
+    PAPSTATS_CHART_CACHE,
+    PAPSTATS_CHART_CACHE_ALIAS,
+    PAPSTATS_CHART_CACHE_MEMORY,
+    PAPSTATS_CHART_CACHE_TIMEOUT,
+)
+
+logger = get_extension_logger(__name__)
+
+# Number of months shown by the month over month charts, ending with the selected one
+CHART_MONTHS = 6
+
+
+class MemoryLRU:
+    """A thread-safe least recently used cache, evicting by the size of its values."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size: int):
+        if size > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+memory_cache = MemoryLRU(PAPSTATS_CHART_CACHE_MEMORY)
+
+
+def get_shared_cache():
+    return caches[PAPSTATS_CHART_CACHE_ALIAS]
+
+
+def get_chart_months(year: int, month: int) -> list:
+    """Returns the (year, month) of the months shown by the charts of a month."""
+    index = year * 12 + month - 1
+    return [
+        ((index - offset) // 12, (index - offset) % 12 + 1)
+        for offset in range(CHART_MONTHS - 1, -1, -1)
+    ]
+
+
+def get_dependent_months(year: int, month: int) -> list:
+    """Returns the (year, month) of the months whose charts show a month, newest first."""
+    index = year * 12 + month - 1
+    return [
+        ((index + offset) // 12, (index + offset) % 12 + 1)
+        for offset in range(CHART_MONTHS - 1, -1, -1)
+    ]
+
+
+def get_version_key(year: int, month: int) -> str:
+    return f"papstats:data_version:{year}:{month}"
+
+
+def get_data_versions(months: list) -> list:
+    """
+    Returns the data versions of months.
+
+    A version missing from the cache starts at the current time, so charts
+    cached with a lost version can never be served again.
+    """
+    cache = get_shared_cache()
+    keys = [get_version_key(year, month) for year, month in months]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_data_versions(months):
+    """
+    Bump the data versions of months, invalidating every chart showing them.
+
+    A new version is the current time rather than an increment, which is atomic
+    with every cache backend.
+
+    :param months: iterable of (year, month)
+    """
+    if not PAPSTATS_CHART_CACHE:
+        return
+    months = set(months)
+    version = time.time_ns()
+    get_shared_cache().set_many(
+        {get_version_key(year, month): version for year, month in months},
+        timeout=None,
+    )
+    logger.debug(f"Bumped the data versions of {sorted(months)}.")
+
+
+def get_charts_size(charts: dict) -> int:
+    return sum(len(value) for value in charts.values() if isinstance(value, str))
+
+
+def get_charts_key(view: str, entity, year: int, month: int) -> str:
+    """Returns the cache key of charts with the current data versions of their months."""
+    versions = get_data_versions(get_chart_months(year, month))
+    return (
+        f"papstats:charts:{view}:{entity}:{year}:{month}:"
+        f"{'-'.join(map(str, versions))}"
+    )
+
+
+def render_charts(view: str, entity, year: int, month: int, render) -> dict:
+    """
+    Render charts and store them in the shared cache.
+
+    The key is taken before rendering, so charts rendered while their stats
+    change are stored under the outdated versions and never served.
+    """
+    key = get_charts_key(view, entity, year, month)
+    started = time.perf_counter()
+    charts = render()
+    get_shared_cache().set(key, charts, timeout=PAPSTATS_CHART_CACHE_TIMEOUT)
+    logger.debug(
+        f"Rendered {view} charts of {entity} for {month}/{year} "
+        f"in {time.perf_counter() - started:.2f}s."
+    )
+    return charts
+
+
+def get_cached_charts(view: str, entity, year: int, month: int, render) -> dict:
+    """
+    Returns the rendered charts of a view, from the cache if possible.
+
+    Charts are looked up in the memory of the process first and in the shared
+    cache second. They are keyed by the data versions of all months they show.
+
+    :param view: name of the view
+    :param entity: id of the alliance or corporation the charts are for
+    :param render: callable returning the context of the rendered charts
+    """
+    if not PAPSTATS_CHART_CACHE:
+        return render()
+
+    key = get_charts_key(view, entity, year, month)
+    charts = memory_cache.get(key)
+    if charts is not None:
+        return charts
+
+    charts = get_shared_cache().get(key)
+    if charts is None:
+        charts = render_charts(view, entity, year, month, render)
+    memory_cache.set(key, charts, get_charts_size(charts))
+    return charts
@@ -0,0 +1,280 @@
+"""Data access for the stats views, with a fixed number of queries per page."""
+
+# Third Party
+import pandas as pd
+
+# Django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, Sum
+
+# Alliance Auth
+from allianceauth.authentication.models import UserProfile
+from allianceauth.eveonline.models import EveCorporationInfo
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.models import (
+    MonthlyCorpStats,
+    MonthlyCreatorStats,
+    MonthlyFleetType,
+    MonthlyUserStats,
+)
+
+logger = get_extension_logger(__name__)
+
+# Sources of the stats, as stored in MonthlyFleetType.source
+SOURCES = ("afat", "imp")
+
+
+def get_alliance_corporations(alliance_id: int) -> dict:
+    """
+    Returns the corporations of an alliance shown in the stats, ordered by ticker.
+
+    :return: mapping of corporation id to ticker
+    """
+    return dict(
+        EveCorporationInfo.objects.filter(alliance__alliance_id=alliance_id)
+        .exclude(corporation_id__in=settings.STATS_IGNORE_CORPS)
+        .order_by("corporation_ticker")
+        .values_list("corporation_id", "corporation_ticker")
+    )
+
+
+def get_main_counts(corporation_ids) -> dict:
+    """Returns the number of mains per corporation, in one grouped query."""
+    return dict(
+        UserProfile.objects.filter(main_character__corporation_id__in=corporation_ids)
+        .values_list("main_character__corporation_id")
+        .annotate(mains=Count("pk"))
+        .order_by()
+    )
+
+
+def get_fleet_type_names(month: int, year: int) -> dict:
+    """Returns the names of the fleet types of a month per source."""
+    names = {source: [] for source in SOURCES}
+    for source, name in (
+        MonthlyFleetType.objects.filter(month=month, year=year, source__in=SOURCES)
+        .order_by("pk")
+        .values_list("source", "name")
+    ):
+        names[source].append(name)
+    return names
+
+
+def get_corp_totals(corporation_ids, month: int, year: int) -> list:
+    """Returns (corporation id, source, fleet type name, total fats) of a month."""
+    return list(
+        MonthlyCorpStats.objects.filter(
+            corporation_id__in=corporation_ids, month=month, year=year
+        ).values_list(
+            "corporation_id", "fleet_type__source", "fleet_type__name", "total_fats"
+        )
+    )
+
+
+def get_chart_entities(month: int, year: int) -> tuple:
+    """
+    Returns the alliances and corporations with stats in a month.
+
+    :return: sorted alliance ids and the corporations, with their alliance
+    """
+    corporations = list(
+        EveCorporationInfo.objects.filter(
+            corporation_id__in=MonthlyCorpStats.objects.filter(
+                month=month, year=year
+            ).values("corporation_id")
+        )
+        .select_related("alliance")
+        .order_by("corporation_id")
+    )
+    alliance_ids = sorted(
+        {
+            corporation.alliance.alliance_id
+            for corporation in corporations
+            if corporation.alliance
+        }
+    )
+    return alliance_ids, corporations
+
+
+def get_alliance_data(alliance_id: int, month: int, year: int):
+    """
+    Collect the corporation totals of an alliance for a month.
+
+    :return: None without stats for the month, otherwise a dict with the
+        ``corporation_ids`` and ``tickers`` of the corporations in chart order,
+        the totals per ticker and fleet type name of each source (``afat`` and
+        ``imp``) and the totals per main of each source per ticker (``relative``)
+    """
+    corporations = get_alliance_corporations(alliance_id)
+    corp_totals = get_corp_totals(list(corporations), month, year)
+    if not corp_totals:
+        return None
+
+    fleet_types = get_fleet_type_names(month, year)
+    main_counts = get_main_counts(list(corporations))
+
+    tickers = list(corporations.values())
+    data = {
+        source: {ticker: dict.fromkeys(fleet_types[source], 0) for ticker in tickers}
+        for source in SOURCES
+    }
+    relative = {ticker: {"AFAT": 0, "IMP": 0} for ticker in tickers}
+    for corporation_id, source, name, total in corp_totals:
+        if source not in data:
+            continue
+        ticker = corporations[corporation_id]
+        data[source][ticker][name] = data[source][ticker].get(name, 0) + total
+        mains = main_counts.get(corporation_id, 0)
+        if mains > 0:
+            relative[ticker][source.upper()] += total / mains
+
+    logger.debug(
+        f"Collected {len(corp_totals)} corp stats of {len(tickers)} corporations "
+        f"for {month}/{year}."
+    )
+    return {
+        "corporation_ids": list(corporations),
+        "tickers": tickers,
+        **data,
+        "relative": relative,
+    }
+
+
+def get_corp_members(corporation_id: int) -> dict:
+    """
+    Returns the users with a main in a corporation, ordered by main name.
+
+    :return: mapping of user id to main character name
+    """
+    return dict(
+        UserProfile.objects.filter(main_character__corporation_id=corporation_id)
+        .order_by("main_character__character_name")
+        .values_list("user_id", "main_character__character_name")
+    )
+
+
+def get_user_totals(user_ids, month: int, year: int) -> list:
+    """Returns (user id, source, fleet type name, total fats) of a month."""
+    return list(
+        MonthlyUserStats.objects.filter(
+            user_id__in=user_ids, month=month, year=year
+        ).values_list("user_id", "fleet_type__source", "fleet_type__name", "total_fats")
+    )
+
+
+def get_user_source_totals(user_ids, month: int, year: int) -> dict:
+    """Returns the total fats of a month per user and source, in one grouped query."""
+    totals = {}
+    for row in (
+        MonthlyUserStats.objects.filter(user_id__in=user_ids, month=month, year=year)
+        .values("user_id", "fleet_type__source")
+        .annotate(total=Sum("total_fats"))
+        .order_by()
+    ):
+        totals[(row["user_id"], row["fleet_type__source"])] = row["total"]
+    return totals
+
+
+def get_corporation_data(corporation_id: int, month: int, year: int):
+    """
+    Collect the totals of the members of a corporation for a month.
+
+    :return: None without stats for the month, otherwise a dict with the main
+        ``names`` of the members in chart order, the totals per main name and
+        fleet type name of each source (``afat`` and ``imp``, with IMP fleet types
+        prefixed) and the ``raw_data`` rows of the AFAT and IMP total per main
+    """
+    members = get_corp_members(corporation_id)
+    user_totals = get_user_totals(list(members), month, year)
+    if not user_totals:
+        return None
+
+    fleet_types = get_fleet_type_names(month, year)
+    source_totals = get_user_source_totals(list(members), month, year)
+
+    names = list(members.values())
+    columns = {
+        "afat": fleet_types["afat"],
+        "imp": [f"IMP {name}" for name in fleet_types["imp"]],
+    }
+    data = {
+        source: {name: dict.fromkeys(columns[source], 0) for name in names}
+        for source in SOURCES
+    }
+    for user_id, source, fleet_type_name, total in user_totals:
+        if source not in data:
+            continue
+        column = fleet_type_name if source == "afat" else f"IMP {fleet_type_name}"
+        row = data[source][members[user_id]]
+        row[column] = row.get(column, 0) + total
+
+    raw_data = sorted(
+        (
+            {
+                "name": name,
+                "afat_total": source_totals.get((user_id, "afat"), 0),
+                "imp_total": source_totals.get((user_id, "imp"), 0),
+            }
+            for user_id, name in members.items()
+        ),
+        key=lambda row: row["name"],
+    )
+
+    logger.debug(
+        f"Collected {len(user_totals)} user stats of {len(names)} members "
+        f"for {month}/{year}."
+    )
+    return {"names": names, **data, "raw_data": raw_data}
+
+
+def get_creator_names(user_ids) -> dict:
+    """
+    Returns the display names of fleet creators: their main's name or username.
+
+    :return: mapping of user id to display name
+    """
+    return {
+        user_id: main_name or username
+        for user_id, username, main_name in User.objects.filter(
+            pk__in=user_ids
+        ).values_list("pk", "username", "profile__main_character__character_name")
+    }
+
+
+def get_fc_data(month: int, year: int):
+    """
+    Collect the fleets created per creator and fleet type of a month.
+
+    :return: None without stats for the month, otherwise a DataFrame of the
+        fleets created, indexed by creator display name and with a column
+        per fleet type name
+    """
+    creator_totals = list(
+        MonthlyCreatorStats.objects.filter(
+            month=month, year=year, fleet_type__source="afat"
+        ).values_list("creator_id", "fleet_type__name", "total_created")
+    )
+    if not creator_totals:
+        return None
+
+    names = get_creator_names({creator_id for creator_id, _, _ in creator_totals})
+    totals = pd.DataFrame(
+        creator_totals, columns=["creator_id", "fleet_type", "total_created"]
+    )
+    totals["creator"] = totals["creator_id"].map(
+        lambda creator_id: names.get(creator_id, str(creator_id))
+    )
+    return (
+        totals.pivot_table(
+            index="creator",
+            columns="fleet_type",
+            values="total_created",
+            aggfunc="sum",
+            fill_value=0,
+        )
+        .rename_axis(index=None, columns=None)
+        .sort_index()
+    )
@@ -0,0 +1,185 @@
+"""Content-hashed IMP imports, applied to the stats as deltas."""
+
+# Standard Library
+import hashlib
+from collections import Counter, defaultdict
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.accounts import batched
+from papstats.app_settings import PAPSTATS_BULK_BATCH_SIZE
+from papstats.models import (
+    IMPImportRow,
+    MonthlyCorpStats,
+    MonthlyUserStats,
+    PendingIMPRow,
+)
+
+logger = get_extension_logger(__name__)
+
+
+def hash_import_row(
+    account_name: str, fleet_type: str, user_id: int, corporation_id: int, total: int
+) -> str:
+    """Returns the content hash of an imported row."""
+    content = f"{account_name}|{fleet_type}|{user_id}|{corporation_id}|{total}"
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def get_import_rows(totals, accounts: dict) -> dict:
+    """
+    Build the rows of an import from the account totals of an upload.
+
+    :param totals: DataFrame of account, fleet_type and total
+    :param accounts: mapping of account name to (user_id, corporation_id)
+    :return: mapping of (account name, fleet type name) to
+        (user_id, corporation_id, total) for every resolved account
+    """
+    rows = {}
+    for account_name, fleet_type, total in totals.itertuples(index=False, name=None):
+        if account_name in accounts:
+            user_id, corporation_id = accounts[account_name]
+            rows[(account_name, fleet_type)] = (user_id, corporation_id, int(total))
+    return rows
+
+
+def has_imp_rows(month: int, year: int) -> bool:
+    """Returns True if a month has been imported with import rows."""
+    return IMPImportRow.objects.filter(month=month, year=year).exists()
+
+
+def has_imp_stats(month: int, year: int) -> bool:
+    """Returns True if IMP stats have been written for a month."""
+    lookup = {"month": month, "year": year, "fleet_type__source": "imp"}
+    return (
+        MonthlyUserStats.objects.filter(**lookup).exists()
+        or MonthlyCorpStats.objects.filter(**lookup).exists()
+    )
+
+
+def apply_import_rows(
+    month: int, year: int, rows: dict, account_names: list = None
+) -> tuple:
+    """
+    Replace the stored rows of a month's import and compute the stat deltas.
+
+    The rows of the previous import are locked and compared by their content hash.
+    Unchanged rows are kept as they are, the totals of changed and removed rows are
+    taken back and those of changed and new rows are added.
+    Must be called inside a transaction, which the deltas are written in as well.
+
+    :param rows: mapping of (account name, fleet type name) to
+        (user_id, corporation_id, total) of the new import
+    :param account_names: only replace the rows of these accounts,
+        all rows of the month by default
+    :return: Counter of deltas per (user_id, corporation_id, fleet type name),
+        Counter of deltas per (corporation_id, fleet type name)
+        and the number of unchanged rows
+    """
+    hashes = {key: hash_import_row(*key, *row) for key, row in rows.items()}
+    user_deltas = Counter()
+    corp_deltas = Counter()
+
+    previous = IMPImportRow.objects.select_for_update().filter(month=month, year=year)
+    if account_names is not None:
+        previous = previous.filter(account_name__in=account_names)
+    previous = previous.values_list(
+        "pk",
+        "account_name",
+        "fleet_type",
+        "user_id",
+        "corporation_id",
+        "total",
+        "content_hash",
+    )
+    unchanged = set()
+    stale = []
+    for row in previous:
+        pk, account_name, fleet_type, user_id, corporation_id, total, content_hash = row
+        key = (account_name, fleet_type)
+        if hashes.get(key) == content_hash:
+            unchanged.add(key)
+            continue
+        stale.append(pk)
+        user_deltas[(user_id, corporation_id, fleet_type)] -= total
+        corp_deltas[(corporation_id, fleet_type)] -= total
+
+    new_rows = []
+    for (account_name, fleet_type), (user_id, corporation_id, total) in rows.items():
+        if (account_name, fleet_type) in unchanged:
+            continue
+        user_deltas[(user_id, corporation_id, fleet_type)] += total
+        corp_deltas[(corporation_id, fleet_type)] += total
+        new_rows.append(
+            IMPImportRow(
+                account_name=account_name,
+                fleet_type=fleet_type,
+                month=month,
+                year=year,
+                user_id=user_id,
+                corporation_id=corporation_id,
+                total=total,
+                content_hash=hashes[(account_name, fleet_type)],
+            )
+        )
+
+    for batch in batched(stale):
+        IMPImportRow.objects.filter(pk__in=batch).delete()
+    IMPImportRow.objects.bulk_create(new_rows, batch_size=PAPSTATS_BULK_BATCH_SIZE)
+
+    logger.debug(
+        f"IMP import {month}/{year}: {len(unchanged)} rows unchanged, "
+        f"{len(stale)} replaced or removed, {len(new_rows)} written."
+    )
+    return user_deltas, corp_deltas, len(unchanged)
+
+
+def replace_pending_rows(month: int, year: int, totals, accounts: dict) -> int:
+    """
+    Replace the pending rows of a month with the totals of unresolved accounts.
+
+    :param totals: DataFrame of account, fleet_type and total
+    :param accounts: mapping of the resolved account names
+    :return: number of pending rows
+    """
+    pending = [
+        PendingIMPRow(
+            account_name=account_name,
+            fleet_type=fleet_type,
+            month=month,
+            year=year,
+            total=int(total),
+        )
+        for account_name, fleet_type, total in totals.itertuples(index=False, name=None)
+        if account_name not in accounts
+    ]
+    PendingIMPRow.objects.filter(month=month, year=year).delete()
+    PendingIMPRow.objects.bulk_create(pending, batch_size=PAPSTATS_BULK_BATCH_SIZE)
+    return len(pending)
+
+
+def pop_pending_rows(account_name: str, user_id: int, corporation_id: int) -> dict:
+    """
+    Take the pending rows of an account which has been resolved.
+
+    Must be called inside a transaction.
+
+    :return: mapping of (year, month) to import rows of the account, like the
+        ``rows`` of ``apply_import_rows``
+    """
+    pending = PendingIMPRow.objects.select_for_update().filter(
+        account_name=account_name
+    )
+    rows = defaultdict(dict)
+    for fleet_type, month, year, total in pending.values_list(
+        "fleet_type", "month", "year", "total"
+    ):
+        rows[(year, month)][(account_name, fleet_type)] = (
+            user_id,
+            corporation_id,
+            total,
+        )
+    pending.delete()
+    return rows
@@ -0,0 +1,95 @@
+"""Run ledger of the aggregation tasks."""
+
+# Standard Library
+import time
+from collections import Counter
+from datetime import timedelta
+
+# Django
+from django.db import connection
+from django.utils import timezone
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.app_settings import PAPSTATS_RUN_LEDGER_DAYS
+from papstats.models import AggregationRun
+
+logger = get_extension_logger(__name__)
+
+
+class RunCounters:
+    """Row counters of an aggregation run, or of a part of one run by another task."""
+
+    def __init__(self):
+        self.rows_scanned = 0
+        self.rows_written = 0
+        self.skipped = Counter()
+
+    def skip(self, reason: str, count: int = 1):
+        """Count ``count`` rows skipped for ``reason``."""
+        if count:
+            self.skipped[reason] += count
+
+
+class RunRecorder(RunCounters):
+    """
+    Records an aggregation run in the run ledger.
+
+    The run is stored as running when the block is entered and updated with its
+    counters, the number and duration of its queries and its outcome on exit.
+    Queries of runs started inside the block are included in its query stats.
+
+        with RunRecorder("afat", month, year) as run:
+            run.rows_scanned += scanned
+            run.skip("wrong_alliance", 3)
+    """
+
+    def __init__(self, kind: str, month: int = None, year: int = None):
+        super().__init__()
+        if kind not in dict(AggregationRun.KINDS):
+            raise ValueError(f"Unknown aggregation run kind '{kind}'")
+        self.kind = kind
+        self.month = month
+        self.year = year
+        self.query_count = 0
+        self.query_time = 0.0
+        self.run = None
+        self._wrapper = None
+
+    def __enter__(self):
+        AggregationRun.objects.filter(
+            started__lt=timezone.now() - timedelta(days=PAPSTATS_RUN_LEDGER_DAYS)
+        ).delete()
+        self.run = AggregationRun.objects.create(
+            kind=self.kind, month=self.month, year=self.year
+        )
+        self._wrapper = connection.execute_wrapper(self._record_query)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+
+        self.run.status = "failed" if exc_type else "succeeded"
+        self.run.finished = timezone.now()
+        self.run.rows_scanned = self.rows_scanned
+        self.run.rows_written = self.rows_written
+        self.run.skipped = dict(self.skipped)
+        self.run.query_count = self.query_count
+        self.run.query_time = round(self.query_time, 4)
+
+        if connection.needs_rollback:
+            # The run is rolled back with the transaction it failed in
+            logger.warning(f"Could not record failed {self.kind} run {self.run.pk}.")
+            return
+        self.run.save()
+
+    def _record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            self.query_time += time.perf_counter() - started
@@ -0,0 +1,208 @@
+"""
+Buffered live stat deltas from AFAT fats and fatlinks.
+
+Known limits: a fat is decremented for the user owning its character when it is
+deleted, so fats of characters which changed owner are not taken back from the
+previous owner. Changes of a fatlink's fleet type are not applied live. Rebuild the
+month with ``aggregate_stats --rebuild`` to pick them up.
+"""
+
+# Standard Library
+from collections import defaultdict
+
+# Third Party
+from afat.models import FatLink
+
+# Django
+from django.conf import settings
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter
+from allianceauth.services.hooks import get_extension_logger
+from allianceauth.utils.cache import get_redis_client
+
+# Pap Stats
+from papstats.aggregation import FAT_MAIN, FAT_USER
+from papstats.app_settings import PAPSTATS_LIVE_FLUSH_DELAY
+from papstats.models import MonthlyUserStats
+
+logger = get_extension_logger(__name__)
+
+# Redis hash of pending deltas and the key marking a scheduled flush
+LIVE_DELTAS_KEY = "papstats:live:deltas"
+LIVE_FLUSH_KEY = "papstats:live:flush"
+
+# Lookups from a character to its owner and the owner's main
+CHARACTER_USER = FAT_USER.removeprefix("character__")
+CHARACTER_MAIN = FAT_MAIN.removeprefix("character__")
+
+
+def get_fat_field(fat):
+    """
+    Returns the buffer field of the user stat a fat counts for,
+    or None if the fat does not count for the stats.
+    """
+    owner = (
+        EveCharacter.objects.filter(pk=fat.character_id)
+        .values_list(
+            CHARACTER_USER,
+            f"{CHARACTER_MAIN}__corporation_id",
+            f"{CHARACTER_MAIN}__alliance_id",
+        )
+        .first()
+    )
+    if owner is None or owner[2] != settings.STATS_ALLIANCE_ID:
+        return None
+
+    fatlink = (
+        FatLink.objects.filter(pk=fat.fatlink_id)
+        .values_list("created", "fleet_type")
+        .first()
+    )
+    if fatlink is None:
+        return None
+
+    user_id, corporation_id, _ = owner
+    created, fleet_type_name = fatlink
+    return (
+        f"fat|{fat.pk}|{created.year}|{created.month}|{user_id}|{corporation_id}|"
+        f"{fleet_type_name}"
+    )
+
+
+def get_fatlink_field(fatlink) -> str:
+    """Returns the buffer field of the creator stat a fatlink counts for."""
+    return (
+        f"fatlink|{fatlink.pk}|{fatlink.created.year}|{fatlink.created.month}|"
+        f"{fatlink.creator_id}|{fatlink.fleet_type}"
+    )
+
+
+def buffer_delta(field: str, delta: int) -> bool:
+    """
+    Add a delta to the buffer, shared by all workers.
+
+    :return: True if no flush is scheduled yet and the caller should schedule one
+    """
+    redis = get_redis_client()
+    redis.hincrby(LIVE_DELTAS_KEY, field, delta)
+    return bool(redis.set(LIVE_FLUSH_KEY, 1, nx=True, ex=PAPSTATS_LIVE_FLUSH_DELAY))
+
+
+def pop_deltas() -> tuple:
+    """
+    Take all buffered deltas out of the buffer.
+
+    :return: mapping of (year, month) to a mapping of
+        (fat_id, user_id, corporation_id, fleet type name) to fat deltas,
+        and mapping of (year, month) to a mapping of
+        (fatlink_id, creator_id, fleet type name) to fatlink deltas
+    """
+    redis = get_redis_client()
+    pipe = redis.pipeline()
+    pipe.delete(LIVE_FLUSH_KEY)
+    pipe.hgetall(LIVE_DELTAS_KEY)
+    pipe.delete(LIVE_DELTAS_KEY)
+    _, pending, _ = pipe.execute()
+
+    fat_deltas = defaultdict(dict)
+    fatlink_deltas = defaultdict(dict)
+    for field, delta in pending.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        delta = int(delta)
+        if not delta:
+            continue
+
+        if field.startswith("fat|"):
+            _, fat_id, year, month, user_id, corporation_id, name = field.split("|", 6)
+            key = (int(fat_id), int(user_id), int(corporation_id), name)
+            fat_deltas[(int(year), int(month))][key] = delta
+        else:
+            _, fatlink_id, year, month, creator_id, name = field.split("|", 5)
+            key = (int(fatlink_id), int(creator_id), name)
+            fatlink_deltas[(int(year), int(month))][key] = delta
+
+    return fat_deltas, fatlink_deltas
+
+
+def fence_deltas(deltas: dict, fence: int) -> tuple:
+    """
+    Drop the increments of rows which the full aggregation of a month has counted.
+
+    Decrements are kept, rows up to the fence were counted before they were deleted.
+
+    :param deltas: mapping of keys starting with the row id to deltas
+    :param fence: the last row id counted by the full aggregation of the month
+    :return: mapping of the keys without the row id to the summed deltas
+        and the number of increments dropped
+    """
+    totals = defaultdict(int)
+    dropped = 0
+    for (row_id, *key), delta in deltas.items():
+        if delta > 0 and row_id <= fence:
+            dropped += delta
+            continue
+        totals[tuple(key)] += delta
+    return totals, dropped
+
+
+def attribute_decrements(month: int, year: int, user_totals: dict) -> tuple:
+    """
+    Take fat decrements from the corporations their user's fats were counted in.
+
+    Decrements are resolved to the corporation of the owner's main when a fat is
+    deleted, which is not the one the fat was counted in once the main changed
+    corporation. They are taken from the user's stats of that corporation first
+    and from the user's other stats of the fleet type after that.
+    Decrements of fats which were never counted are dropped.
+
+    :param user_totals: mapping of (user_id, corporation_id, fleet_type_id) to deltas
+    :return: mapping of (user_id, corporation_id, fleet_type_id) to deltas
+        and the number of decrements dropped
+    """
+    totals = defaultdict(int)
+    decrements = {}
+    for key, total in user_totals.items():
+        if total < 0:
+            decrements[key] = -total
+        else:
+            totals[key] += total
+    if not decrements:
+        return totals, 0
+
+    counted = defaultdict(dict)
+    for (
+        user_id,
+        corporation_id,
+        fleet_type_id,
+        total,
+    ) in MonthlyUserStats.objects.filter(
+        month=month,
+        year=year,
+        user_id__in={user_id for user_id, _, _ in decrements},
+        fleet_type_id__in={fleet_type_id for _, _, fleet_type_id in decrements},
+        total_fats__gt=0,
+    ).values_list(
+        "user_id", "corporation_id", "fleet_type_id", "total_fats"
+    ):
+        counted[(user_id, fleet_type_id)][corporation_id] = total
+    # Fats added by the same flush can be taken back as well
+    for (user_id, corporation_id, fleet_type_id), total in totals.items():
+        available = counted[(user_id, fleet_type_id)]
+        available[corporation_id] = available.get(corporation_id, 0) + total
+
+    dropped = 0
+    for (user_id, corporation_id, fleet_type_id), remaining in decrements.items():
+        available = counted[(user_id, fleet_type_id)]
+        for counted_corporation_id in sorted(
+            available,
+            key=lambda corp_id: (corp_id != corporation_id, -available[corp_id]),
+        ):
+            taken = min(remaining, available[counted_corporation_id])
+            totals[(user_id, counted_corporation_id, fleet_type_id)] -= taken
+            available[counted_corporation_id] -= taken
+            remaining -= taken
+            if not remaining:
+                break
+        dropped += remaining
+    return totals, dropped
@@ -1,8 +1,60 @@
+# Standard Library
+import argparse
+import time
+from datetime import datetime
+
+# Third Party
+from celery import chain
+
 # Django
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
 # Pap Stats
-from papstats.tasks import process_afat_data_task
+from papstats.aggregation import find_missing_months
+from papstats.models import AggregationRun
+from papstats.tasks import process_afat_data_task, process_creator_stats
+from papstats.utils import iter_months
+
+
+def year_month(value):
+    """Parse a YYYY-MM argument into a (year, month) tuple."""
+    try:
+        date = datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not in YYYY-MM format")
+    return date.year, date.month
+
+
+def get_backfill_progress(afat_months, creator_months, started) -> tuple:
+    """
+    Look up the progress of a backfill in the run ledger.
+
+    A month's AFAT aggregation is done once its AFAT and creator runs succeeded.
+
+    :param started: when the backfill was started, earlier runs are ignored
+    :return: the months done and the months with a failed run
+    """
+    succeeded = set()
+    failed = set()
+    for kind, year, month, status in AggregationRun.objects.filter(
+        started__gte=started, kind__in=("afat", "creator")
+    ).values_list("kind", "year", "month", "status"):
+        if status == "succeeded":
+            succeeded.add((kind, (year, month)))
+        elif status == "failed":
+            failed.add((year, month))
+
+    done = [
+        year_month
+        for year_month in afat_months
+        if ("afat", year_month) in succeeded and ("creator", year_month) in succeeded
+    ] + [
+        year_month
+        for year_month in creator_months
+        if ("creator", year_month) in succeeded
+    ]
+    return done, sorted(failed & (set(afat_months) | set(creator_months)))
 
 
 class Command(BaseCommand):
@@ -15,12 +67,173 @@ class Command(BaseCommand):
         parser.add_argument(
             "--year", type=int, help="Year for which to aggregate stats"
         )
+        parser.add_argument(
+            "--from",
+            dest="start",
+            type=year_month,
+            help="First month (YYYY-MM) of a range to aggregate",
+        )
+        parser.add_argument(
+            "--to",
+            dest="end",
+            type=year_month,
+            help="Last month (YYYY-MM) of a range to aggregate",
+        )
+        parser.add_argument(
+            "--creators-only",
+            action="store_true",
+            help="Only rebuild the FC (creator) stats, without re-running fat ingestion",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuild an already aggregated month and swap it in atomically",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help=(
+                "Number of months of a --from/--to backfill to aggregate at the same "
+                "time. Backfilled months are not split into day shards"
+            ),
+        )
+        parser.add_argument(
+            "--wait",
+            action="store_true",
+            help="Wait for a backfill to finish and report its progress",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=int,
+            default=10,
+            help="Seconds between progress reports when waiting for a backfill",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=3600,
+            help="Seconds to wait for a backfill to finish before giving up",
+        )
 
     def handle(self, *args, **options):
+        if options["creators_only"]:
+            start = options["start"] or (options["year"], options["month"])
+            end = options["end"] or start
+            if None in start:
+                raise CommandError("Provide --month and --year or a --from/--to range")
+
+            process_creator_stats.delay(start[1], start[0], end[1], end[0])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "Successfully started task to process creator stats for "
+                    f"{start[1]}/{start[0]} to {end[1]}/{end[0]}"
+                )
+            )
+            return
+
+        if options["start"] or options["end"]:
+            self.backfill(options)
+            return
+
         month = options["month"]
         year = options["year"]
-        process_afat_data_task.delay(month, year)
+        if month is None or year is None:
+            raise CommandError("Provide --month and --year or a --from/--to range")
+        process_afat_data_task.delay(month, year, rebuild=options["rebuild"])
         # run_last_month_task.delay()
         self.stdout.write(
             self.style.SUCCESS("Successfully started task to process afat data")
         )
+
+    def backfill(self, options):
+        """Aggregate the months of a range which are missing stats."""
+        start = options["start"] or options["end"]
+        end = options["end"] or options["start"]
+        if start > end:
+            raise CommandError("--from must not be after --to")
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        months = list(iter_months(*start, *end))
+        missing = find_missing_months(months)
+        if options["rebuild"]:
+            afat_months = months
+        else:
+            afat_months = missing["afat"]
+
+        # A month's afat aggregation also rebuilds its creator stats
+        creator_months = [
+            year_month
+            for year_month in missing["creator"]
+            if year_month not in afat_months
+        ]
+
+        self.stdout.write(
+            f"Checked {len(months)} months from {start[1]}/{start[0]} "
+            f"to {end[1]}/{end[0]}: {len(missing['afat'])} missing afat stats, "
+            f"{len(missing['creator'])} missing creator stats"
+        )
+
+        # Day shards would return as soon as they are started and let the next
+        # month of a chain start, so the concurrency limit would not hold
+        signatures = [
+            process_afat_data_task.si(
+                month, year, rebuild=options["rebuild"], sharded=False
+            )
+            for year, month in afat_months
+        ] + [process_creator_stats.si(month, year) for year, month in creator_months]
+        if not signatures:
+            self.stdout.write(self.style.SUCCESS("Nothing to backfill"))
+            return
+
+        # Every chain aggregates its months one after another,
+        # so at most `concurrency` months are aggregated at the same time
+        started = timezone.now()
+        concurrency = min(options["concurrency"], len(signatures))
+        for idx in range(concurrency):
+            chain(*signatures[idx::concurrency]).apply_async()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully started {len(signatures)} tasks in "
+                f"{concurrency} parallel chains to backfill "
+                + ", ".join(
+                    f"{month}/{year}" for year, month in afat_months + creator_months
+                )
+            )
+        )
+
+        if options["wait"]:
+            self.wait_for_backfill(afat_months, creator_months, started, options)
+
+    def wait_for_backfill(self, afat_months, creator_months, started, options):
+        """
+        Poll the run ledger until the scheduled months have been aggregated,
+        a run failed or the timeout is reached.
+        """
+        total = len(afat_months) + len(creator_months)
+        deadline = time.monotonic() + options["timeout"]
+        while True:
+            time.sleep(options["poll_interval"])
+            done, failed = get_backfill_progress(afat_months, creator_months, started)
+            self.stdout.write(
+                f"Backfill progress: {len(done)}/{total} months aggregated"
+            )
+            if failed:
+                # A failed task stops its chain, the later months of it never run
+                raise CommandError(
+                    "Aggregation failed for "
+                    + ", ".join(f"{month}/{year}" for year, month in failed)
+                    + ", see the run ledger. Months after them in the same chain "
+                    "were not aggregated."
+                )
+            if len(done) == total:
+                break
+            if time.monotonic() >= deadline:
+                raise CommandError(
+                    f"Backfill did not finish within {options['timeout']} seconds, "
+                    f"{total - len(done)} months are still missing"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Backfill finished"))
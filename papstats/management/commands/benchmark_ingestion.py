@@ -0,0 +1,65 @@
+# Standard Library
+import json
+
+# Django
+from django.core.management.base import BaseCommand, CommandError
+
+# Pap Stats
+from papstats.benchmark import DEFAULT_SCALE, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the ingestion tasks against generated data and print the results "
+        "as JSON. All generated data is rolled back, run it on a development database."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SCALE.items():
+            parser.add_argument(
+                f"--{name.replace('_', '-')}",
+                type=int,
+                default=default,
+                help=f"Number of {name.replace('_', ' ')} to generate (default: {default})",
+            )
+        parser.add_argument(
+            "--month", type=int, default=1, help="Month to generate data for"
+        )
+        parser.add_argument(
+            "--year", type=int, default=2000, help="Year to generate data for"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the data generator"
+        )
+        parser.add_argument("--output", help="Write the results to this file")
+        parser.add_argument(
+            "--confirm",
+            action="store_true",
+            help=(
+                "Confirm that this is a development database. The benchmark writes "
+                "to it and replaces and locks the stats watermarks until it is done"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if not options["confirm"]:
+            raise CommandError(
+                "The benchmark writes to the database and blocks the stats "
+                "aggregation while it runs. Run it on a development database "
+                "with --confirm."
+            )
+
+        scale = {name: options[name] for name in DEFAULT_SCALE}
+        results = run_benchmark(
+            options["month"], options["year"], seed=options["seed"], **scale
+        )
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+            self.stdout.write(
+                self.style.SUCCESS(f"Wrote benchmark results to {options['output']}")
+            )
+        else:
+            self.stdout.write(output)
@@ -2,11 +2,14 @@
 from django.core.management.base import BaseCommand
 
 # Pap Stats
+from papstats.chart_cache import bump_data_versions
 from papstats.models import (
+    IMPImportRow,
     MonthlyCorpStats,
     MonthlyCreatorStats,
     MonthlyFleetType,
     MonthlyUserStats,
+    PendingIMPRow,
 )
 
 
@@ -29,6 +32,9 @@ class Command(BaseCommand):
         MonthlyUserStats.objects.filter(month=month, year=year).delete()
         MonthlyCreatorStats.objects.filter(month=month, year=year).delete()
         MonthlyFleetType.objects.filter(month=month, year=year).delete()
+        IMPImportRow.objects.filter(month=month, year=year).delete()
+        PendingIMPRow.objects.filter(month=month, year=year).delete()
+        bump_data_versions([(year, month)])
 
         self.stdout.write(
             self.style.SUCCESS(f"Successfully cleared data for {month}-{year}")
@@ -0,0 +1,18 @@
+# Django
+from django.core.management.base import BaseCommand
+
+# Pap Stats
+from papstats.accounts import rebuild_name_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the normalized names used to match IMP accounts"
+
+    def handle(self, *args, **options):
+        characters, unknown_accounts = rebuild_name_index()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {characters} characters and {unknown_accounts} unknown accounts"
+            )
+        )
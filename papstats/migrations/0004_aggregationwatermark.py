@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:31
+
+# Django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0003_alter_papstats_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AggregationWatermark",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=20, unique=True)),
+                ("last_id", models.PositiveBigIntegerField(default=0)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:43
+
+# Django
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0004_aggregationwatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AggregationRun",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=20)),
+                ("month", models.IntegerField(blank=True, null=True)),
+                ("year", models.IntegerField(blank=True, null=True)),
+                ("status", models.CharField(default="running", max_length=10)),
+                ("started", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished", models.DateTimeField(blank=True, null=True)),
+                ("rows_scanned", models.PositiveBigIntegerField(default=0)),
+                ("rows_written", models.PositiveBigIntegerField(default=0)),
+                ("skipped", models.JSONField(default=dict)),
+                ("query_count", models.PositiveIntegerField(default=0)),
+                ("query_time", models.FloatField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-started"], name="papstats_ag_started_f818ed_idx"
+                    )
+                ],
+            },
+        ),
+    ]
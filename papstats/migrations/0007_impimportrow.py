@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:58
+
+# Django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0006_csvupload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IMPImportRow",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("account_name", models.CharField(max_length=255)),
+                ("fleet_type", models.CharField(max_length=100)),
+                ("month", models.IntegerField()),
+                ("year", models.IntegerField()),
+                ("user_id", models.PositiveIntegerField()),
+                ("corporation_id", models.PositiveIntegerField()),
+                ("total", models.IntegerField()),
+                ("content_hash", models.CharField(max_length=40)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["year", "month"], name="papstats_im_year_74a53d_idx"
+                    )
+                ],
+                "unique_together": {("account_name", "fleet_type", "month", "year")},
+            },
+        ),
+    ]
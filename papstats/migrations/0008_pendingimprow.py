@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:02
+
+# Django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0007_impimportrow"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingIMPRow",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("account_name", models.CharField(max_length=255)),
+                ("fleet_type", models.CharField(max_length=100)),
+                ("month", models.IntegerField()),
+                ("year", models.IntegerField()),
+                ("total", models.IntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["year", "month"], name="papstats_pe_year_6e68ef_idx"
+                    )
+                ],
+                "unique_together": {("account_name", "fleet_type", "month", "year")},
+            },
+        ),
+    ]
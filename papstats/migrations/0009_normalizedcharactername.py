@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:04
+
+# Django
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eveonline", "0017_alliance_and_corp_names_are_not_unique"),
+        ("papstats", "0008_pendingimprow"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NormalizedCharacterName",
+            fields=[
+                (
+                    "character",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="eveonline.evecharacter",
+                    ),
+                ),
+                ("normalized_name", models.CharField(db_index=True, max_length=255)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="unknownaccount",
+            name="normalized_name",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=255
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 10:12
+
+# Django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0009_normalizedcharactername"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="aggregationwatermark",
+            name="source",
+            field=models.CharField(max_length=40, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Standard Library
+import unicodedata
+
+# Django
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def normalize_account_name(name: str) -> str:
+    """Copy of papstats.accounts.normalize_account_name at the time of migration."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(name.casefold().split())[:255]
+
+
+def fill_name_index(apps, schema_editor):
+    """Index the names of the characters and UnknownAccounts which already exist."""
+    EveCharacter = apps.get_model("eveonline", "EveCharacter")
+    NormalizedCharacterName = apps.get_model("papstats", "NormalizedCharacterName")
+    UnknownAccount = apps.get_model("papstats", "UnknownAccount")
+
+    characters = EveCharacter.objects.values_list("pk", "character_name")
+    NormalizedCharacterName.objects.bulk_create(
+        (
+            NormalizedCharacterName(
+                character_id=pk, normalized_name=normalize_account_name(name)
+            )
+            for pk, name in characters.iterator(chunk_size=BATCH_SIZE)
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+    unknown_accounts = list(UnknownAccount.objects.only("pk", "account_name"))
+    for unknown_account in unknown_accounts:
+        unknown_account.normalized_name = normalize_account_name(
+            unknown_account.account_name
+        )
+    UnknownAccount.objects.bulk_update(
+        unknown_accounts, ["normalized_name"], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0010_alter_aggregationwatermark_source"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_name_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:40
+
+# Django
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0011_fill_normalized_names"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="monthlyuserstats",
+            unique_together={
+                ("user_id", "corporation_id", "month", "year", "fleet_type")
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Django
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def mark_aggregated_months(apps, schema_editor):
+    """
+    Write the fats fence which marks a month as aggregated for every month
+    with AFAT stats, which used to be told apart by their AFAT fleet types.
+    """
+    AggregationWatermark = apps.get_model("papstats", "AggregationWatermark")
+    MonthlyCorpStats = apps.get_model("papstats", "MonthlyCorpStats")
+    MonthlyUserStats = apps.get_model("papstats", "MonthlyUserStats")
+
+    months = set()
+    for model in (MonthlyUserStats, MonthlyCorpStats):
+        months.update(
+            model.objects.filter(fleet_type__source="afat")
+            .values_list("year", "month")
+            .distinct()
+        )
+    AggregationWatermark.objects.bulk_create(
+        [
+            AggregationWatermark(source=f"afat_fats:{year}-{month:02}", last_id=0)
+            for year, month in sorted(months)
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0012_alter_monthlyuserstats_unique_together"),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_aggregated_months, migrations.RunPython.noop),
+    ]
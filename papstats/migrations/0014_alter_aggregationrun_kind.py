@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:03
+
+# Django
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("papstats", "0013_mark_aggregated_months"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="aggregationrun",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("afat", "AFAT"),
+                    ("creator", "Creator"),
+                    ("imp", "IMP"),
+                    ("pending", "Pending IMP rows"),
+                    ("incremental", "Incremental"),
+                    ("live", "Live"),
+                    ("charts", "Charts"),
+                ],
+                max_length=20,
+            ),
+        ),
+    ]
@@ -3,9 +3,10 @@
 # Django
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 # Alliance Auth
-from allianceauth.eveonline.models import EveCorporationInfo
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
 
 
 class PapStats(models.Model):
@@ -58,7 +59,7 @@ class MonthlyUserStats(models.Model):
     total_fats = models.PositiveIntegerField()
 
     class Meta:
-        unique_together = ("user_id", "month", "year", "fleet_type")
+        unique_together = ("user_id", "corporation_id", "month", "year", "fleet_type")
 
     def get_user(self):
 
@@ -99,6 +100,147 @@ class MonthlyCreatorStats(models.Model):
 class UnknownAccount(models.Model):
     account_name = models.CharField(max_length=255, unique=True)
     user_id = models.IntegerField(null=True, blank=True)
+    normalized_name = models.CharField(
+        max_length=255, db_index=True, default="", editable=False
+    )
 
     def __str__(self):
         return self.account_name
+
+
+class AggregationWatermark(models.Model):
+    """
+    The last AFAT row applied to the stats by the incremental aggregation, or
+    counted by the full aggregation of a month (its fence). A month's fats fence
+    marks it as aggregated, its id is only used by live stats.
+    """
+
+    source = models.CharField(
+        max_length=40, unique=True
+    )  # 'afat_fats', 'afat_fatlinks' or a fence like 'afat_fats:2024-05'
+    last_id = models.PositiveBigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.last_id}"
+
+
+class AggregationRun(models.Model):
+    """A record of one aggregation run, with its counters and query stats."""
+
+    KINDS = (
+        ("afat", "AFAT"),
+        ("creator", "Creator"),
+        ("imp", "IMP"),
+        ("pending", "Pending IMP rows"),
+        ("incremental", "Incremental"),
+        ("live", "Live"),
+        ("charts", "Charts"),
+    )
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    month = models.IntegerField(null=True, blank=True)
+    year = models.IntegerField(null=True, blank=True)
+    status = models.CharField(
+        max_length=10, default="running"
+    )  # 'running', 'succeeded' or 'failed'
+    started = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(null=True, blank=True)
+    rows_scanned = models.PositiveBigIntegerField(default=0)
+    rows_written = models.PositiveBigIntegerField(default=0)
+    skipped = models.JSONField(default=dict)  # skip reason: count
+    query_count = models.PositiveIntegerField(default=0)
+    query_time = models.FloatField(default=0)  # seconds
+
+    class Meta:
+        indexes = [models.Index(fields=["-started"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.month}/{self.year} {self.status}"
+
+    @property
+    def duration(self):
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    @property
+    def skipped_total(self):
+        return sum(self.skipped.values())
+
+
+class CSVUpload(models.Model):
+    """An IMP CSV upload staged for import."""
+
+    month = models.IntegerField()
+    year = models.IntegerField()
+    header = models.TextField()
+    uploaded_by = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"CSV upload {self.pk} for {self.month}/{self.year}"
+
+
+class CSVUploadChunk(models.Model):
+    """A chunk of lines of a staged CSV upload."""
+
+    upload = models.ForeignKey(
+        CSVUpload, on_delete=models.CASCADE, related_name="chunks"
+    )
+    index = models.PositiveIntegerField()
+    lines = models.TextField()
+
+    class Meta:
+        unique_together = ("upload", "index")
+
+
+class IMPImportRow(models.Model):
+    """An account's total of one IMP fleet type as applied by the last import."""
+
+    account_name = models.CharField(max_length=255)
+    fleet_type = models.CharField(max_length=100)
+    month = models.IntegerField()
+    year = models.IntegerField()
+    user_id = models.PositiveIntegerField()
+    corporation_id = models.PositiveIntegerField()
+    total = models.IntegerField()
+    content_hash = models.CharField(max_length=40)
+
+    class Meta:
+        unique_together = ("account_name", "fleet_type", "month", "year")
+        indexes = [models.Index(fields=["year", "month"])]
+
+    def __str__(self):
+        return f"{self.account_name} {self.fleet_type} {self.month}/{self.year}"
+
+
+class PendingIMPRow(models.Model):
+    """An IMP total of an account which could not be resolved to a user on import."""
+
+    account_name = models.CharField(max_length=255)
+    fleet_type = models.CharField(max_length=100)
+    month = models.IntegerField()
+    year = models.IntegerField()
+    total = models.IntegerField()
+
+    class Meta:
+        unique_together = ("account_name", "fleet_type", "month", "year")
+        indexes = [models.Index(fields=["year", "month"])]
+
+    def __str__(self):
+        return f"{self.account_name} {self.fleet_type} {self.month}/{self.year}"
+
+
+class NormalizedCharacterName(models.Model):
+    """The normalized name of a character, to match account names with."""
+
+    character = models.OneToOneField(
+        EveCharacter, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    normalized_name = models.CharField(max_length=255, db_index=True)
+
+    def __str__(self):
+        return self.normalized_name
@@ -0,0 +1,76 @@
+"""Signals."""
+
+# Third Party
+from afat.models import Fat, FatLink
+
+# Django
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter
+
+# Pap Stats
+from papstats.accounts import index_character_name, normalize_account_name
+from papstats.app_settings import PAPSTATS_LIVE_FLUSH_DELAY, PAPSTATS_LIVE_STATS
+from papstats.live import buffer_delta, get_fat_field, get_fatlink_field
+from papstats.models import PendingIMPRow, UnknownAccount
+from papstats.tasks import apply_pending_imp_rows_task, flush_live_stats_task
+
+
+def queue_delta(field: str, delta: int):
+    """Buffer a delta once the current transaction is committed."""
+    if field is None:
+        return
+
+    def _buffer():
+        if buffer_delta(field, delta):
+            flush_live_stats_task.apply_async(countdown=PAPSTATS_LIVE_FLUSH_DELAY)
+
+    transaction.on_commit(_buffer)
+
+
+@receiver(post_save, sender=Fat)
+def fat_saved(sender, instance, created, **kwargs):
+    if PAPSTATS_LIVE_STATS and created:
+        queue_delta(get_fat_field(instance), 1)
+
+
+@receiver(post_delete, sender=Fat)
+def fat_deleted(sender, instance, **kwargs):
+    if PAPSTATS_LIVE_STATS:
+        queue_delta(get_fat_field(instance), -1)
+
+
+@receiver(post_save, sender=FatLink)
+def fatlink_saved(sender, instance, created, **kwargs):
+    if PAPSTATS_LIVE_STATS and created:
+        queue_delta(get_fatlink_field(instance), 1)
+
+
+@receiver(post_delete, sender=FatLink)
+def fatlink_deleted(sender, instance, **kwargs):
+    if PAPSTATS_LIVE_STATS:
+        queue_delta(get_fatlink_field(instance), -1)
+
+
+@receiver(post_save, sender=EveCharacter)
+def character_saved(sender, instance, **kwargs):
+    index_character_name(instance)
+
+
+@receiver(pre_save, sender=UnknownAccount)
+def unknown_account_saving(sender, instance, **kwargs):
+    instance.normalized_name = normalize_account_name(instance.account_name)
+
+
+@receiver(post_save, sender=UnknownAccount)
+def unknown_account_saved(sender, instance, **kwargs):
+    if (
+        instance.user_id
+        and PendingIMPRow.objects.filter(account_name=instance.account_name).exists()
+    ):
+        transaction.on_commit(
+            lambda: apply_pending_imp_rows_task.delay(instance.account_name)
+        )
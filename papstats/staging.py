@@ -0,0 +1,270 @@
+"""Staging of uploaded IMP CSV files."""
+
+# Standard Library
+import csv
+import io
+from collections import Counter
+from datetime import timedelta
+
+# Third Party
+import pandas as pd
+
+# Django
+from django.db import transaction
+from django.utils import timezone
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.accounts import resolve_accounts
+from papstats.app_settings import PAPSTATS_CSV_CHUNK_LINES, PAPSTATS_CSV_TASK_LINES
+from papstats.models import CSVUpload, CSVUploadChunk
+
+logger = get_extension_logger(__name__)
+
+# Staged uploads which were never imported are removed after this time
+STALE_UPLOAD_AGE = timedelta(days=1)
+
+
+def decode_lines(file, encoding: str = "utf-8"):
+    """Yields the decoded lines of an uploaded file without reading it at once."""
+    for line in file:
+        yield line.decode(encoding).rstrip("\r\n")
+
+
+def stage_csv(lines, month: int, year: int, user=None) -> CSVUpload:
+    """
+    Stage the lines of a CSV file for import in chunks of ``PAPSTATS_CSV_CHUNK_LINES``.
+
+    :param lines: iterable of the CSV lines, starting with the header
+    :return: the staged upload
+    """
+    CSVUpload.objects.filter(created__lt=timezone.now() - STALE_UPLOAD_AGE).delete()
+
+    lines = iter(lines)
+    header = next(lines, "")
+    with transaction.atomic():
+        upload = CSVUpload.objects.create(
+            month=month, year=year, header=header, uploaded_by=user
+        )
+        chunk = []
+        index = 0
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= PAPSTATS_CSV_CHUNK_LINES:
+                CSVUploadChunk.objects.create(
+                    upload=upload, index=index, lines="\n".join(chunk)
+                )
+                chunk = []
+                index += 1
+        if chunk:
+            CSVUploadChunk.objects.create(
+                upload=upload, index=index, lines="\n".join(chunk)
+            )
+
+    logger.debug(f"Staged {upload} in {index + bool(chunk)} chunks.")
+    return upload
+
+
+def iter_csv_lines(upload: CSVUpload):
+    """Yields the lines of a staged upload, starting with the header, one chunk at a time."""
+    yield upload.header
+    chunks = upload.chunks.order_by("index").values_list("lines", flat=True)
+    for lines in chunks.iterator(chunk_size=1):
+        yield from lines.split("\n")
+
+
+class ImportReport:
+    """Validation report of a staged upload, filled while it is parsed."""
+
+    def __init__(self, max_examples: int = 20):
+        self.max_examples = max_examples
+        self.rows = 0
+        self.column_totals = Counter()
+        self.invalid_cells = 0
+        self.invalid_examples = []
+        self.unresolved_accounts = []
+        self.projected_rows = {}
+        self.has_account_column = True
+
+    def add_chunk(self, accounts, cells, values, invalid, first_row: int):
+        """Add the mapped columns of a parsed chunk to the report."""
+        self.column_totals.update(
+            {column: int(total) for column, total in values.sum().items()}
+        )
+        self.invalid_cells += int(invalid.to_numpy().sum())
+
+        for row, column in zip(*invalid.to_numpy().nonzero()):
+            if len(self.invalid_examples) >= self.max_examples:
+                break
+            self.invalid_examples.append(
+                {
+                    "row": first_row + int(row),
+                    "account": accounts.iat[row] if accounts is not None else "",
+                    "column": cells.columns[column],
+                    "value": cells.iat[row, column],
+                }
+            )
+
+
+def get_chunk_ranges(upload: CSVUpload, lines: int = None) -> list:
+    """
+    Split the staged chunks of an upload into ranges of about ``lines`` lines.
+
+    :param lines: lines per range (default: ``PAPSTATS_CSV_TASK_LINES``)
+    :return: list of [start, stop) chunk index ranges
+    """
+    lines = lines or PAPSTATS_CSV_TASK_LINES
+    size = max(1, lines // PAPSTATS_CSV_CHUNK_LINES)
+    count = upload.chunks.count()
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+def sum_imp_totals(frames) -> pd.DataFrame:
+    """Sum DataFrames of account, fleet_type and total per account and fleet type."""
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=["account", "fleet_type", "total"])
+
+    totals = (
+        pd.concat(frames)
+        .astype({"total": "int64"})
+        .groupby(["account", "fleet_type"], as_index=False)["total"]
+        .sum()
+    )
+    return totals[totals["total"] != 0]
+
+
+def read_imp_totals(
+    upload: CSVUpload,
+    column_mapping: dict,
+    run=None,
+    report: ImportReport = None,
+    chunk_range: tuple = None,
+) -> tuple:
+    """
+    Parse a staged upload into long format, one chunk at a time.
+
+    Every chunk is loaded column-wise, its mapped columns are converted to integers
+    in one pass and melted to (account, fleet_type, total) rows without zeros.
+    Cells which are not whole non-negative numbers are invalid and skipped.
+    Like ``csv.DictReader`` the last of several columns with the same name is used
+    and missing trailing fields count as empty.
+
+    :param column_mapping: mapping of CSV column to fleet type name
+    :param run: RunRecorder or RunCounters to count the scanned and skipped rows in
+    :param report: ImportReport to add column totals and invalid cells to
+    :param chunk_range: [start, stop) range of the staged chunks to read,
+        all chunks by default
+    :return: DataFrame of account, fleet_type and total, summed per account and
+        fleet type, and the number of rows per account
+    """
+    header = [column.strip() for column in next(csv.reader([upload.header]), [])]
+    positions = {column: idx for idx, column in enumerate(header)}
+    account_position = positions.get("Account")
+    mapped = {
+        positions[column]: column for column in column_mapping if column in positions
+    }
+    if report:
+        report.has_account_column = account_position is not None
+
+    frames = []
+    account_rows = Counter()
+    rows = 0
+    chunks = upload.chunks.order_by("index")
+    if chunk_range:
+        chunks = chunks.filter(index__gte=chunk_range[0], index__lt=chunk_range[1])
+    for lines in chunks.values_list("lines", flat=True).iterator(chunk_size=1):
+        if not header or not lines.strip():
+            continue
+        # Rows may have more fields than the header, which are ignored
+        width = max(len(header), max(map(str.count, lines.split("\n"), ",")) + 1)
+        chunk = pd.read_csv(
+            io.StringIO(lines),
+            header=None,
+            names=range(width),
+            dtype=str,
+            keep_default_na=False,
+            index_col=False,
+        )
+        first_row = rows + 1
+        rows += len(chunk)
+
+        accounts = chunk[account_position] if account_position is not None else None
+        cells = chunk[list(mapped)]
+        cells.columns = list(mapped.values())
+        # Fleet counts are whole, non-negative numbers, anything else is invalid
+        stripped = cells.apply(lambda column: column.str.strip())
+        valid = stripped.apply(
+            lambda column: column.str.fullmatch(r"\+?[0-9]+").fillna(False)
+        ).astype(bool)
+        invalid = ~valid & (stripped != "")
+        values = stripped.where(valid).apply(pd.to_numeric)
+
+        if report:
+            report.add_chunk(accounts, cells, values, invalid, first_row)
+        if run:
+            run.rows_scanned += len(chunk)
+            run.skip("invalid_value", int(invalid.to_numpy().sum()))
+        if accounts is None:
+            if run:
+                run.skip("no_account", len(chunk))
+            continue
+
+        account_rows.update(accounts.value_counts().to_dict())
+
+        values.columns = [column_mapping[column] for column in values.columns]
+        values["account"] = accounts
+        melted = values.melt(
+            id_vars="account", var_name="fleet_type", value_name="total"
+        ).dropna()
+        frames.append(melted[melted["total"] != 0])
+
+    if report:
+        report.rows = rows
+    return sum_imp_totals(frames), account_rows
+
+
+def group_imp_totals(totals, accounts: dict) -> tuple:
+    """
+    Group the account totals of an upload per user and per corporation.
+
+    :param totals: DataFrame of account, fleet_type and total
+    :param accounts: mapping of account name to (user_id, corporation_id)
+    :return: Series of totals indexed by (user_id, corporation_id, fleet type name)
+        and Series of totals indexed by (corporation_id, fleet type name)
+    """
+    resolved = pd.DataFrame.from_dict(
+        accounts, orient="index", columns=["user_id", "corporation_id"]
+    )
+    totals = totals.join(resolved, on="account", how="inner")
+    user_totals = totals.groupby(["user_id", "corporation_id", "fleet_type"])[
+        "total"
+    ].sum()
+    corp_totals = totals.groupby(["corporation_id", "fleet_type"])["total"].sum()
+    return user_totals[user_totals != 0], corp_totals[corp_totals != 0]
+
+
+def build_import_report(upload: CSVUpload, column_mapping: dict) -> ImportReport:
+    """
+    Validate a staged upload without writing anything.
+
+    :param column_mapping: mapping of CSV column to fleet type name
+    :return: report with the totals per column, the invalid cells, the accounts
+        that can not be resolved and the number of stats rows an import would write
+    """
+    report = ImportReport()
+    totals, account_rows = read_imp_totals(upload, column_mapping, report=report)
+
+    accounts = resolve_accounts(account_rows, create_unknown=False)
+    report.unresolved_accounts = sorted(
+        (name, rows) for name, rows in account_rows.items() if name not in accounts
+    )
+
+    user_totals, corp_totals = group_imp_totals(totals, accounts)
+    report.projected_rows = {
+        "MonthlyUserStats": len(user_totals),
+        "MonthlyCorpStats": len(corp_totals),
+    }
+    return report
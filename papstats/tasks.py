@@ -1,36 +1,90 @@
 # tasks.py
 
 # Standard Library
-import csv
+import calendar
+from collections import Counter
 from datetime import datetime
 
 # Third Party
-from afat.models import Fat, FatLink, FleetType
-from celery import shared_task
+import pandas as pd
+from afat.models import Fat, FatLink
+from celery import chord, shared_task
 from dateutil.relativedelta import relativedelta
 
 # Django
-from django.conf import settings
-from django.contrib.auth.models import User
-from django.db import IntegrityError, transaction
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import now
 
 # Alliance Auth
-from allianceauth.authentication.models import CharacterOwnership, UserProfile
-from allianceauth.eveonline.models import (
-    EveAllianceInfo,
-    EveCharacter,
-    EveCorporationInfo,
-)
 from allianceauth.services.hooks import get_extension_logger
 
 # Pap Stats
+from papstats.accounts import resolve_accounts
+from papstats.aggregation import (
+    aggregate_afat_fatlinks,
+    aggregate_afat_fats,
+    claim_month_fence,
+    corp_totals_from_user_totals,
+    count_fatlinks_by_month,
+    count_fats_by_month,
+    count_skipped_fats,
+    count_unknown_fleet_types,
+    get_afat_fats,
+    get_afat_fleet_types,
+    get_day_bounds,
+    get_month_bounds,
+    get_month_fences,
+    get_watermark_id,
+    lock_watermark,
+    resolve_fat_totals,
+    resolve_fleet_type,
+    set_month_fence,
+)
+from papstats.app_settings import (
+    PAPSTATS_CHART_CACHE,
+    PAPSTATS_LIVE_STATS,
+    PAPSTATS_PARALLEL_CSV_IMPORT,
+    PAPSTATS_PRERENDER_CHARTS,
+    PAPSTATS_SHARDED_AGGREGATION,
+)
+from papstats.chart_cache import (
+    bump_data_versions,
+    get_dependent_months,
+    render_charts,
+)
+from papstats.data import get_chart_entities
+from papstats.imports import (
+    apply_import_rows,
+    get_import_rows,
+    has_imp_rows,
+    has_imp_stats,
+    pop_pending_rows,
+    replace_pending_rows,
+)
+from papstats.ledger import RunCounters, RunRecorder
+from papstats.live import attribute_decrements, fence_deltas, pop_deltas
 from papstats.models import (
+    AggregationWatermark,
+    CSVUpload,
+    IMPImportRow,
     MonthlyCorpStats,
     MonthlyCreatorStats,
-    MonthlyFleetType,
     MonthlyUserStats,
-    UnknownAccount,
 )
+from papstats.staging import get_chunk_ranges, read_imp_totals, sum_imp_totals
+from papstats.utils import (
+    FATLINKS_WATERMARK,
+    FATS_WATERMARK,
+    get_aggregated_months,
+    get_current_year_month,
+    get_monthly_fleet_types,
+    iter_months,
+)
+from papstats.views.alliance import build_alliance_charts
+from papstats.views.corporation import build_corporation_charts
+from papstats.views.fc import build_fc_charts
+from papstats.writer import StatsWriter
 
 logger = get_extension_logger(__name__)
 
@@ -49,332 +103,688 @@ def run_last_month_task():
 
 
 @shared_task
-def process_csv_task(csv_data, column_mapping, month, year):
-    user_stats_exists = MonthlyUserStats.objects.filter(
-        month=month, year=year, fleet_type__source="imp"
-    ).exists()
-    corp_stats_exists = MonthlyCorpStats.objects.filter(
-        month=month, year=year, fleet_type__source="imp"
-    ).exists()
-
-    if user_stats_exists or corp_stats_exists:
-        logger.warning(f"Data for {month}/{year} already exists. Skipping processing.")
-        logger.debug(
-            f"User stats exist: {user_stats_exists}, Corp stats exist: {corp_stats_exists}"
+def process_csv_task(upload_id, column_mapping, parallel=None):
+    """
+    Import the IMP stats of a staged CSV upload and remove the upload afterwards.
+
+    A month can be imported again with a corrected file. Only the differences to
+    the rows of the previous import are applied, AFAT stats are left untouched.
+
+    With ``parallel`` (default: ``PAPSTATS_PARALLEL_CSV_IMPORT``) a large upload is
+    split into ranges of ``PAPSTATS_CSV_TASK_LINES`` lines, which are parsed by
+    their own tasks and merged and written by a final task.
+
+    :param upload_id: id of the staged CSVUpload
+    :param column_mapping: mapping of CSV column to fleet type name
+    """
+    try:
+        upload = CSVUpload.objects.get(pk=upload_id)
+    except CSVUpload.DoesNotExist:
+        logger.warning(f"CSV upload {upload_id} not found. Skipping processing.")
+        return
+
+    month = upload.month
+    year = upload.year
+    if has_imp_stats(month, year) and not has_imp_rows(month, year):
+        logger.warning(
+            f"Data for {month}/{year} was imported without import rows "
+            f"and can not be corrected. Skipping processing."
         )
+        upload.delete()
         return
 
-    reader = csv.DictReader(csv_data)
-
-    for row in reader:
-        try:
-            account_name = row["Account"]
-        except KeyError:
-            continue
-
-        try:
-            character = EveCharacter.objects.get(character_name=account_name)
-            ownership = CharacterOwnership.objects.get(character=character)
-            user = ownership.user
-            corporation = character.corporation
-        except (
-            EveCharacter.DoesNotExist,
-            CharacterOwnership.DoesNotExist,
-            EveCorporationInfo.DoesNotExist,
-        ):
-            # Handle unknown account
-            unknown_account, created = UnknownAccount.objects.get_or_create(
-                account_name=account_name
-            )
-            if unknown_account.user_id:
-                user = User.objects.get(id=unknown_account.user_id)
-                corporation = user.profile.main_character.corporation
-            else:
-                logger.warning(f"Unknown account {account_name} not found.")
-                continue
-
-        for column, fleet_type_name in column_mapping.items():
-            if column in row and row[column]:
-                total_fats = int(row[column])
-
-                if total_fats == 0:
-                    continue
-
-                fleet_type, created = MonthlyFleetType.objects.get_or_create(
-                    name=fleet_type_name,
-                    source="imp",  # Set the source to 'imp'
-                    month=month,
-                    year=year,
-                )
+    if parallel is None:
+        parallel = PAPSTATS_PARALLEL_CSV_IMPORT
+    chunk_ranges = get_chunk_ranges(upload) if parallel else []
+    if len(chunk_ranges) > 1:
+        chord(
+            read_csv_part_task.s(upload_id, chunk_range, column_mapping)
+            for chunk_range in chunk_ranges
+        )(merge_csv_parts_task.s(upload_id, column_mapping))
+        logger.info(f"Started {len(chunk_ranges)} tasks to import {upload}.")
+        return
 
-                user_stats, created = MonthlyUserStats.objects.get_or_create(
-                    user_id=user.id,
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                    defaults={"total_fats": total_fats},
-                )
+    with RunRecorder("imp", month, year) as run:
+        totals, account_rows = read_imp_totals(upload, column_mapping, run)
+        write_imp_month(month, year, column_mapping, totals, account_rows, run)
 
-                if not created:
-                    user_stats.total_fats += total_fats
-                    user_stats.save()
+    upload.delete()
+    schedule_prerender_charts(month, year)
 
-                corp_stats, created = MonthlyCorpStats.objects.get_or_create(
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                    defaults={"total_fats": total_fats},
-                )
 
-                if not created:
-                    corp_stats.total_fats += total_fats
-                    corp_stats.save()
+@shared_task
+def read_csv_part_task(upload_id, chunk_range, column_mapping):
+    """
+    Parse a range of the staged chunks of an upload, as a part of process_csv_task.
+
+    :param chunk_range: [start, stop) range of the staged chunks to parse
+    :return: dict with the number of rows ``scanned``, the rows ``skipped`` by
+        reason, the ``totals`` as a list of [account, fleet type name, total]
+        and the number of rows per account as ``accounts``
+    """
+    upload = CSVUpload.objects.get(pk=upload_id)
+    counters = RunCounters()
+    totals, account_rows = read_imp_totals(
+        upload, column_mapping, counters, chunk_range=chunk_range
+    )
+    return {
+        "scanned": counters.rows_scanned,
+        "skipped": dict(counters.skipped),
+        "totals": [
+            [account, name, int(total)]
+            for account, name, total in totals.itertuples(index=False, name=None)
+        ],
+        "accounts": dict(account_rows),
+    }
 
 
 @shared_task
-def process_afat_data_task(month, year):
-    # Check for existing data for the given month and year
-    user_stats_exists = MonthlyUserStats.objects.filter(
-        month=month, year=year, fleet_type__source="afat"
-    ).exists()
-    corp_stats_exists = MonthlyCorpStats.objects.filter(
-        month=month, year=year, fleet_type__source="afat"
-    ).exists()
-
-    if user_stats_exists or corp_stats_exists:
-        logger.warning(f"Data for {month}/{year} already exists. Skipping processing.")
-        logger.debug(
-            f"User stats exist: {user_stats_exists}, Corp stats exist: {corp_stats_exists}"
+def merge_csv_parts_task(part_results, upload_id, column_mapping):
+    """Merge the parsed parts of an upload, write its stats once and remove it."""
+    upload = CSVUpload.objects.get(pk=upload_id)
+    with RunRecorder("imp", upload.month, upload.year) as run:
+        account_rows = Counter()
+        frames = []
+        for part_result in part_results:
+            run.rows_scanned += part_result["scanned"]
+            for reason, count in part_result["skipped"].items():
+                run.skip(reason, count)
+            account_rows.update(part_result["accounts"])
+            frames.append(
+                pd.DataFrame(
+                    part_result["totals"], columns=["account", "fleet_type", "total"]
+                )
+            )
+
+        write_imp_month(
+            upload.month,
+            upload.year,
+            column_mapping,
+            sum_imp_totals(frames),
+            account_rows,
+            run,
         )
-        return
 
-    start_date = datetime(year, month, 1)
-    end_date = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
-
-    # Create necessary fleet types
-    afat_fleet_types = FleetType.objects.all()
-    for afat_fleet_type in afat_fleet_types:
-        MonthlyFleetType.objects.get_or_create(
-            name=afat_fleet_type.name,
-            source="afat",
-            month=month,
-            year=year,
+    upload.delete()
+    logger.info(f"Imported {upload} from {len(part_results)} parts.")
+    schedule_prerender_charts(upload.month, upload.year)
+
+
+def write_imp_month(month, year, column_mapping, totals, account_rows, run):
+    """
+    Resolve the accounts of an upload and apply its totals to the IMP stats.
+
+    The differences to the previous import of the month are written in one
+    transaction. The totals of unresolved accounts replace the pending rows of
+    the month, which are applied once their account is mapped to a user.
+
+    :param totals: DataFrame of account, fleet_type and total
+    :param account_rows: number of rows per account name
+    :param run: RunRecorder to count the skipped and written rows in
+    """
+    # Resolve all accounts of the file up front
+    accounts = resolve_accounts(account_rows)
+    for account_name, rows in account_rows.items():
+        if account_name not in accounts:
+            logger.warning(f"Unknown account {account_name} not found.")
+            run.skip("unknown_account", rows)
+
+    rows = get_import_rows(totals, accounts)
+
+    with transaction.atomic():
+        if not has_imp_stats(month, year):
+            # The stats of the month were cleared since its last import
+            IMPImportRow.objects.filter(month=month, year=year).delete()
+
+        # Unresolved accounts are kept until they are mapped to a user
+        replace_pending_rows(month, year, totals, accounts)
+
+        user_deltas, corp_deltas, unchanged = apply_import_rows(month, year, rows)
+        run.skip("unchanged", unchanged)
+        run.rows_written += write_imp_deltas(
+            month, year, user_deltas, corp_deltas, column_mapping.values()
         )
 
-    # Create the "unknown" fleet type
-    unknown_fleet_type, _ = MonthlyFleetType.objects.get_or_create(
-        name="Unknown",
-        source="afat",
-        month=month,
-        year=year,
-    )
 
-    afat_fats = Fat.objects.filter(
-        fatlink__created__gte=start_date, fatlink__created__lt=end_date
-    )
+def write_imp_deltas(
+    month, year, user_deltas: dict, corp_deltas: dict, fleet_type_names=()
+) -> int:
+    """
+    Write IMP stat deltas of a month and remove the stats they took down to zero.
 
-    for afat_fat in afat_fats:
-        try:
-            character = afat_fat.character
-            logger.debug(
-                f"Processing character: {character.character_name} (ID: {character.character_id})"
+    :param user_deltas: mapping of (user_id, corporation_id, fleet type name) to delta
+    :param corp_deltas: mapping of (corporation_id, fleet type name) to delta
+    :param fleet_type_names: fleet types to create in any case
+    :return: number of written rows
+    """
+    fleet_types = get_monthly_fleet_types(
+        set(fleet_type_names) | {name for _, name in corp_deltas}, "imp", month, year
+    )
+    with StatsWriter() as writer:
+        for (user_id, corporation_id, name), total in user_deltas.items():
+            writer.add_user_stat(
+                user_id, corporation_id, month, year, fleet_types[name], total
             )
+        for (corporation_id, name), total in corp_deltas.items():
+            writer.add_corp_stat(corporation_id, month, year, fleet_types[name], total)
+    return writer.rows_written
 
-            ownership = CharacterOwnership.objects.get(character=character)
-            user = ownership.user
-            main_character = user.profile.main_character
 
-            if not main_character or not main_character.alliance:
-                logger.debug(
-                    f"Skipping character: {character.character_name} - No main character or alliance."
-                )
-                continue
+@shared_task
+def apply_pending_imp_rows_task(account_name):
+    """Apply the pending IMP rows of an account which has been mapped to a user."""
+    accounts = resolve_accounts([account_name], create_unknown=False)
+    if account_name not in accounts:
+        logger.warning(f"Account {account_name} can not be resolved yet.")
+        return
 
-            if main_character.alliance.alliance_id != settings.STATS_ALLIANCE_ID:
-                logger.debug(
-                    f"Skipping character: {character.character_name} - Not in the specified alliance."
+    user_id, corporation_id = accounts[account_name]
+    with RunRecorder("pending") as run:
+        with transaction.atomic():
+            pending = pop_pending_rows(account_name, user_id, corporation_id)
+            for (year, month), rows in pending.items():
+                run.rows_scanned += len(rows)
+                user_deltas, corp_deltas, unchanged = apply_import_rows(
+                    month, year, rows, account_names=[account_name]
+                )
+                run.skip("unchanged", unchanged)
+                run.rows_written += write_imp_deltas(
+                    month, year, user_deltas, corp_deltas
                 )
-                continue
 
-            corporation = main_character.corporation
-            logger.debug(
-                f"Character {character.character_name} belongs to corporation: {corporation.corporation_name}"
-            )
+    logger.info(
+        f"Applied pending IMP rows of {account_name} for {len(pending)} months."
+    )
 
-        except EveCharacter.DoesNotExist:
-            logger.error(
-                f"EveonlineEvecharacter.DoesNotExist: Character {character.character_name} not found."
-            )
-            continue
-        except CharacterOwnership.DoesNotExist:
-            logger.error(
-                f"AuthenticationCharacterownership.DoesNotExist: Ownership not found for character {character.character_name}."
-            )
-            continue
-        except EveCorporationInfo.DoesNotExist:
-            logger.error(
-                f"EveonlineEvecorporationinfo.DoesNotExist: Corporation not found for main character {main_character.character_name}."
-            )
-            continue
-        except UserProfile.DoesNotExist:
-            logger.error(
-                f"AuthenticationUserprofile.DoesNotExist: User profile not found for user {user.username}."
+
+@shared_task
+def process_afat_data_task(month, year, rebuild=False, sharded=None):
+    """
+    Aggregate the AFAT stats of a month.
+
+    With ``rebuild`` an already aggregated month is built again and swapped in.
+    Its AFAT stats are replaced in one transaction and its creator stats in a
+    second one right after. Each is computed before its swap, so readers keep
+    seeing the old stats until it is committed.
+
+    With ``sharded`` (default: ``PAPSTATS_SHARDED_AGGREGATION``) every day of the
+    month is counted by its own task and the results are merged by a final task.
+    """
+    if not rebuild:
+        # Check for existing data for the given month and year
+        user_stats_exists = MonthlyUserStats.objects.filter(
+            month=month, year=year, fleet_type__source="afat"
+        ).exists()
+        corp_stats_exists = MonthlyCorpStats.objects.filter(
+            month=month, year=year, fleet_type__source="afat"
+        ).exists()
+
+        if user_stats_exists or corp_stats_exists:
+            logger.warning(
+                f"Data for {month}/{year} already exists. Skipping processing."
             )
-            continue
-        except EveAllianceInfo.DoesNotExist:
-            logger.error(
-                f"EveonlineEveallianceinfo.DoesNotExist: Alliance not found for main character {main_character.character_name}."
+            logger.debug(
+                f"User stats exist: {user_stats_exists}, Corp stats exist: {corp_stats_exists}"
             )
-            continue
+            return
+
+    # Fats past the incremental watermark are left to the incremental aggregation,
+    # with live stats every fat up to now is counted and later ones are live deltas
+    max_fat_id = (
+        Fat.objects.aggregate(Max("id"))["id__max"] or 0
+        if PAPSTATS_LIVE_STATS
+        else get_watermark_id(FATS_WATERMARK)
+    )
+
+    if sharded is None:
+        sharded = PAPSTATS_SHARDED_AGGREGATION
+    if sharded:
+        days = calendar.monthrange(year, month)[1]
+        chord(
+            aggregate_afat_shard_task.s(day, month, year, max_fat_id)
+            for day in range(1, days + 1)
+        )(merge_afat_shards_task.s(month, year, max_fat_id, rebuild))
+        logger.info(f"Started {days} shards to aggregate AFAT data for {month}/{year}.")
+        return
+
+    start_date, end_date = get_month_bounds(month, year)
+    with RunRecorder("afat", month, year) as run:
+        fats = get_afat_fats(start_date, end_date, max_fat_id)
+        scanned, skipped = count_skipped_fats(fats)
+        run.rows_scanned += scanned
+        for reason, count in skipped.items():
+            run.skip(reason, count)
+
+        month_totals = count_fats_by_month(fats).get((year, month), {})
+        write_afat_month(month, year, month_totals, max_fat_id, rebuild, run)
+
+    # Process creator stats
+    process_creator_stats(month, year)
+    schedule_prerender_charts(month, year)
 
-        fatlink = afat_fat.fatlink
 
-        if fatlink and fatlink.fleet_type is not None:
-            fleet_type_name = fatlink.fleet_type
-        else:
-            fleet_type_name = "Unknown"
+@shared_task
+def aggregate_afat_shard_task(day, month, year, max_fat_id=None):
+    """
+    Count the fats of one day of a month, as a shard of process_afat_data_task.
+
+    :return: dict with the number of fats ``scanned``, the fats ``skipped`` by reason
+        and the ``totals`` as a list of [user_id, corporation_id, fleet type name, total fats]
+    """
+    start_date, end_date = get_day_bounds(day, month, year)
+    fats = get_afat_fats(start_date, end_date, max_fat_id)
+    scanned, skipped = count_skipped_fats(fats)
+    day_totals = count_fats_by_month(fats).get((year, month), {})
+    return {
+        "scanned": scanned,
+        "skipped": skipped,
+        "totals": [[*key, total] for key, total in day_totals.items()],
+    }
+
+
+@shared_task
+def merge_afat_shards_task(shard_results, month, year, max_fat_id=None, rebuild=False):
+    """Merge the results of the shards of a month and write its stats once."""
+    with RunRecorder("afat", month, year) as run:
+        month_totals = Counter()
+        for shard_result in shard_results:
+            run.rows_scanned += shard_result["scanned"]
+            for reason, count in shard_result["skipped"].items():
+                run.skip(reason, count)
+            for user_id, corporation_id, fleet_type_name, total in shard_result[
+                "totals"
+            ]:
+                month_totals[(user_id, corporation_id, fleet_type_name)] += total
+
+        write_afat_month(month, year, month_totals, max_fat_id, rebuild, run)
+
+    # Process creator stats
+    process_creator_stats(month, year)
+    schedule_prerender_charts(month, year)
+
+
+def write_afat_month(
+    month, year, month_totals: dict, max_fat_id=None, rebuild=False, run=None
+):
+    """
+    Write the fat totals of a month.
+
+    The totals are written in one transaction. With ``rebuild`` the month's
+    existing AFAT stats are replaced in the same transaction, otherwise nothing
+    is written if the month has been aggregated since the totals were counted.
+
+    :param month_totals: mapping of (user_id, corporation_id, fleet type name) to total fats
+    :param max_fat_id: the fat watermark the totals have been counted up to
+    :param run: RunRecorder to count the written rows in
+    """
+    with transaction.atomic():
+        watermark = lock_watermark(FATS_WATERMARK)
+        # The fence marks the month as aggregated for the incremental aggregation
+        # and live stats, which must not apply fats to it before this is committed
+        if rebuild:
+            set_month_fence(FATS_WATERMARK, month, year, max_fat_id or 0)
+        elif not claim_month_fence(FATS_WATERMARK, month, year, max_fat_id or 0):
             logger.warning(
-                "Fleet type is Unknown for afat_fat: %s. Fatlink: %s. Link Type: %s",
-                afat_fat,
-                fatlink,
-                getattr(fatlink, "link_type", None),
+                f"Data for {month}/{year} has been aggregated meanwhile. "
+                f"Skipping processing."
             )
+            if run:
+                run.skip("already_aggregated", sum(month_totals.values()))
+            return
+        fleet_types = get_afat_fleet_types(month, year)
+        if watermark and max_fat_id is not None and watermark.last_id > max_fat_id:
+            # Catch up with fats applied by the incremental aggregation meanwhile
+            start_date, end_date = get_month_bounds(month, year)
+            new_totals = aggregate_afat_fats(
+                start_date, end_date, watermark.last_id, max_fat_id
+            ).get((year, month), {})
+            month_totals = Counter(month_totals) + Counter(new_totals)
+
+        user_totals = resolve_fat_totals(month_totals, fleet_types)
+        corp_totals = corp_totals_from_user_totals(user_totals)
+        if rebuild:
+            transaction.on_commit(lambda: bump_data_versions([(year, month)]))
+            MonthlyUserStats.objects.filter(
+                month=month, year=year, fleet_type__source="afat"
+            ).delete()
+            MonthlyCorpStats.objects.filter(
+                month=month, year=year, fleet_type__source="afat"
+            ).delete()
+
+        with StatsWriter() as writer:
+            write_fat_totals(writer, month, year, user_totals, corp_totals)
+
+    if run:
+        run.rows_written += writer.rows_written
+        run.skip(
+            "unknown_fleet_type", count_unknown_fleet_types(month_totals, fleet_types)
+        )
+
+    logger.info(
+        f"Aggregated {sum(user_totals.values())} fats for {month}/{year} into "
+        f"{len(user_totals)} user and {len(corp_totals)} corp rows."
+    )
 
-        try:
-            fleet_type = MonthlyFleetType.objects.get(
-                name=fleet_type_name,
-                source="afat",
-                month=month,
-                year=year,
-            )
-        except MonthlyFleetType.DoesNotExist:
-            logger.error(
-                f"MonthlyFleetType not found for name={fleet_type_name}, source=afat, month={month}, year={year}. Falling back to 'Unknown'."
-            )
-            try:
-                fleet_type = MonthlyFleetType.objects.get(
-                    name="Unknown",
-                    source="afat",
-                    month=month,
-                    year=year,
-                )
-            except MonthlyFleetType.DoesNotExist:
-                logger.critical(
-                    f"Fallback MonthlyFleetType 'Unknown' not found for source=afat, month={month}, year={year}."
-                )
-                fleet_type = (
-                    None  # If even "Unknown" is missing, keep it None as a last resort.
-                )
 
-        try:
-            with transaction.atomic():
-                # Check for existing user stats entry before attempting to create or update
-                existing_user_stats = MonthlyUserStats.objects.filter(
-                    user_id=user.id,
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                ).first()
-
-                if existing_user_stats:
-                    existing_user_stats.total_fats += 1
-                    existing_user_stats.save()
-                else:
-                    MonthlyUserStats.objects.create(
-                        user_id=user.id,
-                        corporation_id=corporation.corporation_id,
-                        month=month,
-                        year=year,
-                        fleet_type=fleet_type,
-                        total_fats=1,
-                    )
-
-                # Check for existing corp stats entry before attempting to create or update
-                existing_corp_stats = MonthlyCorpStats.objects.filter(
-                    corporation_id=corporation.corporation_id,
-                    month=month,
-                    year=year,
-                    fleet_type=fleet_type,
-                ).first()
-
-                if existing_corp_stats:
-                    existing_corp_stats.total_fats += 1
-                    existing_corp_stats.save()
-                else:
-                    MonthlyCorpStats.objects.create(
-                        corporation_id=corporation.corporation_id,
-                        month=month,
-                        year=year,
-                        fleet_type=fleet_type,
-                        total_fats=1,
-                    )
-        except IntegrityError as e:
-            logger.error(
-                f"IntegrityError: user ID {user.id}, corp ID {corporation.corporation_id}, and {fleet_type_name}: {e}"
+@shared_task
+def process_creator_stats(month, year, end_month=None, end_year=None):
+    """
+    Rebuild the creator stats of a month from AFAT fatlinks.
+
+    Pass ``end_month`` and ``end_year`` to rebuild every month up to and including
+    that month. This only needs the fatlinks, so FC stats can be refreshed on their
+    own without re-running the fat ingestion. Each month is swapped in with a single
+    transaction.
+    """
+    end_month = end_month or month
+    end_year = end_year or year
+    months = list(iter_months(year, month, end_year, end_month))
+
+    # Fatlinks past the incremental watermark are left to the incremental aggregation,
+    # with live stats every fatlink up to now is counted and later ones are live deltas
+    max_fatlink_id = (
+        FatLink.objects.aggregate(Max("id"))["id__max"] or 0
+        if PAPSTATS_LIVE_STATS
+        else get_watermark_id(FATLINKS_WATERMARK)
+    )
+    start_date, _ = get_month_bounds(month, year)
+    _, end_date = get_month_bounds(end_month, end_year)
+    totals = aggregate_afat_fatlinks(start_date, end_date, max_fatlink_id)
+
+    for stats_year, stats_month in months:
+        with RunRecorder("creator", stats_month, stats_year) as run:
+            write_creator_month(
+                stats_month,
+                stats_year,
+                totals.get((stats_year, stats_month), {}),
+                max_fatlink_id,
+                run,
             )
-            continue
 
-    # Process creator stats
-    process_creator_stats(month, year)
+
+def write_creator_month(month, year, month_totals: dict, max_fatlink_id=None, run=None):
+    """
+    Replace the creator stats of a month in one transaction.
+
+    :param month_totals: mapping of (creator_id, fleet type name) to total fatlinks
+    :param max_fatlink_id: the fatlink watermark the totals have been counted up to
+    :param run: RunRecorder to count the scanned and written rows in
+    """
+    with transaction.atomic():
+        watermark = lock_watermark(FATLINKS_WATERMARK)
+        if (
+            watermark
+            and max_fatlink_id is not None
+            and watermark.last_id > max_fatlink_id
+        ):
+            # Catch up with fatlinks applied by the incremental aggregation meanwhile
+            start_date, end_date = get_month_bounds(month, year)
+            new_totals = aggregate_afat_fatlinks(
+                start_date, end_date, watermark.last_id, max_fatlink_id
+            ).get((year, month), {})
+            month_totals = Counter(month_totals) + Counter(new_totals)
+
+        # Only the fleet types the fatlinks need,
+        # the AFAT aggregation of the month creates all of them
+        fleet_types = get_afat_fleet_types(
+            month, year, names={name for _, name in month_totals}
+        )
+        transaction.on_commit(lambda: bump_data_versions([(year, month)]))
+        MonthlyCreatorStats.objects.filter(month=month, year=year).delete()
+        with StatsWriter() as writer:
+            write_fatlink_totals(writer, month, year, month_totals, fleet_types)
+        if PAPSTATS_LIVE_STATS:
+            set_month_fence(FATLINKS_WATERMARK, month, year, max_fatlink_id)
+
+    if run:
+        run.rows_scanned += sum(month_totals.values())
+        run.rows_written += writer.rows_written
+        run.skip(
+            "unknown_fleet_type", count_unknown_fleet_types(month_totals, fleet_types)
+        )
+
+    logger.info(
+        f"Aggregated {sum(month_totals.values())} fatlinks for {month}/{year} "
+        f"into {writer.rows_written} creator rows."
+    )
+
+
+def schedule_prerender_charts(month, year):
+    """Pre-render the charts of a month once the current transaction is committed."""
+    if PAPSTATS_CHART_CACHE and PAPSTATS_PRERENDER_CHARTS:
+        transaction.on_commit(lambda: prerender_charts_task.delay(month, year))
 
 
 @shared_task
-def process_creator_stats(month, year):
-    start_date = datetime(year, month, 1)
-    end_date = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+def prerender_charts_task(month, year):
+    """
+    Render the alliance, corporation and FC charts showing a month into the chart cache.
+
+    This runs after a month is aggregated or imported, so the views only read
+    the charts instead of rendering them on the first request. Its new data
+    version invalidated the charts of the month and of the months after it
+    which still show it, these are rendered newest first up to the latest
+    month the views offer.
+    """
+    if not PAPSTATS_CHART_CACHE:
+        return
 
-    afat_fatlinks = FatLink.objects.filter(
-        created__gte=start_date, created__lt=end_date
+    latest = get_current_year_month()
+    months = [
+        chart_month
+        for chart_month in get_dependent_months(year, month)
+        if chart_month <= latest
+    ]
+    alliance_count = corporation_count = 0
+    with RunRecorder("charts", month, year) as run:
+        for chart_year, chart_month in months:
+            alliance_ids, corporations = get_chart_entities(chart_month, chart_year)
+            for alliance_id in alliance_ids:
+                render_charts(
+                    "alliance",
+                    alliance_id,
+                    chart_year,
+                    chart_month,
+                    lambda: build_alliance_charts(alliance_id, chart_year, chart_month),
+                )
+            for corporation in corporations:
+                render_charts(
+                    "corporation",
+                    corporation.corporation_id,
+                    chart_year,
+                    chart_month,
+                    lambda: build_corporation_charts(
+                        corporation, chart_year, chart_month
+                    ),
+                )
+            render_charts(
+                "fc",
+                None,
+                chart_year,
+                chart_month,
+                lambda: build_fc_charts(chart_year, chart_month),
+            )
+            alliance_count += len(alliance_ids)
+            corporation_count += len(corporations)
+        run.rows_written += alliance_count + corporation_count + len(months)
+
+    logger.info(
+        f"Pre-rendered the charts of {alliance_count} alliances and "
+        f"{corporation_count} corporations for {len(months)} months "
+        f"from {month}/{year}."
     )
 
-    for fatlink in afat_fatlinks:
-        creator = fatlink.creator
-        fleet_type_name = fatlink.fleet_type if fatlink.fleet_type else "Unknown"
-        logger.debug(
-            f"Processing creator stats for creator: {creator.username}, fleet type: {fleet_type_name}"
+
+@shared_task
+def process_afat_incremental_task():
+    """
+    Apply the AFAT fats and fatlinks added since the previous run to the stats.
+
+    Every run only reads the rows past the watermarks and adds them to the months
+    that have already been aggregated. The current month is aggregated in full
+    the first time it is seen, other months that have not been aggregated yet are
+    left to the monthly aggregation.
+    """
+    if PAPSTATS_LIVE_STATS:
+        logger.warning(
+            "Live stats are enabled, skipping the incremental aggregation. "
+            "Remove it from your periodic tasks."
         )
+        return
 
-        try:
-            fleet_type = MonthlyFleetType.objects.get(
-                name=fleet_type_name,
-                source="afat",
-                month=month,
-                year=year,
+    today = now()
+
+    with RunRecorder("incremental") as run, transaction.atomic():
+        fats_watermark = lock_watermark(FATS_WATERMARK)
+        fatlinks_watermark = lock_watermark(FATLINKS_WATERMARK)
+        max_fat_id = Fat.objects.aggregate(Max("id"))["id__max"] or 0
+        max_fatlink_id = FatLink.objects.aggregate(Max("id"))["id__max"] or 0
+
+        if fats_watermark is None or fatlinks_watermark is None:
+            logger.info("Starting incremental aggregation.")
+            fats_watermark, _ = AggregationWatermark.objects.get_or_create(
+                source=FATS_WATERMARK, defaults={"last_id": max_fat_id}
             )
-        except MonthlyFleetType.DoesNotExist:
-            logger.warning(
-                f"Fleet type '{fleet_type_name}' not found in MonthlyFleetType. Defaulting to 'Unknown'."
+            fatlinks_watermark, _ = AggregationWatermark.objects.get_or_create(
+                source=FATLINKS_WATERMARK, defaults={"last_id": max_fatlink_id}
             )
-            fleet_type = MonthlyFleetType.objects.get(
-                name="Unknown",
-                source="afat",
-                month=month,
-                year=year,
+
+        new_fats = Fat.objects.filter(id__gt=fats_watermark.last_id, id__lte=max_fat_id)
+        scanned, skipped = count_skipped_fats(new_fats)
+        run.rows_scanned += scanned
+        for reason, count in skipped.items():
+            run.skip(reason, count)
+
+        fat_totals = count_fats_by_month(new_fats)
+        fatlink_totals = count_fatlinks_by_month(
+            FatLink.objects.filter(
+                id__gt=fatlinks_watermark.last_id, id__lte=max_fatlink_id
             )
+        )
+        months = set(fat_totals) | set(fatlink_totals) | {(today.year, today.month)}
+        aggregated_months = get_aggregated_months(months)
+
+        with StatsWriter() as writer:
+            for year, month in sorted(aggregated_months):
+                fleet_types = get_afat_fleet_types(month, year)
+                month_fat_totals = fat_totals.get((year, month), {})
+                month_fatlink_totals = fatlink_totals.get((year, month), {})
+                run.rows_scanned += sum(month_fatlink_totals.values())
+                run.skip(
+                    "unknown_fleet_type",
+                    count_unknown_fleet_types(month_fat_totals, fleet_types)
+                    + count_unknown_fleet_types(month_fatlink_totals, fleet_types),
+                )
 
-        try:
-            with transaction.atomic():
-                # Check for existing creator stats entry before attempting to create or update
-                existing_creator_stats = MonthlyCreatorStats.objects.filter(
-                    creator_id=creator.id, month=month, year=year, fleet_type=fleet_type
-                ).first()
-
-                if existing_creator_stats:
-                    existing_creator_stats.total_created += 1
-                    existing_creator_stats.save()
-                else:
-                    MonthlyCreatorStats.objects.create(
-                        creator_id=creator.id,
-                        month=month,
-                        year=year,
-                        fleet_type=fleet_type,
-                        total_created=1,
-                    )
-        except IntegrityError as e:
-            logger.error(
-                f"IntegrityError processing creator ID {creator.id}, and fleet type {fleet_type_name}: {e}"
+                user_totals = resolve_fat_totals(month_fat_totals, fleet_types)
+                corp_totals = corp_totals_from_user_totals(user_totals)
+                write_fat_totals(writer, month, year, user_totals, corp_totals)
+                write_fatlink_totals(
+                    writer, month, year, month_fatlink_totals, fleet_types
+                )
+
+        for year, month in sorted(months - aggregated_months):
+            logger.debug(
+                f"Skipping new AFAT data for {month}/{year}, not aggregated yet."
             )
-            continue
+            run.skip(
+                "not_aggregated",
+                sum(fat_totals.get((year, month), {}).values())
+                + sum(fatlink_totals.get((year, month), {}).values()),
+            )
+
+        run.rows_written += writer.rows_written
+
+        fats_watermark.last_id = max_fat_id
+        fats_watermark.save()
+        fatlinks_watermark.last_id = max_fatlink_id
+        fatlinks_watermark.save()
+
+        if (today.year, today.month) not in aggregated_months:
+            process_afat_data_task(today.month, today.year)
+
+    logger.info(
+        f"Applied AFAT data up to fat {max_fat_id} and fatlink {max_fatlink_id} "
+        f"as {writer.rows_written} stat increments."
+    )
+
+
+@shared_task
+def flush_live_stats_task():
+    """
+    Write the live stat deltas buffered from AFAT signals.
+
+    Deltas are only applied to months which have already been aggregated. The current
+    month is aggregated in full the first time it is seen, which includes the
+    buffered deltas, deltas of other months are left to the monthly aggregation.
+    Increments of fats and fatlinks up to the fence of a month's full aggregation
+    are dropped, as it has counted them already.
+    """
+    fat_deltas, fatlink_deltas = pop_deltas()
+    months = set(fat_deltas) | set(fatlink_deltas)
+    if not months:
+        return
+
+    today = now()
+    aggregated_months = get_aggregated_months(months)
+    fat_fences = get_month_fences(FATS_WATERMARK, aggregated_months)
+    fatlink_fences = get_month_fences(FATLINKS_WATERMARK, aggregated_months)
+
+    with RunRecorder("live", today.month, today.year) as run:
+        with transaction.atomic(), StatsWriter() as writer:
+            for year, month in sorted(aggregated_months):
+                fleet_types = get_afat_fleet_types(month, year)
+                month_fat_deltas, counted_fats = fence_deltas(
+                    fat_deltas.get((year, month), {}), fat_fences.get((year, month), 0)
+                )
+                month_fatlink_deltas, counted_fatlinks = fence_deltas(
+                    fatlink_deltas.get((year, month), {}),
+                    fatlink_fences.get((year, month), 0),
+                )
+                run.skip("already_counted", counted_fats + counted_fatlinks)
+
+                user_totals, not_counted = attribute_decrements(
+                    month, year, resolve_fat_totals(month_fat_deltas, fleet_types)
+                )
+                run.skip("not_counted", not_counted)
+                corp_totals = corp_totals_from_user_totals(user_totals)
+                write_fat_totals(writer, month, year, user_totals, corp_totals)
+                write_fatlink_totals(
+                    writer, month, year, month_fatlink_deltas, fleet_types
+                )
+
+        for year, month in months:
+            deltas = sum(
+                abs(delta)
+                for month_deltas in (fat_deltas, fatlink_deltas)
+                for delta in month_deltas.get((year, month), {}).values()
+            )
+            run.rows_scanned += deltas
+            if (year, month) not in aggregated_months:
+                run.skip("not_aggregated", deltas)
+        run.rows_written += writer.rows_written
+
+    logger.info(f"Wrote {writer.rows_written} live stat changes.")
+
+    if (today.year, today.month) in months - aggregated_months:
+        process_afat_data_task(today.month, today.year)
+
+
+def write_fat_totals(writer, month, year, user_totals: dict, corp_totals: dict):
+    """Add the fat totals of a month to a stats writer."""
+    for (user_id, corporation_id, fleet_type_id), total in user_totals.items():
+        writer.add_user_stat(user_id, corporation_id, month, year, fleet_type_id, total)
+    for (corporation_id, fleet_type_id), total in corp_totals.items():
+        writer.add_corp_stat(corporation_id, month, year, fleet_type_id, total)
+
+
+def write_fatlink_totals(writer, month, year, fatlink_totals: dict, fleet_types: dict):
+    """Add the fatlink totals of a month to a stats writer."""
+    for (creator_id, fleet_type_name), total in fatlink_totals.items():
+        writer.add_creator_stat(
+            creator_id,
+            month,
+            year,
+            resolve_fleet_type(fleet_types, fleet_type_name, total),
+            total,
+        )
@@ -0,0 +1,120 @@
+# Standard Library
+from importlib import import_module
+
+# Django
+from django.apps import apps
+from django.test import TestCase
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCharacter, EveCorporationInfo
+
+# Pap Stats
+from papstats.accounts import rebuild_name_index, resolve_accounts
+from papstats.models import NormalizedCharacterName, UnknownAccount
+from papstats.tests.test_tasks import create_user_with_main
+
+
+class TestResolveAccounts(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for corporation_id in (2001, 2002):
+            EveCorporationInfo.objects.create(
+                corporation_id=corporation_id,
+                corporation_name=f"Corporation {corporation_id}",
+                corporation_ticker=str(corporation_id),
+                member_count=1,
+            )
+        cls.users = [
+            create_user_with_main(1000 + idx, 2001 + idx % 2)[0] for idx in range(10)
+        ]
+        UnknownAccount.objects.create(
+            account_name="Alt Account", user_id=cls.users[3].id
+        )
+        EveCharacter.objects.create(
+            character_id=1100,
+            character_name="Unowned",
+            corporation_id=2001,
+            corporation_name="Corporation 2001",
+            corporation_ticker="2001",
+        )
+
+    def test_should_resolve_accounts_with_a_constant_number_of_queries(self):
+        # given
+        names = [f"Character {1000 + idx}" for idx in range(10)]
+
+        # when
+        with self.assertNumQueries(8):
+            accounts = resolve_accounts(names + names + ["Alt Account", "Unowned"])
+
+        # then
+        self.assertEqual(len(accounts), 11)
+        self.assertEqual(accounts["Character 1001"], (self.users[1].id, 2002))
+        self.assertEqual(accounts["Alt Account"], (self.users[3].id, 2002))
+        self.assertNotIn("Unowned", accounts)
+
+    def test_should_create_unknown_accounts_for_unresolved_names(self):
+        # when
+        accounts = resolve_accounts(["Nobody", "Nobody", "", None, "Character 1000"])
+
+        # then
+        self.assertEqual(list(accounts), ["Character 1000"])
+        self.assertEqual(
+            set(UnknownAccount.objects.values_list("account_name", flat=True)),
+            {"Alt Account", "Nobody"},
+        )
+
+    def test_should_resolve_near_miss_names_by_normalized_name(self):
+        # given
+        names = ["  character   1001 ", "Charactér 1002", "alt ACCOUNT", "unowned"]
+
+        # when
+        accounts = resolve_accounts(names)
+
+        # then
+        self.assertEqual(
+            accounts,
+            {
+                "  character   1001 ": (self.users[1].id, 2002),
+                "Charactér 1002": (self.users[2].id, 2001),
+                "alt ACCOUNT": (self.users[3].id, 2002),
+            },
+        )
+        self.assertEqual(
+            list(UnknownAccount.objects.values_list("normalized_name", flat=True)),
+            ["alt account", "unowned"],
+        )
+
+    def test_should_not_resolve_ambiguous_normalized_names(self):
+        # given
+        create_user_with_main(1200, 2001)
+        EveCharacter.objects.filter(character_id=1200).update(
+            character_name="CHARACTER 1001"
+        )
+        rebuild_name_index()
+
+        # when
+        accounts = resolve_accounts(["character 1001"])
+
+        # then
+        self.assertEqual(accounts, {})
+
+    def test_should_fill_the_name_index_of_existing_data_when_migrating(self):
+        # given
+        NormalizedCharacterName.objects.all().delete()
+        UnknownAccount.objects.update(normalized_name="")
+        migration = import_module("papstats.migrations.0011_fill_normalized_names")
+
+        # when
+        migration.fill_name_index(apps, None)
+
+        # then
+        self.assertEqual(
+            NormalizedCharacterName.objects.count(), EveCharacter.objects.count()
+        )
+        self.assertEqual(
+            resolve_accounts(["character 1001", "alt ACCOUNT"]),
+            {
+                "character 1001": (self.users[1].id, 2002),
+                "alt ACCOUNT": (self.users[3].id, 2002),
+            },
+        )
@@ -0,0 +1,109 @@
+# Standard Library
+from unittest.mock import Mock
+
+# Django
+from django.test import TestCase
+
+# Pap Stats
+from papstats.chart_cache import (
+    MemoryLRU,
+    bump_data_versions,
+    get_cached_charts,
+    get_chart_months,
+    get_shared_cache,
+    memory_cache,
+)
+from papstats.models import MonthlyFleetType
+from papstats.writer import StatsWriter
+
+
+class TestMemoryLRU(TestCase):
+    def test_should_evict_least_recently_used_entries(self):
+        # given
+        cache = MemoryLRU(10)
+        cache.set("a", "aaaa", 4)
+        cache.set("b", "bbbb", 4)
+        cache.get("a")
+
+        # when
+        cache.set("c", "cccc", 4)
+
+        # then
+        self.assertEqual(cache.get("a"), "aaaa")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "cccc")
+        self.assertEqual(cache.size, 8)
+
+    def test_should_not_store_entries_larger_than_the_cache(self):
+        # given
+        cache = MemoryLRU(10)
+
+        # when
+        cache.set("a", "a" * 11, 11)
+
+        # then
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size, 0)
+
+
+class TestGetChartMonths(TestCase):
+    def test_should_return_the_months_shown_across_years(self):
+        # when
+        months = get_chart_months(2024, 2)
+
+        # then
+        self.assertEqual(
+            months,
+            [(2023, 9), (2023, 10), (2023, 11), (2023, 12), (2024, 1), (2024, 2)],
+        )
+
+
+class TestGetCachedCharts(TestCase):
+    def setUp(self):
+        memory_cache.clear()
+        get_shared_cache().clear()
+
+    def test_should_render_charts_once(self):
+        # given
+        render = Mock(return_value={"bar_chart": "png"})
+
+        # when
+        first = get_cached_charts("alliance", 1, 2024, 5, render)
+        memory_cache.clear()
+        second = get_cached_charts("alliance", 1, 2024, 5, render)
+
+        # then
+        self.assertEqual(first, {"bar_chart": "png"})
+        self.assertEqual(second, {"bar_chart": "png"})
+        render.assert_called_once()
+
+    def test_should_render_again_when_a_shown_month_changes(self):
+        # given
+        render = Mock(return_value={"bar_chart": "png"})
+        get_cached_charts("alliance", 1, 2024, 5, render)
+
+        # when
+        bump_data_versions([(2024, 1)])
+        get_cached_charts("alliance", 1, 2024, 5, render)
+        bump_data_versions([(2024, 6)])
+        get_cached_charts("alliance", 1, 2024, 5, render)
+
+        # then
+        self.assertEqual(render.call_count, 2)
+
+    def test_should_render_again_after_stats_are_written(self):
+        # given
+        fleet_type = MonthlyFleetType.objects.create(
+            name="CTA", source="afat", month=5, year=2024
+        )
+        render = Mock(return_value={"bar_chart": "png"})
+        get_cached_charts("corporation", 2001, 2024, 5, render)
+
+        # when
+        with self.captureOnCommitCallbacks(execute=True):
+            with StatsWriter() as writer:
+                writer.add_corp_stat(2001, 5, 2024, fleet_type.id, 1)
+        get_cached_charts("corporation", 2001, 2024, 5, render)
+
+        # then
+        self.assertEqual(render.call_count, 2)
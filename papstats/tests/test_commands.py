@@ -0,0 +1,235 @@
+# Standard Library
+import json
+from datetime import datetime
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
+
+# Third Party
+from afat.models import Fat, FatLink, FleetType
+
+# Django
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.timezone import make_aware
+
+# Pap Stats
+from papstats.aggregation import find_missing_months
+from papstats.models import AggregationRun, AggregationWatermark, MonthlyUserStats
+from papstats.tasks import process_afat_data_task, process_creator_stats
+from papstats.tests.test_tasks import create_fatlink, create_user_with_main
+
+
+class TestAggregateStatsBackfill(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        FleetType.objects.create(name="CTA")
+        cls.user, _ = create_user_with_main(1001, 2001)
+        for month in (3, 4, 5):
+            create_fatlink(
+                cls.user, "CTA", make_aware(datetime(2024, month, 10)), f"h{month}"
+            )
+
+    def test_should_find_months_with_data_missing_stats(self):
+        # given
+        process_afat_data_task(4, 2024)
+
+        # when
+        missing = find_missing_months([(2024, m) for m in range(2, 7)])
+
+        # then
+        self.assertEqual(missing["afat"], [(2024, 3), (2024, 5)])
+        self.assertEqual(missing["creator"], [(2024, 3), (2024, 5)])
+
+    def test_should_report_creators_only_months_as_missing_afat_stats(self):
+        # given
+        process_creator_stats(3, 2024)
+
+        # when
+        missing = find_missing_months([(2024, m) for m in (3, 4, 5)])
+
+        # then
+        self.assertEqual(missing["afat"], [(2024, 3), (2024, 4), (2024, 5)])
+        self.assertEqual(missing["creator"], [(2024, 4), (2024, 5)])
+
+    def test_should_mark_months_with_afat_stats_as_aggregated_when_migrating(self):
+        # given
+        Fat.objects.create(
+            character=self.user.profile.main_character,
+            fatlink=FatLink.objects.get(hash="h4"),
+        )
+        process_afat_data_task(4, 2024)
+        AggregationWatermark.objects.all().delete()
+        migration = import_module("papstats.migrations.0013_mark_aggregated_months")
+
+        # when
+        migration.mark_aggregated_months(apps, None)
+
+        # then
+        missing = find_missing_months([(2024, m) for m in (3, 4, 5)])
+        self.assertEqual(missing["afat"], [(2024, 3), (2024, 5)])
+
+    @patch("papstats.management.commands.aggregate_stats.chain")
+    def test_should_schedule_missing_months_in_parallel_chains(self, mock_chain):
+        # given
+        process_afat_data_task(4, 2024)
+        out = StringIO()
+
+        # when
+        call_command(
+            "aggregate_stats",
+            "--from",
+            "2024-01",
+            "--to",
+            "2024-06",
+            "--concurrency",
+            "2",
+            stdout=out,
+        )
+
+        # then
+        self.assertEqual(mock_chain.call_count, 2)
+        scheduled = [
+            signature.args
+            for call in mock_chain.call_args_list
+            for signature in call.args
+        ]
+        self.assertCountEqual(scheduled, [(3, 2024), (5, 2024)])
+        self.assertFalse(
+            any(
+                signature.kwargs["sharded"]
+                for call in mock_chain.call_args_list
+                for signature in call.args
+            )
+        )
+        self.assertIn("2 missing afat stats", out.getvalue())
+
+    @patch("papstats.management.commands.aggregate_stats.chain")
+    def test_should_not_schedule_anything_without_gaps(self, mock_chain):
+        # given
+        for month in (3, 4, 5):
+            process_afat_data_task(month, 2024)
+
+        # when
+        call_command(
+            "aggregate_stats", "--from", "2024-03", "--to", "2024-05", stdout=StringIO()
+        )
+
+        # then
+        mock_chain.assert_not_called()
+
+    def wait_for_backfill(self, runs, *args):
+        """Run a waiting backfill of March to May 2024 which records `runs` per poll"""
+        polls = iter(runs)
+
+        def record_runs(seconds):
+            for kind, month, status in next(polls, ()):
+                AggregationRun.objects.create(
+                    kind=kind, month=month, year=2024, status=status
+                )
+
+        out = StringIO()
+        with (
+            patch("papstats.management.commands.aggregate_stats.chain"),
+            patch(
+                "papstats.management.commands.aggregate_stats.time.sleep",
+                side_effect=record_runs,
+            ),
+        ):
+            call_command(
+                "aggregate_stats",
+                "--from",
+                "2024-03",
+                "--to",
+                "2024-05",
+                "--rebuild",
+                "--wait",
+                *args,
+                stdout=out,
+            )
+        return out.getvalue()
+
+    def test_should_wait_until_the_ledger_reports_the_months_done(self):
+        # given
+        for kind in ("afat", "creator"):
+            AggregationRun.objects.create(
+                kind=kind, month=4, year=2024, status="succeeded"
+            )
+        runs = [
+            [("afat", 3, "succeeded"), ("creator", 3, "succeeded")],
+            [("afat", 4, "succeeded")],
+            [("creator", 4, "succeeded")],
+            [("afat", 5, "succeeded"), ("creator", 5, "succeeded")],
+        ]
+
+        # when
+        out = self.wait_for_backfill(runs)
+
+        # then
+        self.assertIn("Backfill progress: 1/3 months aggregated", out)
+        self.assertIn("Backfill progress: 2/3 months aggregated", out)
+        self.assertIn("Backfill finished", out)
+
+    def test_should_stop_waiting_when_a_run_failed(self):
+        # given
+        runs = [[("afat", 3, "succeeded"), ("creator", 3, "failed")]]
+
+        # when/then
+        with self.assertRaisesMessage(CommandError, "Aggregation failed for 3/2024"):
+            self.wait_for_backfill(runs)
+
+    def test_should_stop_waiting_after_the_timeout(self):
+        # given
+        runs = [[("afat", 3, "succeeded"), ("creator", 3, "succeeded")]]
+
+        # when/then
+        with self.assertRaisesMessage(
+            CommandError, "Backfill did not finish within 0 seconds, 2 months"
+        ):
+            self.wait_for_backfill(runs, "--timeout", "0")
+
+
+class TestBenchmarkIngestion(TestCase):
+    def test_should_report_results_and_roll_back_generated_data(self):
+        # given
+        out = StringIO()
+
+        # when
+        call_command(
+            "benchmark_ingestion",
+            "--corporations=3",
+            "--users=20",
+            "--fatlinks=10",
+            "--fats=100",
+            "--unknown-accounts=2",
+            "--confirm",
+            stdout=out,
+        )
+
+        # then
+        results = json.loads(out.getvalue())
+        self.assertEqual(
+            set(results["results"]),
+            {
+                "process_afat_data_task",
+                "process_creator_stats",
+                "sharded_afat_aggregation",
+                "process_afat_incremental_task",
+                "process_csv_task",
+                "parallel_csv_import",
+            },
+        )
+        for result in results["results"].values():
+            self.assertGreater(result["queries"], 0)
+            self.assertIn("wall_time_seconds", result)
+            self.assertIn("peak_memory_bytes", result)
+        self.assertFalse(FatLink.objects.exists())
+        self.assertFalse(MonthlyUserStats.objects.exists())
+
+    def test_should_refuse_to_run_without_confirmation(self):
+        # when/then
+        with self.assertRaisesMessage(CommandError, "--confirm"):
+            call_command("benchmark_ingestion", "--users=2", stdout=StringIO())
+        self.assertFalse(FatLink.objects.exists())
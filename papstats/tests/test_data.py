@@ -0,0 +1,249 @@
+# Django
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
+
+# Pap Stats
+from papstats.data import get_alliance_data, get_corporation_data, get_fc_data
+from papstats.models import (
+    MonthlyCorpStats,
+    MonthlyCreatorStats,
+    MonthlyFleetType,
+    MonthlyUserStats,
+)
+from papstats.tests.test_tasks import ALLIANCE_ID, create_user_with_main
+
+
+def create_corporations(count, alliance):
+    return [
+        EveCorporationInfo.objects.create(
+            corporation_id=2001 + idx,
+            corporation_name=f"Corporation {2001 + idx}",
+            corporation_ticker=f"C{idx:02}",
+            member_count=1,
+            alliance=alliance,
+        )
+        for idx in range(count)
+    ]
+
+
+class TestGetAllianceData(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alliance = EveAllianceInfo.objects.create(
+            alliance_id=ALLIANCE_ID,
+            alliance_name="Alliance",
+            alliance_ticker="ALLY",
+            executor_corp_id=2001,
+        )
+        cls.fleet_types = {
+            (name, source): MonthlyFleetType.objects.create(
+                name=name, source=source, month=5, year=2024
+            )
+            for name, source in [("CTA", "afat"), ("Stratop", "afat"), ("CTA", "imp")]
+        }
+
+    def add_corp_stat(self, corporation_id, name, source, total):
+        MonthlyCorpStats.objects.create(
+            corporation_id=corporation_id,
+            month=5,
+            year=2024,
+            fleet_type=self.fleet_types[(name, source)],
+            total_fats=total,
+        )
+
+    def test_should_collect_corp_totals(self):
+        # given
+        create_corporations(2, self.alliance)
+        create_user_with_main(1001, 2001)
+        create_user_with_main(1002, 2001)
+        self.add_corp_stat(2001, "CTA", "afat", 4)
+        self.add_corp_stat(2001, "CTA", "imp", 2)
+        self.add_corp_stat(2002, "Stratop", "afat", 3)
+
+        # when
+        data = get_alliance_data(ALLIANCE_ID, 5, 2024)
+
+        # then
+        self.assertEqual(data["corporation_ids"], [2001, 2002])
+        self.assertEqual(data["tickers"], ["C00", "C01"])
+        self.assertEqual(
+            data["afat"],
+            {"C00": {"CTA": 4, "Stratop": 0}, "C01": {"CTA": 0, "Stratop": 3}},
+        )
+        self.assertEqual(data["imp"], {"C00": {"CTA": 2}, "C01": {"CTA": 0}})
+        self.assertEqual(
+            data["relative"],
+            {"C00": {"AFAT": 2.0, "IMP": 1.0}, "C01": {"AFAT": 0, "IMP": 0}},
+        )
+
+    def test_should_need_the_same_queries_for_any_number_of_corps(self):
+        # given
+        corporations = create_corporations(20, self.alliance)
+        for idx, corporation in enumerate(corporations):
+            create_user_with_main(1001 + idx, corporation.corporation_id)
+            self.add_corp_stat(corporation.corporation_id, "CTA", "afat", idx + 1)
+            self.add_corp_stat(corporation.corporation_id, "CTA", "imp", idx + 1)
+
+        # when
+        with self.assertNumQueries(4):
+            data = get_alliance_data(ALLIANCE_ID, 5, 2024)
+
+        # then
+        self.assertEqual(len(data["tickers"]), 20)
+        self.assertEqual(data["relative"]["C19"], {"AFAT": 20.0, "IMP": 20.0})
+
+    def test_should_return_none_without_stats(self):
+        # given
+        create_corporations(2, self.alliance)
+
+        # when
+        data = get_alliance_data(ALLIANCE_ID, 5, 2024)
+
+        # then
+        self.assertIsNone(data)
+
+
+class TestGetCorporationData(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fleet_types = {
+            (name, source): MonthlyFleetType.objects.create(
+                name=name, source=source, month=5, year=2024
+            )
+            for name, source in [("CTA", "afat"), ("Stratop", "afat"), ("CTA", "imp")]
+        }
+
+    def add_user_stat(self, user, name, source, total):
+        MonthlyUserStats.objects.create(
+            user_id=user.id,
+            corporation_id=2001,
+            month=5,
+            year=2024,
+            fleet_type=self.fleet_types[(name, source)],
+            total_fats=total,
+        )
+
+    def test_should_collect_member_totals(self):
+        # given
+        user_1, _ = create_user_with_main(1001, 2001)
+        create_user_with_main(1002, 2001)
+        create_user_with_main(1003, 2002)
+        self.add_user_stat(user_1, "CTA", "afat", 2)
+        self.add_user_stat(user_1, "Stratop", "afat", 1)
+        self.add_user_stat(user_1, "CTA", "imp", 4)
+
+        # when
+        data = get_corporation_data(2001, 5, 2024)
+
+        # then
+        self.assertEqual(data["names"], ["Character 1001", "Character 1002"])
+        self.assertEqual(
+            data["afat"],
+            {
+                "Character 1001": {"CTA": 2, "Stratop": 1},
+                "Character 1002": {"CTA": 0, "Stratop": 0},
+            },
+        )
+        self.assertEqual(
+            data["imp"],
+            {"Character 1001": {"IMP CTA": 4}, "Character 1002": {"IMP CTA": 0}},
+        )
+        self.assertEqual(
+            data["raw_data"],
+            [
+                {"name": "Character 1001", "afat_total": 3, "imp_total": 4},
+                {"name": "Character 1002", "afat_total": 0, "imp_total": 0},
+            ],
+        )
+
+    def test_should_need_the_same_queries_for_any_number_of_members(self):
+        # given
+        for idx in range(30):
+            user, _ = create_user_with_main(1001 + idx, 2001)
+            self.add_user_stat(user, "CTA", "afat", idx + 1)
+            self.add_user_stat(user, "CTA", "imp", 1)
+
+        # when
+        with self.assertNumQueries(4):
+            data = get_corporation_data(2001, 5, 2024)
+
+        # then
+        self.assertEqual(len(data["raw_data"]), 30)
+        self.assertEqual(
+            data["raw_data"][-1],
+            {"name": "Character 1030", "afat_total": 30, "imp_total": 1},
+        )
+
+    def test_should_return_none_without_stats(self):
+        # given
+        create_user_with_main(1001, 2001)
+
+        # when
+        data = get_corporation_data(2001, 5, 2024)
+
+        # then
+        self.assertIsNone(data)
+
+
+class TestGetFcData(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fleet_types = {
+            name: MonthlyFleetType.objects.create(
+                name=name, source="afat", month=5, year=2024
+            )
+            for name in ["CTA", "Stratop"]
+        }
+
+    def add_creator_stat(self, user, name, total):
+        MonthlyCreatorStats.objects.create(
+            creator_id=user.id,
+            month=5,
+            year=2024,
+            fleet_type=self.fleet_types[name],
+            total_created=total,
+        )
+
+    def test_should_pivot_fleets_per_creator_and_fleet_type(self):
+        # given
+        fc_1, _ = create_user_with_main(1001, 2001)
+        fc_2 = User.objects.create_user("fc_without_main")
+        self.add_creator_stat(fc_1, "CTA", 2)
+        self.add_creator_stat(fc_1, "Stratop", 1)
+        self.add_creator_stat(fc_2, "Stratop", 3)
+
+        # when
+        df = get_fc_data(5, 2024)
+
+        # then
+        self.assertEqual(
+            df.to_dict(orient="index"),
+            {
+                "Character 1001": {"CTA": 2, "Stratop": 1},
+                "fc_without_main": {"CTA": 0, "Stratop": 3},
+            },
+        )
+
+    def test_should_need_the_same_queries_for_any_number_of_creators(self):
+        # given
+        for idx in range(30):
+            user, _ = create_user_with_main(1001 + idx, 2001)
+            self.add_creator_stat(user, "CTA", idx + 1)
+
+        # when
+        with self.assertNumQueries(2):
+            df = get_fc_data(5, 2024)
+
+        # then
+        self.assertEqual(len(df), 30)
+        self.assertEqual(df.loc["Character 1030", "CTA"], 30)
+
+    def test_should_return_none_without_stats(self):
+        # when
+        df = get_fc_data(5, 2024)
+
+        # then
+        self.assertIsNone(df)
@@ -0,0 +1,55 @@
+# Standard Library
+from datetime import timedelta
+
+# Django
+from django.test import TestCase
+from django.utils.timezone import now
+
+# Pap Stats
+from papstats.ledger import RunRecorder
+from papstats.models import AggregationRun, MonthlyFleetType
+
+
+class TestRunRecorder(TestCase):
+    def test_should_record_counters_and_queries(self):
+        # when
+        with RunRecorder("imp", 5, 2024) as recorder:
+            MonthlyFleetType.objects.count()
+            MonthlyFleetType.objects.count()
+            recorder.rows_scanned += 3
+            recorder.skip("unknown_account", 2)
+            recorder.skip("no_account", 0)
+
+        # then
+        run = AggregationRun.objects.get()
+        self.assertEqual(run.status, "succeeded")
+        self.assertEqual(run.rows_scanned, 3)
+        self.assertEqual(run.skipped, {"unknown_account": 2})
+        self.assertEqual(run.query_count, 2)
+        self.assertIsNotNone(run.duration)
+
+    def test_should_record_failed_runs(self):
+        # when
+        with self.assertRaises(RuntimeError):
+            with RunRecorder("afat", 5, 2024):
+                raise RuntimeError
+
+        # then
+        self.assertEqual(AggregationRun.objects.get().status, "failed")
+
+    def test_should_reject_unknown_kinds(self):
+        # when/then
+        with self.assertRaisesMessage(ValueError, "Unknown aggregation run kind"):
+            RunRecorder("afta", 5, 2024)
+        self.assertFalse(AggregationRun.objects.exists())
+
+    def test_should_remove_old_runs(self):
+        # given
+        AggregationRun.objects.create(kind="afat", started=now() - timedelta(days=365))
+
+        # when
+        with RunRecorder("afat"):
+            pass
+
+        # then
+        self.assertEqual(AggregationRun.objects.count(), 1)
@@ -0,0 +1,238 @@
+# Standard Library
+from datetime import datetime
+from unittest.mock import patch
+
+# Third Party
+from afat.models import Fat, FatLink, FleetType
+from dateutil.relativedelta import relativedelta
+
+# Django
+from django.test import TestCase
+from django.utils.timezone import make_aware, now
+
+# Alliance Auth
+from allianceauth.utils.cache import get_redis_client
+
+# Pap Stats
+from papstats.aggregation import set_month_fence
+from papstats.live import LIVE_DELTAS_KEY, LIVE_FLUSH_KEY
+from papstats.models import (
+    AggregationRun,
+    MonthlyCorpStats,
+    MonthlyCreatorStats,
+    MonthlyFleetType,
+    MonthlyUserStats,
+)
+from papstats.tasks import flush_live_stats_task, process_afat_data_task
+from papstats.tests.test_tasks import create_fatlink, create_user_with_main
+from papstats.utils import get_current_year_month
+
+
+@patch("papstats.signals.flush_live_stats_task")
+@patch("papstats.signals.PAPSTATS_LIVE_STATS", True)
+class TestLiveStats(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        FleetType.objects.create(name="CTA")
+        cls.user_1, cls.char_1 = create_user_with_main(1001, 2001)
+        cls.user_2, cls.char_2 = create_user_with_main(1002, 2001)
+        cls.outsider, cls.char_3 = create_user_with_main(1003, 2002, alliance_id=9)
+        cls.created = make_aware(datetime(2024, 5, 10))
+        fatlink = create_fatlink(cls.user_1, "CTA", cls.created, "a")
+        Fat.objects.create(character=cls.char_1, fatlink=fatlink)
+
+    def setUp(self):
+        get_redis_client().delete(LIVE_DELTAS_KEY, LIVE_FLUSH_KEY)
+        process_afat_data_task(5, 2024)
+
+    def user_total(self, user):
+        return MonthlyUserStats.objects.get(
+            user_id=user.id, month=5, year=2024, fleet_type__name="CTA"
+        ).total_fats
+
+    def test_should_coalesce_new_fats_into_one_flush(self, mock_flush):
+        # given
+        with self.captureOnCommitCallbacks(execute=True):
+            fatlink = create_fatlink(self.user_2, "CTA", self.created, "b")
+            for character in (self.char_1, self.char_2, self.char_3):
+                Fat.objects.create(character=character, fatlink=fatlink)
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        mock_flush.apply_async.assert_called_once()
+        self.assertEqual(self.user_total(self.user_1), 2)
+        self.assertEqual(self.user_total(self.user_2), 1)
+        self.assertEqual(
+            MonthlyCorpStats.objects.get(corporation_id=2001, month=5).total_fats, 3
+        )
+        self.assertFalse(MonthlyCorpStats.objects.filter(corporation_id=2002).exists())
+        self.assertEqual(
+            MonthlyCreatorStats.objects.get(creator_id=self.user_2.id).total_created, 1
+        )
+
+    def test_should_decrement_deleted_fats(self, mock_flush):
+        # given
+        with self.captureOnCommitCallbacks(execute=True):
+            Fat.objects.filter(character=self.char_1).delete()
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        self.assertFalse(
+            MonthlyUserStats.objects.filter(user_id=self.user_1.id).exists()
+        )
+
+    def test_should_skip_fats_counted_by_the_aggregation(self, mock_flush):
+        # given
+        created = make_aware(datetime(2024, 6, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            fatlink = create_fatlink(self.user_1, "CTA", created, "e")
+            Fat.objects.create(character=self.char_1, fatlink=fatlink)
+        with patch("papstats.tasks.PAPSTATS_LIVE_STATS", True):
+            process_afat_data_task(6, 2024)
+        with self.captureOnCommitCallbacks(execute=True):
+            Fat.objects.create(character=self.char_2, fatlink=fatlink)
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        def total(user):
+            return MonthlyUserStats.objects.get(user_id=user.id, month=6).total_fats
+
+        self.assertEqual(total(self.user_1), 1)
+        self.assertEqual(total(self.user_2), 1)
+        self.assertEqual(
+            MonthlyCreatorStats.objects.get(
+                creator_id=self.user_1.id, month=6
+            ).total_created,
+            1,
+        )
+        self.assertEqual(
+            AggregationRun.objects.get(kind="live").skipped, {"already_counted": 2}
+        )
+
+    def test_should_take_deletions_from_the_corporation_counted_in(self, mock_flush):
+        # given
+        self.char_1.corporation_id = 2002
+        self.char_1.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Fat.objects.filter(character=self.char_1).delete()
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        self.assertFalse(
+            MonthlyUserStats.objects.filter(
+                user_id=self.user_1.id, total_fats__gt=0
+            ).exists()
+        )
+        self.assertFalse(
+            MonthlyCorpStats.objects.filter(month=5, total_fats__gt=0).exists()
+        )
+        self.assertFalse(MonthlyCorpStats.objects.filter(corporation_id=2002).exists())
+
+    def test_should_drop_deletions_of_fats_never_counted(self, mock_flush):
+        # given
+        fatlink = create_fatlink(self.user_1, "CTA", self.created, "f")
+        fat = Fat.objects.create(character=self.char_2, fatlink=fatlink)
+        with self.captureOnCommitCallbacks(execute=True):
+            fat.delete()
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        self.assertEqual(self.user_total(self.user_1), 1)
+        self.assertFalse(
+            MonthlyUserStats.objects.filter(user_id=self.user_2.id).exists()
+        )
+
+    def test_should_leave_fleet_type_changes_to_a_rebuild(self, mock_flush):
+        # given
+        FleetType.objects.create(name="Stratop")
+        with self.captureOnCommitCallbacks(execute=True):
+            FatLink.objects.update(fleet_type="Stratop")
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        self.assertEqual(self.user_total(self.user_1), 1)
+
+        # when
+        process_afat_data_task(5, 2024, rebuild=True)
+
+        # then
+        self.assertEqual(
+            MonthlyUserStats.objects.get(
+                user_id=self.user_1.id, fleet_type__name="Stratop"
+            ).total_fats,
+            1,
+        )
+
+    def test_should_aggregate_the_current_month_when_first_seen(self, mock_flush):
+        # given
+        with self.captureOnCommitCallbacks(execute=True):
+            fatlink = create_fatlink(self.user_1, "CTA", now(), "c")
+            Fat.objects.create(character=self.char_1, fatlink=fatlink)
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        today = now()
+        self.assertEqual(
+            MonthlyUserStats.objects.get(
+                user_id=self.user_1.id, month=today.month, year=today.year
+            ).total_fats,
+            1,
+        )
+
+    def test_should_do_nothing_without_live_stats(self, mock_flush):
+        # given
+        with patch("papstats.signals.PAPSTATS_LIVE_STATS", False):
+            with self.captureOnCommitCallbacks(execute=True):
+                fatlink = create_fatlink(self.user_1, "CTA", self.created, "d")
+                Fat.objects.create(character=self.char_2, fatlink=fatlink)
+
+        # when
+        flush_live_stats_task()
+
+        # then
+        mock_flush.apply_async.assert_not_called()
+        self.assertEqual(self.user_total(self.user_1), 1)
+        self.assertFalse(
+            MonthlyUserStats.objects.filter(user_id=self.user_2.id).exists()
+        )
+
+
+class TestGetCurrentYearMonth(TestCase):
+    def test_should_return_the_current_month_with_live_stats(self):
+        # when
+        with patch("papstats.utils.PAPSTATS_LIVE_STATS", True):
+            year, month = get_current_year_month()
+
+        # then
+        self.assertEqual((year, month), (now().year, now().month))
+
+    def test_should_return_the_current_month_once_it_is_aggregated(self):
+        # given
+        today = now()
+        last_month = today - relativedelta(months=1)
+        MonthlyFleetType.objects.create(
+            name="CTA", source="imp", month=today.month, year=today.year
+        )
+
+        # when
+        before = get_current_year_month()
+        set_month_fence("afat_fats", today.month, today.year, 0)
+        after = get_current_year_month()
+
+        # then
+        self.assertEqual(before, (last_month.year, last_month.month))
+        self.assertEqual(after, (today.year, today.month))
@@ -0,0 +1,166 @@
+# Standard Library
+from datetime import timedelta
+from unittest.mock import patch
+
+# Django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils.timezone import now
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCorporationInfo
+
+# Pap Stats
+from papstats.ledger import RunRecorder
+from papstats.models import CSVUpload, CSVUploadChunk, UnknownAccount
+from papstats.staging import (
+    build_import_report,
+    decode_lines,
+    iter_csv_lines,
+    read_imp_totals,
+    stage_csv,
+)
+from papstats.tests.test_tasks import create_user_with_main
+
+
+class TestStageCsv(TestCase):
+    @patch("papstats.staging.PAPSTATS_CSV_CHUNK_LINES", 2)
+    def test_should_stage_lines_in_chunks(self):
+        # given
+        csv_file = SimpleUploadedFile(
+            "imp.csv", b"Account,CTA\r\nA,1\r\nB,2\r\nC,3\r\nD,4\r\nE,5\r\n"
+        )
+
+        # when
+        upload = stage_csv(decode_lines(csv_file), 5, 2024)
+
+        # then
+        self.assertEqual(upload.header, "Account,CTA")
+        self.assertEqual(CSVUploadChunk.objects.filter(upload=upload).count(), 3)
+        self.assertEqual(
+            list(iter_csv_lines(upload)),
+            ["Account,CTA", "A,1", "B,2", "C,3", "D,4", "E,5"],
+        )
+
+    def test_should_remove_stale_uploads(self):
+        # given
+        stale = stage_csv(["Account"], 4, 2024)
+        CSVUpload.objects.filter(pk=stale.pk).update(created=now() - timedelta(days=2))
+
+        # when
+        upload = stage_csv(["Account", "A"], 5, 2024)
+
+        # then
+        self.assertEqual(list(CSVUpload.objects.all()), [upload])
+
+
+class TestReadImpTotals(TestCase):
+    @patch("papstats.staging.PAPSTATS_CSV_CHUNK_LINES", 2)
+    def test_should_melt_mapped_columns_to_totals(self):
+        # given
+        upload = stage_csv(
+            [
+                "Account, Stratop ,CTA,Skip,CTA",
+                "NA,2,1,5,3",
+                "Alt Account,0,1,5,x",
+                "NA,1,,,,9",
+                "",
+                "Nobody",
+            ],
+            5,
+            2024,
+        )
+
+        # when
+        with RunRecorder("imp", 5, 2024) as run:
+            totals, account_rows = read_imp_totals(
+                upload, {"Stratop": "Strategic", "CTA": "CTA"}, run
+            )
+
+        # then
+        self.assertEqual(
+            sorted(totals.itertuples(index=False, name=None)),
+            [("NA", "CTA", 3), ("NA", "Strategic", 3)],
+        )
+        self.assertEqual(account_rows, {"NA": 2, "Alt Account": 1, "Nobody": 1})
+        self.assertEqual(run.rows_scanned, 4)
+        self.assertEqual(run.skipped, {"invalid_value": 1})
+
+    def test_should_skip_files_without_account_column(self):
+        # given
+        upload = stage_csv(["Name,CTA", "A,1"], 5, 2024)
+
+        # when
+        with RunRecorder("imp", 5, 2024) as run:
+            totals, account_rows = read_imp_totals(upload, {"CTA": "CTA"}, run)
+
+        # then
+        self.assertTrue(totals.empty)
+        self.assertEqual(run.skipped, {"no_account": 1})
+
+
+class TestBuildImportReport(TestCase):
+    def test_should_report_without_writing(self):
+        # given
+        EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Corporation 2001",
+            corporation_ticker="2001",
+            member_count=1,
+        )
+        create_user_with_main(1001, 2001)
+        create_user_with_main(1002, 2001)
+        upload = stage_csv(
+            [
+                "Account,Stratop,CTA",
+                "Character 1001,2,1",
+                "Character 1002,x,3",
+                "Nobody,1,1",
+                "Nobody,0,2",
+            ],
+            5,
+            2024,
+        )
+
+        # when
+        report = build_import_report(upload, {"Stratop": "Strategic", "CTA": "CTA"})
+
+        # then
+        self.assertEqual(report.rows, 4)
+        self.assertEqual(report.column_totals, {"Stratop": 3, "CTA": 7})
+        self.assertEqual(report.invalid_cells, 1)
+        self.assertEqual(
+            report.invalid_examples,
+            [
+                {
+                    "row": 2,
+                    "account": "Character 1002",
+                    "column": "Stratop",
+                    "value": "x",
+                }
+            ],
+        )
+        self.assertEqual(report.unresolved_accounts, [("Nobody", 2)])
+        self.assertEqual(
+            report.projected_rows, {"MonthlyUserStats": 3, "MonthlyCorpStats": 2}
+        )
+        self.assertFalse(UnknownAccount.objects.exists())
+
+    def test_should_report_fractional_and_negative_counts_as_invalid(self):
+        # given
+        upload = stage_csv(
+            ["Account,CTA", "Nobody,2.7", "Nobody,-3", "Nobody,1e2", "Nobody, +4 "],
+            5,
+            2024,
+        )
+
+        # when
+        report = build_import_report(upload, {"CTA": "CTA"})
+
+        # then
+        self.assertEqual(report.column_totals, {"CTA": 4})
+        self.assertEqual(report.invalid_cells, 3)
+        self.assertEqual(
+            [example["value"] for example in report.invalid_examples],
+            ["2.7", "-3", "1e2"],
+        )
@@ -1,5 +1,78 @@
+# Standard Library
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+# Third Party
+from afat.models import Fat, FatLink, FleetType
+
 # Django
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils.timezone import make_aware, now
+
+# Alliance Auth
+from allianceauth.authentication.models import CharacterOwnership
+from allianceauth.eveonline.models import (
+    EveAllianceInfo,
+    EveCharacter,
+    EveCorporationInfo,
+)
+
+# Pap Stats
+from papstats.aggregation import lock_watermark
+from papstats.chart_cache import get_cached_charts, get_shared_cache, memory_cache
+from papstats.models import (
+    AggregationRun,
+    AggregationWatermark,
+    CSVUpload,
+    IMPImportRow,
+    MonthlyCorpStats,
+    MonthlyCreatorStats,
+    MonthlyFleetType,
+    MonthlyUserStats,
+    PendingIMPRow,
+    UnknownAccount,
+)
+from papstats.staging import stage_csv
+from papstats.tasks import (
+    apply_pending_imp_rows_task,
+    prerender_charts_task,
+    process_afat_data_task,
+    process_afat_incremental_task,
+    process_creator_stats,
+    process_csv_task,
+)
+
+ALLIANCE_ID = 3001
+
+
+def create_user_with_main(character_id, corporation_id, alliance_id=ALLIANCE_ID):
+    character = EveCharacter.objects.create(
+        character_id=character_id,
+        character_name=f"Character {character_id}",
+        corporation_id=corporation_id,
+        corporation_name=f"Corporation {corporation_id}",
+        corporation_ticker=str(corporation_id),
+        alliance_id=alliance_id,
+        alliance_name=f"Alliance {alliance_id}",
+    )
+    user = User.objects.create_user(f"user_{character_id}")
+    CharacterOwnership.objects.create(
+        character=character, user=user, owner_hash=f"hash_{character_id}"
+    )
+    user.profile.main_character = character
+    user.profile.save()
+    return user, character
+
+
+def create_fatlink(creator, fleet_type, created, fleet_hash):
+    return FatLink.objects.create(
+        creator=creator,
+        fleet="Fleet",
+        fleet_type=fleet_type,
+        created=created,
+        hash=fleet_hash,
+    )
 
 
 class TestTasks(TestCase):
@@ -10,3 +83,715 @@ class TestTasks(TestCase):
         ...
         # then
         ...
+
+
+class TestProcessAfatDataTask(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        FleetType.objects.create(name="CTA")
+        FleetType.objects.create(name="Stratop")
+        cls.user_1, cls.char_1 = create_user_with_main(1001, 2001)
+        cls.user_2, cls.char_2 = create_user_with_main(1002, 2001)
+        cls.user_3, cls.char_3 = create_user_with_main(1003, 2002)
+        cls.outsider, cls.char_4 = create_user_with_main(1004, 2003, alliance_id=9999)
+
+        created = make_aware(datetime(2024, 5, 10))
+        cta = create_fatlink(cls.user_1, "CTA", created, "a")
+        stratop = create_fatlink(cls.user_1, "Stratop", created, "b")
+        untyped = create_fatlink(cls.user_2, "", created, "c")
+        next_month = create_fatlink(
+            cls.user_1, "CTA", make_aware(datetime(2024, 6, 1)), "d"
+        )
+
+        for character in (cls.char_1, cls.char_2, cls.char_3, cls.char_4):
+            Fat.objects.create(character=character, fatlink=cta)
+        Fat.objects.create(character=cls.char_1, fatlink=stratop)
+        Fat.objects.create(character=cls.char_1, fatlink=untyped)
+        Fat.objects.create(character=cls.char_1, fatlink=next_month)
+
+    def user_total(self, user, fleet_type_name):
+        return MonthlyUserStats.objects.get(
+            user_id=user.id, month=5, year=2024, fleet_type__name=fleet_type_name
+        ).total_fats
+
+    def corp_total(self, corporation_id, fleet_type_name):
+        return MonthlyCorpStats.objects.get(
+            corporation_id=corporation_id,
+            month=5,
+            year=2024,
+            fleet_type__name=fleet_type_name,
+        ).total_fats
+
+    def test_should_aggregate_fats_per_user_and_corp(self):
+        # when
+        process_afat_data_task(5, 2024)
+
+        # then
+        self.assertEqual(self.user_total(self.user_1, "CTA"), 1)
+        self.assertEqual(self.user_total(self.user_1, "Stratop"), 1)
+        self.assertEqual(self.user_total(self.user_1, "Unknown"), 1)
+        self.assertEqual(self.user_total(self.user_2, "CTA"), 1)
+        self.assertEqual(self.user_total(self.user_3, "CTA"), 1)
+        self.assertEqual(self.corp_total(2001, "CTA"), 2)
+        self.assertEqual(self.corp_total(2002, "CTA"), 1)
+        self.assertEqual(MonthlyUserStats.objects.filter(month=5).count(), 5)
+
+    def test_should_not_count_a_month_twice_when_two_runs_interleave(self):
+        # given
+        interleaved = []
+
+        def lock_after_other_run(source):
+            # Another run of the month gets the lock first, after this one checked
+            # that the month has no stats yet
+            if not interleaved:
+                interleaved.append(source)
+                process_afat_data_task(5, 2024)
+            return lock_watermark(source)
+
+        # when
+        with patch("papstats.tasks.lock_watermark", side_effect=lock_after_other_run):
+            process_afat_data_task(5, 2024)
+
+        # then
+        self.assertEqual(interleaved, ["afat_fats"])
+        self.assertEqual(self.user_total(self.user_1, "CTA"), 1)
+        self.assertEqual(self.corp_total(2001, "CTA"), 2)
+        run = AggregationRun.objects.filter(kind="afat").order_by("pk").first()
+        self.assertIn("already_aggregated", run.skipped)
+
+    def test_should_skip_users_outside_the_alliance(self):
+        # when
+        process_afat_data_task(5, 2024)
+
+        # then
+        self.assertFalse(
+            MonthlyUserStats.objects.filter(user_id=self.outsider.id).exists()
+        )
+        self.assertFalse(MonthlyCorpStats.objects.filter(corporation_id=2003).exists())
+
+    def test_should_record_the_run_with_skip_reasons(self):
+        # given
+        orphan = EveCharacter.objects.create(
+            character_id=1005,
+            character_name="Character 1005",
+            corporation_id=2001,
+            corporation_name="Corporation 2001",
+            corporation_ticker="2001",
+        )
+        Fat.objects.create(character=orphan, fatlink=FatLink.objects.get(hash="a"))
+
+        # when
+        process_afat_data_task(5, 2024)
+
+        # then
+        run = AggregationRun.objects.get(kind="afat", month=5, year=2024)
+        self.assertEqual(run.status, "succeeded")
+        self.assertEqual(run.rows_scanned, 7)
+        self.assertEqual(run.rows_written, 9)
+        self.assertEqual(run.skipped["wrong_alliance"], 1)
+        self.assertEqual(run.skipped["no_ownership"], 1)
+        self.assertNotIn("no_main", run.skipped)
+        self.assertGreater(run.query_count, 0)
+        self.assertIsNotNone(run.finished)
+        self.assertTrue(AggregationRun.objects.filter(kind="creator").exists())
+
+    def test_should_create_fleet_types_for_the_month(self):
+        # when
+        process_afat_data_task(5, 2024)
+
+        # then
+        self.assertSetEqual(
+            set(
+                MonthlyFleetType.objects.filter(
+                    source="afat", month=5, year=2024
+                ).values_list("name", flat=True)
+            ),
+            {"CTA", "Stratop", "Unknown"},
+        )
+
+    def test_should_aggregate_the_same_stats_in_day_shards(self):
+        # when
+        with patch("papstats.tasks.chord") as mock_chord:
+            process_afat_data_task(5, 2024, sharded=True)
+
+        shards = list(mock_chord.call_args[0][0])
+        shard_results = [shard.apply().get() for shard in shards]
+        mock_chord.return_value.call_args[0][0].apply(args=(shard_results,))
+
+        # then
+        self.assertEqual(len(shards), 31)
+        self.assertEqual(self.user_total(self.user_1, "CTA"), 1)
+        self.assertEqual(self.user_total(self.user_1, "Unknown"), 1)
+        self.assertEqual(self.corp_total(2001, "CTA"), 2)
+        self.assertEqual(MonthlyUserStats.objects.filter(month=5).count(), 5)
+
+    def test_should_prerender_charts_once_committed(self):
+        # when
+        with (
+            patch("papstats.tasks.prerender_charts_task") as mock_task,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            process_afat_data_task(5, 2024)
+
+        # then
+        mock_task.delay.assert_called_once_with(5, 2024)
+
+    def test_should_not_process_month_twice(self):
+        # given
+        process_afat_data_task(5, 2024)
+
+        # when
+        process_afat_data_task(5, 2024)
+
+        # then
+        self.assertEqual(self.user_total(self.user_1, "CTA"), 1)
+
+
+class TestProcessCsvTask(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_1, cls.char_1 = create_user_with_main(1001, 2001)
+        cls.user_2, cls.char_2 = create_user_with_main(1002, 2001)
+        EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Corporation 2001",
+            corporation_ticker="2001",
+            member_count=2,
+        )
+        UnknownAccount.objects.create(account_name="Alt Account", user_id=cls.user_2.id)
+
+    def test_should_add_paps_per_user_and_corp(self):
+        # given
+        csv_data = [
+            "Account,Stratop,CTA,Skip",
+            "Character 1001,2,1,5",
+            "Alt Account,0,4,5",
+            "Nobody,3,3,3",
+            "Character 1001,1,,",
+        ]
+        upload = stage_csv(csv_data, 5, 2024)
+
+        # when
+        process_csv_task(upload.id, {"Stratop": "Strategic", "CTA": "CTA"})
+
+        # then
+        def user_total(user, name):
+            return MonthlyUserStats.objects.get(
+                user_id=user.id, fleet_type__name=name, fleet_type__source="imp"
+            ).total_fats
+
+        self.assertEqual(user_total(self.user_1, "Strategic"), 3)
+        self.assertEqual(user_total(self.user_1, "CTA"), 1)
+        self.assertEqual(user_total(self.user_2, "CTA"), 4)
+        self.assertEqual(
+            MonthlyCorpStats.objects.get(
+                corporation_id=2001, fleet_type__name="CTA"
+            ).total_fats,
+            5,
+        )
+        self.assertFalse(
+            MonthlyUserStats.objects.filter(fleet_type__name="Skip").exists()
+        )
+        self.assertTrue(UnknownAccount.objects.filter(account_name="Nobody").exists())
+        self.assertFalse(CSVUpload.objects.exists())
+
+    def test_should_import_nothing_without_known_accounts(self):
+        # given
+        upload = stage_csv(["Account,CTA", "Nobody,3"], 5, 2024)
+
+        # when
+        process_csv_task(upload.id, {"CTA": "CTA"})
+
+        # then
+        self.assertFalse(MonthlyUserStats.objects.exists())
+        self.assertEqual(
+            AggregationRun.objects.get(kind="imp").skipped, {"unknown_account": 1}
+        )
+
+    def test_should_apply_only_changes_of_a_corrected_file(self):
+        # given
+        mapping = {"Stratop": "Strategic", "CTA": "CTA"}
+        upload = stage_csv(
+            ["Account,Stratop,CTA", "Character 1001,2,1", "Alt Account,1,4"], 5, 2024
+        )
+        process_csv_task(upload.id, mapping)
+        corrected = stage_csv(
+            ["Account,Stratop,CTA", "Character 1001,2,3", "Alt Account,0,4"], 5, 2024
+        )
+
+        # when
+        process_csv_task(corrected.id, mapping)
+
+        # then
+        totals = {
+            (stat.user_id, stat.fleet_type.name): stat.total_fats
+            for stat in MonthlyUserStats.objects.select_related("fleet_type")
+        }
+        self.assertEqual(
+            totals,
+            {
+                (self.user_1.id, "Strategic"): 2,
+                (self.user_1.id, "CTA"): 3,
+                (self.user_2.id, "CTA"): 4,
+            },
+        )
+        self.assertEqual(
+            dict(
+                MonthlyCorpStats.objects.values_list("fleet_type__name", "total_fats")
+            ),
+            {"Strategic": 2, "CTA": 7},
+        )
+        run = AggregationRun.objects.filter(kind="imp").latest("started")
+        self.assertEqual(run.skipped, {"unchanged": 2})
+        self.assertEqual(IMPImportRow.objects.count(), 3)
+
+    def test_should_move_stats_of_a_main_which_changed_corporation(self):
+        # given
+        upload = stage_csv(["Account,CTA", "Character 1001,2"], 5, 2024)
+        process_csv_task(upload.id, {"CTA": "CTA"})
+        EveCorporationInfo.objects.create(
+            corporation_id=2002,
+            corporation_name="Corporation 2002",
+            corporation_ticker="2002",
+            member_count=1,
+        )
+        EveCharacter.objects.filter(pk=self.char_1.pk).update(corporation_id=2002)
+        corrected = stage_csv(["Account,CTA", "Character 1001,3"], 5, 2024)
+
+        # when
+        process_csv_task(corrected.id, {"CTA": "CTA"})
+
+        # then
+        self.assertEqual(
+            list(
+                MonthlyUserStats.objects.values_list(
+                    "user_id", "corporation_id", "total_fats"
+                )
+            ),
+            [(self.user_1.id, 2002, 3)],
+        )
+        self.assertEqual(
+            list(MonthlyCorpStats.objects.values_list("corporation_id", "total_fats")),
+            [(2002, 3)],
+        )
+
+    @patch("papstats.staging.PAPSTATS_CSV_CHUNK_LINES", 1)
+    def test_should_import_the_same_stats_in_parallel_parts(self):
+        # given
+        csv_data = [
+            "Account,Stratop,CTA",
+            "Character 1001,2,1",
+            "Alt Account,0,4",
+            "Nobody,3,x",
+            "Character 1001,1,",
+        ]
+        upload = stage_csv(csv_data, 5, 2024)
+
+        # when
+        with (
+            patch("papstats.staging.PAPSTATS_CSV_TASK_LINES", 2),
+            patch("papstats.tasks.chord") as mock_chord,
+        ):
+            process_csv_task(
+                upload.id, {"Stratop": "Strategic", "CTA": "CTA"}, parallel=True
+            )
+
+        parts = list(mock_chord.call_args[0][0])
+        part_results = [part.apply().get() for part in parts]
+        mock_chord.return_value.call_args[0][0].apply(args=(part_results,))
+
+        # then
+        self.assertEqual(len(parts), 2)
+        self.assertEqual(
+            dict(
+                MonthlyUserStats.objects.filter(user_id=self.user_1.id).values_list(
+                    "fleet_type__name", "total_fats"
+                )
+            ),
+            {"Strategic": 3, "CTA": 1},
+        )
+        self.assertEqual(
+            dict(
+                MonthlyCorpStats.objects.values_list("fleet_type__name", "total_fats")
+            ),
+            {"Strategic": 3, "CTA": 5},
+        )
+        run = AggregationRun.objects.get(kind="imp")
+        self.assertEqual(run.rows_scanned, 4)
+        self.assertEqual(run.skipped, {"invalid_value": 1, "unknown_account": 1})
+        self.assertFalse(CSVUpload.objects.exists())
+
+    def test_should_apply_pending_rows_once_an_account_is_mapped(self):
+        # given
+        mapping = {"Stratop": "Strategic", "CTA": "CTA"}
+        csv_data = ["Account,Stratop,CTA", "Character 1001,2,1", "Nobody,3,x"]
+        process_csv_task(stage_csv(csv_data, 5, 2024).id, mapping)
+        self.assertEqual(
+            list(PendingIMPRow.objects.values_list("account_name", "total")),
+            [("Nobody", 3)],
+        )
+        account = UnknownAccount.objects.get(account_name="Nobody")
+
+        # when
+        with (
+            patch("papstats.signals.apply_pending_imp_rows_task") as mock_task,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            account.user_id = self.user_2.id
+            account.save()
+        apply_pending_imp_rows_task("Nobody")
+
+        # then
+        mock_task.delay.assert_called_once_with("Nobody")
+        self.assertEqual(
+            MonthlyUserStats.objects.get(user_id=self.user_2.id).total_fats, 3
+        )
+        self.assertEqual(
+            MonthlyCorpStats.objects.get(fleet_type__name="Strategic").total_fats, 5
+        )
+        self.assertFalse(PendingIMPRow.objects.exists())
+
+        # A later import of the same file changes nothing
+        process_csv_task(stage_csv(csv_data, 5, 2024).id, mapping)
+        run = AggregationRun.objects.filter(kind="imp").latest("started")
+        self.assertEqual(run.rows_written, 0)
+        self.assertEqual(run.skipped, {"invalid_value": 1, "unchanged": 3})
+
+    def test_should_not_correct_months_imported_without_rows(self):
+        # given
+        fleet_type = MonthlyFleetType.objects.create(
+            name="CTA", source="imp", month=5, year=2024
+        )
+        MonthlyCorpStats.objects.create(
+            corporation_id=2001, month=5, year=2024, fleet_type=fleet_type, total_fats=9
+        )
+        upload = stage_csv(["Account,CTA", "Character 1001,1"], 5, 2024)
+
+        # when
+        process_csv_task(upload.id, {"CTA": "CTA"})
+
+        # then
+        self.assertEqual(MonthlyCorpStats.objects.get().total_fats, 9)
+        self.assertFalse(MonthlyUserStats.objects.exists())
+        self.assertFalse(CSVUpload.objects.exists())
+
+
+class TestProcessCreatorStats(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        FleetType.objects.create(name="CTA")
+        cls.user_1, _ = create_user_with_main(1001, 2001)
+        cls.user_2, _ = create_user_with_main(1002, 2001)
+        may = make_aware(datetime(2024, 5, 10))
+        june = make_aware(datetime(2024, 6, 10))
+        create_fatlink(cls.user_1, "CTA", may, "a")
+        create_fatlink(cls.user_1, "CTA", may, "b")
+        create_fatlink(cls.user_2, "", may, "c")
+        create_fatlink(cls.user_2, "CTA", june, "d")
+
+    def creator_total(self, user, month, fleet_type_name):
+        return MonthlyCreatorStats.objects.get(
+            creator_id=user.id, month=month, year=2024, fleet_type__name=fleet_type_name
+        ).total_created
+
+    def test_should_count_fatlinks_per_creator_and_fleet_type(self):
+        # when
+        process_creator_stats(5, 2024)
+
+        # then
+        self.assertEqual(self.creator_total(self.user_1, 5, "CTA"), 2)
+        self.assertEqual(self.creator_total(self.user_2, 5, "Unknown"), 1)
+        self.assertFalse(MonthlyCreatorStats.objects.filter(month=6).exists())
+
+    def test_should_only_create_the_fleet_types_of_the_fatlinks(self):
+        # given
+        FleetType.objects.create(name="Stratop")
+
+        # when
+        process_creator_stats(5, 2024, 7, 2024)
+
+        # then
+        self.assertEqual(
+            sorted(
+                MonthlyFleetType.objects.filter(source="afat").values_list(
+                    "month", "name"
+                )
+            ),
+            [(5, "CTA"), (5, "Unknown"), (6, "CTA")],
+        )
+
+    def test_should_refresh_a_range_of_months_without_double_counting(self):
+        # given
+        process_creator_stats(5, 2024)
+
+        # when
+        process_creator_stats(5, 2024, 6, 2024)
+
+        # then
+        self.assertEqual(self.creator_total(self.user_1, 5, "CTA"), 2)
+        self.assertEqual(self.creator_total(self.user_2, 6, "CTA"), 1)
+        self.assertEqual(MonthlyCreatorStats.objects.count(), 3)
+
+
+class TestProcessAfatIncrementalTask(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        FleetType.objects.create(name="CTA")
+        cls.user_1, cls.char_1 = create_user_with_main(1001, 2001)
+        cls.user_2, cls.char_2 = create_user_with_main(1002, 2001)
+        cls.today = now()
+        cls.fatlink = create_fatlink(cls.user_1, "CTA", cls.today, "a")
+        Fat.objects.create(character=cls.char_1, fatlink=cls.fatlink)
+
+    def user_total(self, user):
+        return MonthlyUserStats.objects.get(
+            user_id=user.id,
+            month=self.today.month,
+            year=self.today.year,
+            fleet_type__name="CTA",
+        ).total_fats
+
+    def test_should_aggregate_current_month_on_first_run(self):
+        # when
+        process_afat_incremental_task()
+
+        # then
+        self.assertEqual(self.user_total(self.user_1), 1)
+        self.assertEqual(
+            AggregationWatermark.objects.get(source="afat_fats").last_id,
+            Fat.objects.get().id,
+        )
+
+    def test_should_only_apply_new_fats_and_fatlinks(self):
+        # given
+        process_afat_incremental_task()
+        fatlink = create_fatlink(self.user_2, "CTA", self.today, "b")
+        Fat.objects.create(character=self.char_2, fatlink=self.fatlink)
+        Fat.objects.create(character=self.char_1, fatlink=fatlink)
+
+        # when
+        process_afat_incremental_task()
+        process_afat_incremental_task()
+
+        # then
+        self.assertEqual(self.user_total(self.user_1), 2)
+        self.assertEqual(self.user_total(self.user_2), 1)
+        self.assertEqual(
+            MonthlyCorpStats.objects.get(
+                corporation_id=2001, fleet_type__name="CTA"
+            ).total_fats,
+            3,
+        )
+        self.assertEqual(
+            MonthlyCreatorStats.objects.get(creator_id=self.user_2.id).total_created, 1
+        )
+
+    def test_should_not_treat_a_creators_only_month_as_aggregated(self):
+        # given
+        process_afat_incremental_task()
+        created = make_aware(datetime(2020, 1, 10))
+        Fat.objects.create(
+            character=self.char_1,
+            fatlink=create_fatlink(self.user_1, "CTA", created, "b"),
+        )
+        process_afat_incremental_task()
+        process_creator_stats(1, 2020)
+        Fat.objects.create(
+            character=self.char_2,
+            fatlink=create_fatlink(self.user_1, "CTA", created, "c"),
+        )
+
+        # when
+        process_afat_incremental_task()
+        process_afat_data_task(1, 2020)
+
+        # then
+        self.assertEqual(
+            dict(
+                MonthlyUserStats.objects.filter(year=2020).values_list(
+                    "user_id", "total_fats"
+                )
+            ),
+            {self.user_1.id: 1, self.user_2.id: 1},
+        )
+
+    def test_should_leave_months_not_aggregated_yet_to_the_monthly_run(self):
+        # given
+        process_afat_incremental_task()
+        old_fatlink = create_fatlink(
+            self.user_1, "CTA", make_aware(datetime(2020, 1, 10)), "b"
+        )
+        Fat.objects.create(character=self.char_1, fatlink=old_fatlink)
+
+        # when
+        process_afat_incremental_task()
+
+        # then
+        self.assertFalse(MonthlyUserStats.objects.filter(year=2020).exists())
+
+        # when
+        process_afat_data_task(1, 2020)
+
+        # then
+        self.assertEqual(
+            MonthlyUserStats.objects.get(user_id=self.user_1.id, year=2020).total_fats,
+            1,
+        )
+
+    def test_should_not_count_fats_twice_when_a_run_interleaves(self):
+        # given
+        fatlink = create_fatlink(
+            self.user_1, "CTA", make_aware(datetime(2024, 5, 10)), "b"
+        )
+        Fat.objects.create(character=self.char_1, fatlink=fatlink)
+        process_afat_incremental_task()
+        Fat.objects.create(character=self.char_2, fatlink=fatlink)
+        interleaved = []
+
+        def lock_after_incremental_run(source):
+            # An incremental run gets the lock first, after the month was counted
+            if not interleaved:
+                interleaved.append(source)
+                process_afat_incremental_task()
+            return lock_watermark(source)
+
+        # when
+        with patch(
+            "papstats.tasks.lock_watermark", side_effect=lock_after_incremental_run
+        ):
+            process_afat_data_task(5, 2024)
+
+        # then
+        self.assertEqual(interleaved, ["afat_fats"])
+        for user in (self.user_1, self.user_2):
+            self.assertEqual(
+                MonthlyUserStats.objects.get(user_id=user.id, year=2024).total_fats, 1
+            )
+
+
+class TestRebuildAfatMonth(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        FleetType.objects.create(name="CTA")
+        cls.user_1, cls.char_1 = create_user_with_main(1001, 2001)
+        cls.user_2, cls.char_2 = create_user_with_main(1002, 2001)
+        cls.fatlink = create_fatlink(
+            cls.user_1, "CTA", make_aware(datetime(2024, 5, 10)), "a"
+        )
+        Fat.objects.create(character=cls.char_1, fatlink=cls.fatlink)
+
+    def test_should_replace_month_with_rebuilt_stats(self):
+        # given
+        process_afat_data_task(5, 2024)
+        MonthlyUserStats.objects.update(total_fats=99)
+        Fat.objects.create(character=self.char_2, fatlink=self.fatlink)
+
+        # when
+        process_afat_data_task(5, 2024, rebuild=True)
+
+        # then
+        self.assertEqual(
+            MonthlyUserStats.objects.get(user_id=self.user_1.id).total_fats, 1
+        )
+        self.assertEqual(
+            MonthlyUserStats.objects.get(user_id=self.user_2.id).total_fats, 1
+        )
+        self.assertEqual(MonthlyCorpStats.objects.get().total_fats, 2)
+        self.assertEqual(MonthlyCreatorStats.objects.get().total_created, 1)
+
+    def test_should_keep_imp_stats_when_rebuilding(self):
+        # given
+        fleet_type = MonthlyFleetType.objects.create(
+            name="CTA", source="imp", month=5, year=2024
+        )
+        MonthlyCorpStats.objects.create(
+            corporation_id=2001, month=5, year=2024, fleet_type=fleet_type, total_fats=7
+        )
+
+        # when
+        process_afat_data_task(5, 2024, rebuild=True)
+
+        # then
+        self.assertEqual(
+            MonthlyCorpStats.objects.get(fleet_type__source="imp").total_fats, 7
+        )
+        self.assertEqual(
+            MonthlyCorpStats.objects.get(fleet_type__source="afat").total_fats, 1
+        )
+
+
+class TestPrerenderChartsTask(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        alliance = EveAllianceInfo.objects.create(
+            alliance_id=ALLIANCE_ID,
+            alliance_name="Alliance",
+            alliance_ticker="ALLY",
+            executor_corp_id=2001,
+        )
+        EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Corporation 2001",
+            corporation_ticker="2001",
+            member_count=1,
+            alliance=alliance,
+        )
+        user, _ = create_user_with_main(1001, 2001)
+        fleet_type = MonthlyFleetType.objects.create(
+            name="CTA", source="afat", month=5, year=2024
+        )
+        MonthlyUserStats.objects.create(
+            user_id=user.id,
+            corporation_id=2001,
+            month=5,
+            year=2024,
+            fleet_type=fleet_type,
+            total_fats=2,
+        )
+        MonthlyCorpStats.objects.create(
+            corporation_id=2001, month=5, year=2024, fleet_type=fleet_type, total_fats=2
+        )
+        MonthlyCreatorStats.objects.create(
+            creator_id=user.id,
+            month=5,
+            year=2024,
+            fleet_type=fleet_type,
+            total_created=1,
+        )
+
+    def setUp(self):
+        memory_cache.clear()
+        get_shared_cache().clear()
+
+    @patch("papstats.tasks.get_current_year_month", return_value=(2024, 7))
+    def test_should_render_the_charts_the_views_read(self, _):
+        # when
+        prerender_charts_task(5, 2024)
+
+        # then
+        render = Mock()
+        alliance_charts = get_cached_charts("alliance", ALLIANCE_ID, 2024, 5, render)
+        corporation_charts = get_cached_charts("corporation", 2001, 2024, 5, render)
+        fc_charts = get_cached_charts("fc", None, 2024, 5, render)
+        render.assert_not_called()
+        self.assertIn("afat_chart", alliance_charts)
+        self.assertEqual(
+            corporation_charts["raw_data"],
+            [{"name": "Character 1001", "afat_total": 2, "imp_total": 0}],
+        )
+        self.assertIn("bar_chart", fc_charts)
+        run = AggregationRun.objects.get(kind="charts")
+        self.assertEqual(run.rows_written, 5)
+
+    @patch("papstats.tasks.get_current_year_month", return_value=(2024, 7))
+    def test_should_render_the_later_months_showing_the_month(self, _):
+        # when
+        prerender_charts_task(5, 2024)
+
+        # then
+        render = Mock(return_value={})
+        for month in (6, 7):
+            get_cached_charts("fc", None, 2024, month, render)
+        render.assert_not_called()
+        get_cached_charts("fc", None, 2024, 8, render)
+        render.assert_called_once()
@@ -0,0 +1,35 @@
+# Django
+from django.test import TestCase
+
+# Pap Stats
+from papstats.models import MonthlyFleetType
+from papstats.utils import get_monthly_fleet_types, iter_months
+
+
+class TestGetMonthlyFleetTypes(TestCase):
+    def test_should_create_missing_and_keep_existing_fleet_types(self):
+        # given
+        existing = MonthlyFleetType.objects.create(
+            name="CTA", source="imp", month=5, year=2024
+        )
+        MonthlyFleetType.objects.create(name="CTA", source="afat", month=5, year=2024)
+
+        # when
+        with self.assertNumQueries(2):
+            fleet_types = get_monthly_fleet_types(
+                ["CTA", "Stratop", "Stratop"], "imp", 5, 2024
+            )
+
+        # then
+        self.assertEqual(fleet_types["CTA"], existing.id)
+        self.assertEqual(set(fleet_types), {"CTA", "Stratop"})
+        self.assertEqual(MonthlyFleetType.objects.filter(source="imp").count(), 2)
+
+
+class TestIterMonths(TestCase):
+    def test_should_iterate_over_year_boundaries(self):
+        # when
+        months = list(iter_months(2023, 11, 2024, 2))
+
+        # then
+        self.assertEqual(months, [(2023, 11), (2023, 12), (2024, 1), (2024, 2)])
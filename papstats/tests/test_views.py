@@ -0,0 +1,73 @@
+# Standard Library
+from datetime import datetime
+from unittest.mock import patch
+
+# Third Party
+import matplotlib.pyplot as plt
+
+# Django
+from django.test import TestCase
+
+# Alliance Auth
+from allianceauth.eveonline.models import EveCorporationInfo
+
+# Pap Stats
+from papstats.models import MonthlyCorpStats, MonthlyFleetType, MonthlyUserStats
+from papstats.tests.test_tasks import create_user_with_main
+from papstats.views.corporation import build_corporation_charts
+
+
+class TestBuildCorporationCharts(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.corporation = EveCorporationInfo.objects.create(
+            corporation_id=2001,
+            corporation_name="Corporation 2001",
+            corporation_ticker="2001",
+            member_count=1,
+        )
+        user, _ = create_user_with_main(1001, 2001)
+        for year, month, total in ((2023, 12, 3), (2024, 5, 2)):
+            fleet_type = MonthlyFleetType.objects.create(
+                name="CTA", source="afat", month=month, year=year
+            )
+            MonthlyUserStats.objects.create(
+                user_id=user.id,
+                corporation_id=2001,
+                month=month,
+                year=year,
+                fleet_type=fleet_type,
+                total_fats=total,
+            )
+            MonthlyCorpStats.objects.create(
+                corporation_id=2001,
+                month=month,
+                year=year,
+                fleet_type=fleet_type,
+                total_fats=total,
+            )
+
+    def test_should_show_the_months_up_to_the_selected_one(self):
+        # given
+        axes = []
+        original_subplots = plt.subplots
+
+        def subplots(*args, **kwargs):
+            fig, ax = original_subplots(*args, **kwargs)
+            axes.append(ax)
+            return fig, ax
+
+        # when
+        with (
+            patch("papstats.views.corporation.plt.subplots", side_effect=subplots),
+            patch("papstats.views.corporation.plt.clf"),
+        ):
+            build_corporation_charts(self.corporation, 2024, 5)
+
+        # then
+        line = axes[-1].get_lines()[0]
+        self.assertEqual(
+            list(line.get_xdata()),
+            [datetime(2023, 12, 1)] + [datetime(2024, m, 1) for m in range(1, 6)],
+        )
+        self.assertEqual(list(line.get_ydata()), [3, 0, 0, 0, 0, 2])
@@ -0,0 +1,108 @@
+# Django
+from django.test import TestCase
+
+# Pap Stats
+from papstats.models import (
+    MonthlyCorpStats,
+    MonthlyCreatorStats,
+    MonthlyFleetType,
+    MonthlyUserStats,
+)
+from papstats.writer import StatsWriter
+
+
+class TestStatsWriter(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fleet_type = MonthlyFleetType.objects.create(
+            name="CTA", source="afat", month=5, year=2024
+        )
+
+    def test_should_merge_increments_for_the_same_key(self):
+        # when
+        with StatsWriter() as writer:
+            writer.add_user_stat(1, 2001, 5, 2024, self.fleet_type.id, 2)
+            writer.add_user_stat(1, 2001, 5, 2024, self.fleet_type.id, 3)
+            writer.add_corp_stat(2001, 5, 2024, self.fleet_type.id, 5)
+
+        # then
+        self.assertEqual(
+            MonthlyUserStats.objects.get(
+                user_id=1, fleet_type=self.fleet_type
+            ).total_fats,
+            5,
+        )
+        self.assertEqual(
+            MonthlyCorpStats.objects.get(
+                corporation_id=2001, fleet_type=self.fleet_type
+            ).total_fats,
+            5,
+        )
+        self.assertEqual(writer.rows_written, 2)
+
+    def test_should_add_to_existing_rows(self):
+        # given
+        MonthlyCreatorStats.objects.create(
+            creator_id=1,
+            month=5,
+            year=2024,
+            fleet_type=self.fleet_type,
+            total_created=4,
+        )
+
+        # when
+        with StatsWriter() as writer:
+            writer.add_creator_stat(1, 5, 2024, self.fleet_type.id, 2)
+            writer.add_creator_stat(2, 5, 2024, self.fleet_type.id)
+
+        # then
+        self.assertEqual(
+            MonthlyCreatorStats.objects.get(creator_id=1).total_created,
+            6,
+        )
+        self.assertEqual(
+            MonthlyCreatorStats.objects.get(creator_id=2).total_created,
+            1,
+        )
+
+    def test_should_remove_rows_decremented_to_zero(self):
+        # given
+        for corporation_id in (2001, 2002):
+            MonthlyCorpStats.objects.create(
+                corporation_id=corporation_id,
+                month=5,
+                year=2024,
+                fleet_type=self.fleet_type,
+                total_fats=2,
+            )
+
+        # when
+        with StatsWriter() as writer:
+            writer.add_corp_stat(2001, 5, 2024, self.fleet_type.id, -3)
+            writer.add_corp_stat(2002, 5, 2024, self.fleet_type.id, -1)
+
+        # then
+        self.assertEqual(
+            list(MonthlyCorpStats.objects.values_list("corporation_id", "total_fats")),
+            [(2002, 1)],
+        )
+
+    def test_should_write_in_batches(self):
+        # when
+        with StatsWriter(batch_size=2) as writer:
+            for user_id in range(5):
+                writer.add_user_stat(user_id, 2001, 5, 2024, self.fleet_type.id)
+
+        # then
+        self.assertEqual(MonthlyUserStats.objects.count(), 5)
+        self.assertEqual(writer.rows_written, 5)
+
+    def test_should_not_write_when_exiting_with_an_error(self):
+        # when
+        with self.assertRaises(RuntimeError):
+            with StatsWriter() as writer:
+                writer.add_corp_stat(2001, 5, 2024, self.fleet_type.id)
+                raise RuntimeError
+
+        # then
+        self.assertFalse(MonthlyCorpStats.objects.exists())
@@ -9,8 +9,16 @@ from django.utils.timezone import now
 from allianceauth.eveonline.models import EveCorporationInfo
 from allianceauth.services.hooks import get_extension_logger
 
+# Pap Stats
+from papstats.app_settings import PAPSTATS_LIVE_STATS
+from papstats.models import AggregationWatermark, MonthlyFleetType
+
 logger = get_extension_logger(__name__)
 
+# Sources of the incremental aggregation watermarks
+FATS_WATERMARK = "afat_fats"
+FATLINKS_WATERMARK = "afat_fatlinks"
+
 
 def get_visible_corps(user: User):
     """
@@ -40,18 +48,23 @@ def get_visible_corps(user: User):
 
 
 def get_current_year_month():
-    """Returns the current year and month as integers."""
-    # we currently don't show live data so need everything to go backwards 1 month
-    today = now() - relativedelta(months=1)
+    """Returns the latest year and month with up to date stats as integers."""
+    today = now()
+    # the current month is kept up to date by live stats or, once it has been
+    # aggregated, by the incremental aggregation. Otherwise it is only
+    # aggregated once it is over, so everything needs to go backwards 1 month
+    if not PAPSTATS_LIVE_STATS and not get_aggregated_months(
+        {(today.year, today.month)}
+    ):
+        today -= relativedelta(months=1)
     return today.year, today.month
 
 
 def get_date_context(year: int, month: int):
     """Generates date-related context for menus and data navigation."""
-    if year is None or month is None:
-        year, month = get_current_year_month()
-
     current_year, current_month = get_current_year_month()
+    if year is None or month is None:
+        year, month = current_year, current_month
 
     return {
         "month": month,
@@ -67,3 +80,54 @@ def get_date_context(year: int, month: int):
         "year_prev": year - 1,
         "year_next": year + 1,
     }
+
+
+def iter_months(start_year: int, start_month: int, end_year: int, end_month: int):
+    """Yields (year, month) tuples from start to end, both inclusive."""
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        yield year, month
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+
+
+def get_monthly_fleet_types(names, source: str, month: int, year: int) -> dict:
+    """
+    Make sure the fleet types of a source exist for a month
+    and return all of the month's fleet types of that source
+    as a mapping of name to MonthlyFleetType id.
+    """
+    MonthlyFleetType.objects.bulk_create(
+        [
+            MonthlyFleetType(name=name, source=source, month=month, year=year)
+            for name in set(names)
+        ],
+        ignore_conflicts=True,
+    )
+    return dict(
+        MonthlyFleetType.objects.filter(
+            source=source, month=month, year=year
+        ).values_list("name", "id")
+    )
+
+
+def get_fence_source(source: str, month: int, year: int) -> str:
+    """Returns the watermark source of a month's fence."""
+    return f"{source}:{year}-{month:02}"
+
+
+def get_aggregated_months(months) -> set:
+    """
+    Returns those of the given (year, month) tuples which AFAT data has been aggregated for.
+
+    The full aggregation of a month writes its fats fence together with its stats.
+    """
+    sources = {
+        get_fence_source(FATS_WATERMARK, month, year): (year, month)
+        for year, month in months
+    }
+    return {
+        sources[source]
+        for source in AggregationWatermark.objects.filter(
+            source__in=sources
+        ).values_list("source", flat=True)
+    }
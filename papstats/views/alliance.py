@@ -18,7 +18,6 @@ import numpy as np
 import pandas as pd
 
 # Django
-from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User
 from django.core.exceptions import BadRequest, PermissionDenied
@@ -27,12 +26,13 @@ from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 
 # Alliance Auth
-from allianceauth.authentication.models import UserProfile
-from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
+from allianceauth.eveonline.models import EveAllianceInfo
 from allianceauth.services.hooks import get_extension_logger
 
 # Pap Stats
-from papstats.models import MonthlyCorpStats, MonthlyFleetType
+from papstats.chart_cache import get_cached_charts
+from papstats.data import get_alliance_data
+from papstats.models import MonthlyCorpStats
 from papstats.utils import get_date_context, get_visible_corps
 
 logger = get_extension_logger(__name__)
@@ -79,120 +79,33 @@ def alliance_data(
     if not request.headers.get("HX-Request"):
         raise PermissionDenied("No Direct Access!")
 
-    month_name = calendar.month_name[month]
-    try:
-        all_corps = (
-            EveCorporationInfo.objects.filter(alliance__alliance_id=allyid)
-            .exclude(corporation_id__in=settings.STATS_IGNORE_CORPS)
-            .order_by("corporation_ticker")
-        )
-        corp_names = list(all_corps.values_list("corporation_ticker", flat=True))
-        stats = MonthlyCorpStats.objects.filter(
-            month=month,
-            year=year,
-            corporation_id__in=all_corps.values_list("corporation_id", flat=True),
-        ).select_related("fleet_type")
-    except EveCorporationInfo.DoesNotExist:
-        return render(
-            request,
-            "papstats/alliance_data.html",
-            {"staterror": "Could not find corporations"},
-        )
-    except MonthlyCorpStats.DoesNotExist:
-        return render(
-            request,
-            "papstats/alliance_data.html",
-            {"staterror": "No stats for selected alliance or date"},
-        )
-
-    if stats.count() == 0:
-        return render(
-            request,
-            "papstats/alliance_data.html",
-            {"staterror": "No stats for selected alliance or date"},
-        )
-
-    fleet_types = MonthlyFleetType.objects.filter(month=month, year=year)
-    logger.info(
-        "Available Fleet Types: %s", list(fleet_types.values("id", "name", "source"))
-    )
-
-    logger.info(
-        "All Corps IDs: %s", list(all_corps.values_list("corporation_id", flat=True))
-    )
-    logger.info("Stats Query Result: %s", list(stats))
-
-    logger.info(
-        "Stats Query Corporations (Full): %s",
-        list(stats.values_list("corporation_id", flat=True)),
+    context = get_cached_charts(
+        "alliance",
+        allyid,
+        year,
+        month,
+        lambda: build_alliance_charts(allyid, year, month),
     )
+    return render(request, "papstats/alliance_data.html", context)
 
-    logger.info("Stats Query SQL: %s", str(stats.query))
-
-    data_afat = {}
-    for corp in corp_names:
-        logger.info("Corp: %s", corp)
-        data_afat[corp] = {
-            ft.name: 0
-            for ft in MonthlyFleetType.objects.filter(
-                month=month, year=year, source="afat"
-            )
-        }
-    data_imp = {
-        corp: {
-            ft.name: 0
-            for ft in MonthlyFleetType.objects.filter(
-                month=month, year=year, source="imp"
-            )
-        }
-        for corp in corp_names
-    }
 
-    relative_data = {corp: {"AFAT": 0, "IMP": 0} for corp in corp_names}
+def build_alliance_charts(allyid: int, year: int, month: int) -> dict:
+    """Render the alliance charts of a month."""
+    month_name = calendar.month_name[month]
+    alliance_data = get_alliance_data(allyid, month, year)
+    if alliance_data is None:
+        return {"staterror": "No stats for selected alliance or date"}
+    corp_names = alliance_data["tickers"]
 
-    for stat in stats:
-        logger.info(
-            "Fleet Type Data - Corp: %s, Fleet Type: %s, Source: %s",
-            stat.get_corporation().corporation_ticker,
-            stat.fleet_type.name,
-            stat.fleet_type.source,
-        )
-        corp_ticker = stat.get_corporation().corporation_ticker
-        # total_mains = CorpStats.objects.get(corp=stat.get_corporation().pk).main_count
-        corp_members = UserProfile.objects.filter(
-            main_character__corporation_id=stat.get_corporation().corporation_id
-        ).order_by("main_character__character_name")
-        total_mains = corp_members.count()
-
-        if stat.fleet_type.source == "afat":
-            if corp_ticker in data_afat:  # Check if corp_ticker is in data_afat
-                data_afat[corp_ticker][stat.fleet_type.name] += stat.total_fats
-                if total_mains > 0:
-                    relative_data[corp_ticker]["AFAT"] += stat.total_fats / total_mains
-            else:
-                logger.warning(
-                    f"Ticker {corp_ticker} not found in data_afat, skipping stat."
-                )
-
-        elif stat.fleet_type.source == "imp":
-            if corp_ticker in data_imp:  # Check if corp_ticker is in data_imp
-                data_imp[corp_ticker][stat.fleet_type.name] += stat.total_fats
-                if total_mains > 0:
-                    relative_data[corp_ticker]["IMP"] += stat.total_fats / total_mains
-            else:
-                logger.warning(
-                    f"Ticker {corp_ticker} not found in data_imp, skipping stat."
-                )
-
-    df_afat = pd.DataFrame(data_afat).T.fillna(0)
-    df_imp = pd.DataFrame(data_imp).T.fillna(0)
+    df_afat = pd.DataFrame(alliance_data["afat"]).T.fillna(0)
+    df_imp = pd.DataFrame(alliance_data["imp"]).T.fillna(0)
 
     # Filter out columns with zero sums
     df_afat = df_afat.loc[:, (df_afat.sum(axis=0) != 0)]
     df_imp = df_imp.loc[:, (df_imp.sum(axis=0) != 0)]
 
     # Relative participation chart
-    df_relative = pd.DataFrame(relative_data).T.fillna(0)
+    df_relative = pd.DataFrame(alliance_data["relative"]).T.fillna(0)
 
     x = np.arange(len(corp_names))
 
@@ -397,7 +310,7 @@ def alliance_data(
     # Line chart for month over month AFAT data
     afat_stats = (
         MonthlyCorpStats.objects.filter(
-            corporation_id__in=all_corps.values_list("corporation_id", flat=True),
+            corporation_id__in=alliance_data["corporation_ids"],
             fleet_type__source="afat",
             year__in=[start_year, year],
             month__in=[date[1] for date in date_range],
@@ -514,7 +427,7 @@ def alliance_data(
     plt.clf()
     plt.close(fig)
 
-    context = {
+    return {
         "afat_chart": afat_chart,
         "imp_chart": imp_chart,
         "combined_chart": combined_chart,
@@ -522,4 +435,3 @@ def alliance_data(
         "line_chart": line_chart,
         "relative_chart": relative_chart,
     }
-    return render(request, "papstats/alliance_data.html", context)
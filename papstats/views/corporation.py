@@ -4,7 +4,6 @@
 # Standard Library
 import base64
 import calendar
-from collections import defaultdict
 from datetime import datetime
 from io import BytesIO
 
@@ -28,12 +27,13 @@ from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 
 # Alliance Auth
-from allianceauth.authentication.models import UserProfile
 from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
 from allianceauth.services.hooks import get_extension_logger
 
 # Pap Stats
-from papstats.models import MonthlyCorpStats, MonthlyFleetType, MonthlyUserStats
+from papstats.chart_cache import get_cached_charts
+from papstats.data import get_corporation_data
+from papstats.models import MonthlyCorpStats
 from papstats.utils import get_date_context, get_visible_corps
 
 logger = get_extension_logger(__name__)
@@ -88,55 +88,27 @@ def corporation_data(
             {"staterror": "Could not find corp"},
         )
 
-    corp_members = UserProfile.objects.filter(
-        main_character__corporation_id=corp.corporation_id
-    ).order_by("main_character__character_name")
-
-    users = [member.main_character.character_name for member in corp_members]
-    user_ids = [member.user_id for member in corp_members]
-
-    stats = MonthlyUserStats.objects.filter(
-        user_id__in=user_ids, month=month, year=year
-    ).select_related("fleet_type")
-
-    if stats.count() == 0:
-        return render(
-            request,
-            "papstats/corporation_data.html",
-            {"staterror": "No stats for selected corp or date"},
-        )
+    context = get_cached_charts(
+        "corporation",
+        corp.corporation_id,
+        year,
+        month,
+        lambda: build_corporation_charts(corp, year, month),
+    )
+    return render(request, "papstats/corporation_data.html", context)
 
-    data_afat = {
-        user: {
-            ft.name: 0
-            for ft in MonthlyFleetType.objects.filter(
-                source="afat", month=month, year=year
-            )
-        }
-        for user in users
-    }
-    data_imp = {
-        user: {
-            f"IMP {ft.name}": 0
-            for ft in MonthlyFleetType.objects.filter(
-                source="imp", month=month, year=year
-            )
-        }
-        for user in users
-    }
 
-    for stat in stats:
-        character_name = stat.get_user().profile.main_character.character_name
-        if stat.fleet_type.source == "afat":
-            data_afat[character_name][stat.fleet_type.name] += stat.total_fats
-        elif stat.fleet_type.source == "imp":
-            data_imp[character_name][f"IMP {stat.fleet_type.name}"] += stat.total_fats
+def build_corporation_charts(corp: EveCorporationInfo, year: int, month: int) -> dict:
+    """Render the charts and raw data of a corporation for a month."""
+    corporation_data = get_corporation_data(corp.corporation_id, month, year)
+    if corporation_data is None:
+        return {"staterror": "No stats for selected corp or date"}
+    users = corporation_data["names"]
 
-    df_afat = pd.DataFrame(data_afat).T
-    df_imp = pd.DataFrame(data_imp).T
+    df_afat = pd.DataFrame(corporation_data["afat"]).T
+    df_imp = pd.DataFrame(corporation_data["imp"]).T
     df_afat = df_afat.loc[:, (df_afat != 0).any(axis=0)]
     df_imp = df_imp.loc[:, (df_imp != 0).any(axis=0)]
-    logger.info(df_afat)
     if not df_afat.empty or not df_imp.empty:
         fig, ax = plt.subplots(figsize=(12, 8))
         fig.patch.set_facecolor(CHART_BACKGROUND_COLOR)
@@ -275,7 +247,7 @@ def corporation_data(
     )
 
     start_month = (month - months_to_display) % 12 or 12
-    start_year = year if month >= months_to_display else year - 1
+    start_year = year if month > months_to_display else year - 1
     date_range = [
         (start_year + (start_month + i - 1) // 12, (start_month + i - 1) % 12 + 1)
         for i in range(months_to_display + 1)
@@ -364,59 +336,8 @@ def corporation_data(
     plt.clf()
     plt.close()
 
-    # RAW DATA
-    raw_data = {}
-    user_data = []
-
-    main_to_data = defaultdict(lambda: {"afat_total": 0, "imp_total": 0})
-
-    for member in corp_members:
-        user_id = member.user_id
-        main_character = member.main_character.character_name
-
-        afat_total = (
-            MonthlyUserStats.objects.filter(
-                user_id=user_id, fleet_type__source="afat", month=month, year=year
-            ).aggregate(total=Sum("total_fats"))["total"]
-            or 0
-        )
-
-        imp_total = (
-            MonthlyUserStats.objects.filter(
-                user_id=user_id, fleet_type__source="imp", month=month, year=year
-            ).aggregate(total=Sum("total_fats"))["total"]
-            or 0
-        )
-
-        main_to_data[main_character]["afat_total"] += afat_total
-        main_to_data[main_character]["imp_total"] += imp_total
-
-        # Collect user data for top 5 calculations
-        user_data.append(
-            {
-                "name": main_character,
-                "afat_total": afat_total,
-                "combined_total": afat_total + imp_total,
-            }
-        )
-
-    corp_data = sorted(
-        [
-            {
-                "name": main,
-                "afat_total": data["afat_total"],
-                "imp_total": data["imp_total"],
-            }
-            for main, data in main_to_data.items()
-        ],
-        key=lambda x: x["name"],
-    )
-    raw_data = corp_data
-
-    context = {
+    return {
         "bar_chart": bar_chart,
         "line_chart": line_chart,
-        "raw_data": raw_data,
+        "raw_data": corporation_data["raw_data"],
     }
-
-    return render(request, "papstats/corporation_data.html", context)
@@ -9,7 +9,6 @@ from io import BytesIO
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
-import pandas as pd
 
 # Django
 from django.contrib.auth.decorators import login_required, permission_required
@@ -23,7 +22,9 @@ from django.shortcuts import render
 from allianceauth.services.hooks import get_extension_logger
 
 # Pap Stats
-from papstats.models import MonthlyCreatorStats, MonthlyFleetType
+from papstats.chart_cache import get_cached_charts
+from papstats.data import get_fc_data
+from papstats.models import MonthlyCreatorStats
 from papstats.utils import get_date_context, get_visible_corps
 
 logger = get_extension_logger(__name__)
@@ -56,44 +57,17 @@ def fc_data(request: HttpRequest, year: int, month: int) -> HttpResponse:
     if not request.headers.get("HX-Request"):
         raise PermissionDenied("No Direct Access!")
 
-        # Query data from MonthlyCreatorStats
-    stats = MonthlyCreatorStats.objects.filter(month=month, year=year)
-    fleet_types = MonthlyFleetType.objects.filter(source="afat", month=month, year=year)
-    if stats.count() == 0:
-        return render(
-            request,
-            "papstats/fc_data.html",
-            {"staterror": "No stats for selected corp or date"},
-        )
-    creators = set()
-    for stat in stats:
-        # Log the ID of the stat
-        logger.info(f"Logging stat ID: {stat.creator_id}")
-
-        # Check if main_character exists; otherwise, use username
-        creator_name = (
-            stat.get_creator().profile.main_character.character_name
-            if stat.get_creator().profile.main_character
-            else stat.get_creator().username
-        )
-        creators.add(creator_name)
-
-    creators = list(creators)
-    data = {fleet_type.name: [0] * len(creators) for fleet_type in fleet_types}
-    for stat in stats:
-        if stat.fleet_type.source == "afat":
-            # Check if main_character exists; otherwise, use username
-            creator_name = (
-                stat.get_creator().profile.main_character.character_name
-                if stat.get_creator().profile.main_character
-                else stat.get_creator().username
-            )
-            data[stat.fleet_type.name][
-                creators.index(creator_name)
-            ] += stat.total_created
+    context = get_cached_charts(
+        "fc", None, year, month, lambda: build_fc_charts(year, month)
+    )
+    return render(request, "papstats/fc_data.html", context)
+
 
-    df = pd.DataFrame(data, index=creators)
-    df = df.sort_index()
+def build_fc_charts(year: int, month: int) -> dict:
+    """Render the fleet commander charts of a month."""
+    df = get_fc_data(month, year)
+    if df is None:
+        return {"staterror": "No stats for selected corp or date"}
 
     # Initialize base64 strings
     image_base64 = ""
@@ -108,10 +82,10 @@ def fc_data(request: HttpRequest, year: int, month: int) -> HttpResponse:
             colormap = plt.cm.viridis
             color_range = colormap(np.linspace(0, 1, len(df.columns)))
 
-            plt.figure(figsize=(12, 8))
-            ax = df.plot(kind="bar", stacked=True, figsize=(12, 8), color=color_range)
+            fig, ax = plt.subplots(figsize=(12, 8))
+            df.plot(kind="bar", stacked=True, ax=ax, color=color_range)
             ax.set_facecolor(CHART_BACKGROUND_COLOR)
-            plt.gcf().set_facecolor(CHART_BACKGROUND_COLOR)
+            fig.set_facecolor(CHART_BACKGROUND_COLOR)
             plt.ylabel("Total Created", color="lightgray")
             plt.title(
                 f"Fleet Types By FC for {calendar.month_name[month]} {year}",
@@ -138,16 +112,11 @@ def fc_data(request: HttpRequest, year: int, month: int) -> HttpResponse:
             image_base64 = base64.b64encode(buf.read()).decode("utf-8")
             buf.close()
             plt.clf()
-            plt.close()
+            plt.close(fig)
 
-        total_created_by_fleet = (
-            stats.filter(fleet_type__source="afat")
-            .values("fleet_type__name")
-            .annotate(total_created=Sum("total_created"))
-            .order_by("fleet_type__name")
-        )
-        fleet_types = [item["fleet_type__name"] for item in total_created_by_fleet]
-        proportions = [item["total_created"] for item in total_created_by_fleet]
+        total_created_by_fleet = df.sum(axis=0).sort_index()
+        fleet_types = list(total_created_by_fleet.index)
+        proportions = list(total_created_by_fleet.values)
 
         if proportions:
             pie_color_range = colormap(np.linspace(0, 1, len(fleet_types)))
@@ -192,7 +161,7 @@ def fc_data(request: HttpRequest, year: int, month: int) -> HttpResponse:
 
     # Line chart for total fleets of each type each month
     start_month = (month - months_to_display) % 12 or 12
-    start_year = year if month >= months_to_display else year - 1
+    start_year = year if month > months_to_display else year - 1
     date_range = [
         (start_year + (start_month + i - 1) // 12, (start_month + i - 1) % 12 + 1)
         for i in range(months_to_display + 1)
@@ -208,20 +177,15 @@ def fc_data(request: HttpRequest, year: int, month: int) -> HttpResponse:
         .order_by("year", "month", "fleet_type__name")
     )
 
-    fleet_type_names = {item["fleet_type__name"] for item in monthly_totals}
-    line_data = {name: [0] * len(date_range) for name in fleet_type_names}
+    date_indexes = {date: i for i, date in enumerate(date_range)}
+    line_data = {}
     for item in monthly_totals:
-        fleet_name = item["fleet_type__name"]
-        date_index = next(
-            (
-                i
-                for i, date in enumerate(date_range)
-                if date[1] == item["month"] and date[0] == item["year"]
-            ),
-            None,
-        )
+        date_index = date_indexes.get((item["year"], item["month"]))
         if date_index is not None:
-            line_data[fleet_name][date_index] = item["total_fleets"]
+            totals = line_data.setdefault(
+                item["fleet_type__name"], [0] * len(date_range)
+            )
+            totals[date_index] = item["total_fleets"]
 
     if line_data:
         plt.figure(figsize=(12, 8))
@@ -271,10 +235,8 @@ def fc_data(request: HttpRequest, year: int, month: int) -> HttpResponse:
         plt.clf()
         plt.close()
 
-    context = {
+    return {
         "bar_chart": image_base64,
         "pie_chart": pie_image_base64,
         "line_chart": line_chart_base64,
     }
-
-    return render(request, "papstats/fc_data.html", context)
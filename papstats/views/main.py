@@ -7,19 +7,28 @@ import csv
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User
-from django.shortcuts import redirect, render
+from django.shortcuts import get_object_or_404, redirect, render
 
 # Alliance Auth
 from allianceauth.services.hooks import get_extension_logger
 
 # Pap Stats
 from papstats.forms import ColumnMappingForm, CSVUploadForm
-from papstats.models import CSVColumnMapping, IgnoredCSVColumns
+from papstats.models import (
+    AggregationRun,
+    CSVColumnMapping,
+    CSVUpload,
+    IgnoredCSVColumns,
+)
+from papstats.staging import build_import_report, decode_lines, stage_csv
 from papstats.tasks import process_csv_task
 from papstats.utils import get_visible_corps
 
 logger = get_extension_logger(__name__)
 
+# Number of aggregation runs shown on the admin page
+RUN_LEDGER_SIZE = 25
+
 
 def get_navbar_elements(user: User):
     avail = get_visible_corps(user)
@@ -34,6 +43,7 @@ def get_navbar_elements(user: User):
 def admin(request):
     context = {
         **get_navbar_elements(request.user),
+        "runs": AggregationRun.objects.order_by("-started")[:RUN_LEDGER_SIZE],
     }
     if request.method == "POST":
         form = CSVUploadForm(request.POST, request.FILES)
@@ -42,10 +52,9 @@ def admin(request):
             month = form.cleaned_data["month"]
             year = form.cleaned_data["year"]
 
-            # Read CSV file to get columns
-            decoded_file = csv_file.read().decode("utf-8").splitlines()
-            reader = csv.reader(decoded_file)
-            columns = next(reader)
+            # Stage the CSV file for the import and read its columns
+            upload = stage_csv(decode_lines(csv_file), month, year, request.user)
+            columns = next(csv.reader([upload.header]))
 
             # Remove 'Account' column from columns to be mapped and filter out empty columns
             ignored_columns = IgnoredCSVColumns.objects.values_list(
@@ -73,9 +82,7 @@ def admin(request):
             column_form = ColumnMappingForm(
                 columns=columns_to_map, initial=initial_data
             )
-            request.session["csv_data"] = decoded_file
-            request.session["month"] = month
-            request.session["year"] = year
+            request.session["csv_upload_id"] = upload.id
             context.update({"form2": column_form, "columns": columns_to_map})
     else:
         form = CSVUploadForm()
@@ -83,18 +90,39 @@ def admin(request):
     return render(request, "papstats/admin.html", context)
 
 
+@login_required
+@permission_required("papstats.admin_access")
 def upload_data(request):
     if request.method == "POST":
-        csv_data = request.session["csv_data"]
-        month = request.session["month"]
-        year = request.session["year"]
+        upload = get_object_or_404(CSVUpload, pk=request.session.get("csv_upload_id"))
+        month = upload.month
+        year = upload.year
         columns_to_map = [
             col.strip()
-            for col in csv_data[0].split(",")
+            for col in next(csv.reader([upload.header]))
             if col.strip() and col.strip() != "Account"
         ]
         form = ColumnMappingForm(request.POST, columns=columns_to_map)
-        if form.is_valid():
+        if form.is_valid() and "dry_run" in request.POST:
+            column_mapping = {
+                column: form.cleaned_data[column]
+                for column in columns_to_map
+                if not form.cleaned_data[f"ignore_{column}"]
+                and form.cleaned_data[column]
+            }
+            report = build_import_report(upload, column_mapping)
+            context = {
+                **get_navbar_elements(request.user),
+                "form2": form,
+                "columns": columns_to_map,
+                "report": report,
+                "column_totals": [
+                    (column, fleet_type, report.column_totals.get(column, 0))
+                    for column, fleet_type in column_mapping.items()
+                ],
+            }
+            return render(request, "papstats/admin.html", context)
+        elif form.is_valid():
             column_mapping = {}
             ignored_columns = []
 
@@ -114,10 +142,12 @@ def upload_data(request):
                     column_name=column, defaults={"mapped_to": mapped_to}
                 )
 
-            process_csv_task.delay(csv_data, column_mapping, month, year)
+            process_csv_task.delay(upload.id, column_mapping)
+            del request.session["csv_upload_id"]
             messages.success(
                 request,
-                f"CSV data uploaded for {month}/{year}. Processing in the background",
+                f"CSV data uploaded for {month}/{year}. Processing in the background, "
+                "the import is listed in the aggregation runs once it is done",
             )
         else:
             logger.debug(f"Form errors: {form.errors}")
@@ -0,0 +1,181 @@
+"""Bulk writer for the monthly stats tables."""
+
+# Django
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+# Alliance Auth
+from allianceauth.services.hooks import get_extension_logger
+
+# Pap Stats
+from papstats.app_settings import PAPSTATS_BULK_BATCH_SIZE
+from papstats.chart_cache import bump_data_versions
+from papstats.models import MonthlyCorpStats, MonthlyCreatorStats, MonthlyUserStats
+
+logger = get_extension_logger(__name__)
+
+# The counter column of each stats model
+STAT_COUNTERS = {
+    MonthlyUserStats: "total_fats",
+    MonthlyCorpStats: "total_fats",
+    MonthlyCreatorStats: "total_created",
+}
+
+
+def get_key_fields(model) -> list:
+    """Returns the attnames of a stats model's unique_together key."""
+    unique_together = model._meta.unique_together[0]
+    return [model._meta.get_field(name).attname for name in unique_together]
+
+
+class StatsWriter:
+    """
+    Buffers increments for the monthly stats tables and writes them in batches.
+
+    Increments are keyed by each model's ``unique_together`` tuple,
+    so adding the same key twice only results in one row being written.
+    Buffered totals are added to existing rows with atomic ``F()`` updates,
+    which is safe when several workers write to the same month. Rows which
+    decrements take down to zero are removed.
+
+    Use it as a context manager to flush on exit:
+
+        with StatsWriter() as writer:
+            writer.add_user_stat(user_id, corporation_id, month, year, fleet_type_id)
+    """
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or PAPSTATS_BULK_BATCH_SIZE
+        self.rows_written = 0
+        self._buffers = {model: {} for model in STAT_COUNTERS}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, model, total: int = 1, **fields):
+        """Buffer an increment of ``total`` for the row identified by ``fields``."""
+        key = tuple(fields.pop(name) for name in get_key_fields(model))
+        buffer = self._buffers[model]
+        if key in buffer:
+            buffer[key][0] += total
+        else:
+            buffer[key] = [total, fields]
+
+    def add_user_stat(
+        self, user_id, corporation_id, month, year, fleet_type_id, total: int = 1
+    ):
+        self.add(
+            MonthlyUserStats,
+            total,
+            user_id=user_id,
+            corporation_id=corporation_id,
+            month=month,
+            year=year,
+            fleet_type_id=fleet_type_id,
+        )
+
+    def add_corp_stat(self, corporation_id, month, year, fleet_type_id, total: int = 1):
+        self.add(
+            MonthlyCorpStats,
+            total,
+            corporation_id=corporation_id,
+            month=month,
+            year=year,
+            fleet_type_id=fleet_type_id,
+        )
+
+    def add_creator_stat(self, creator_id, month, year, fleet_type_id, total: int = 1):
+        self.add(
+            MonthlyCreatorStats,
+            total,
+            creator_id=creator_id,
+            month=month,
+            year=year,
+            fleet_type_id=fleet_type_id,
+        )
+
+    def flush(self):
+        """
+        Write all buffered increments to the database and clear the buffers.
+
+        The cached charts of the written months are invalidated once the
+        current transaction is committed.
+        """
+        months = set()
+        for model, buffer in self._buffers.items():
+            items = [(key, value) for key, value in buffer.items() if value[0] != 0]
+            key_fields = get_key_fields(model)
+            year, month = key_fields.index("year"), key_fields.index("month")
+            months.update((key[year], key[month]) for key, _ in items)
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start : start + self.batch_size]
+                with transaction.atomic():
+                    self._write_increment(model, batch)
+                self.rows_written += len(batch)
+            buffer.clear()
+
+        if months:
+            transaction.on_commit(lambda: bump_data_versions(months))
+
+    def _build_objects(self, model, batch) -> list:
+        key_fields = get_key_fields(model)
+        counter = STAT_COUNTERS[model]
+        return [
+            model(**dict(zip(key_fields, key)), **defaults, **{counter: 0})
+            for key, (_, defaults) in batch
+        ]
+
+    def _write_increment(self, model, batch):
+        """Add the totals of a batch to the counters of its rows."""
+        key_fields = get_key_fields(model)
+        counter = STAT_COUNTERS[model]
+
+        # Make sure every row exists, rows created by another worker are kept
+        model.objects.bulk_create(
+            self._build_objects(model, batch),
+            ignore_conflicts=True,
+        )
+
+        totals = {key: total for key, (total, _) in batch}
+        lookup = {
+            f"{name}__in": {key[idx] for key in totals}
+            for idx, name in enumerate(key_fields)
+        }
+        rows = model.objects.filter(**lookup).only("pk", *key_fields).order_by("pk")
+
+        updates = []
+        decremented = []
+        for row in rows:
+            key = tuple(getattr(row, name) for name in key_fields)
+            if key in totals:
+                total = totals[key]
+                # Decrements never take a counter below zero. The counter is
+                # compared first, as UNSIGNED columns on MySQL can not even hold
+                # a negative intermediate result
+                value = (
+                    F(counter) + total
+                    if total > 0
+                    else Case(
+                        When(**{f"{counter}__gt": -total}, then=F(counter) + total),
+                        default=Value(0),
+                    )
+                )
+                setattr(row, counter, value)
+                updates.append(row)
+                if total < 0:
+                    decremented.append(row.pk)
+
+        model.objects.bulk_update(updates, [counter])
+        removed = 0
+        if decremented:
+            removed, _ = model.objects.filter(
+                pk__in=decremented, **{counter: 0}
+            ).delete()
+        logger.debug(
+            f"Wrote {len(updates)} {model.__name__} increments, "
+            f"removed {removed} empty rows."
+        )
@@ -24,7 +24,7 @@ SITE_URL = "http://127.0.0.1:8000"
 DEBUG = False
 
 # Add any additional apps to this list.
-INSTALLED_APPS += ["papstats"]
+INSTALLED_APPS += ["eveuniverse", "afat", "papstats"]
 
 # Enter credentials to use MySQL/MariaDB. Comment out to use sqlite3
 # DATABASES['default'] = {
@@ -66,6 +66,10 @@ DEFAULT_FROM_EMAIL = ""
 # Add any custom settings below here. #
 #######################################
 
+# Pap Stats
+STATS_ALLIANCE_ID = 3001
+STATS_IGNORE_CORPS = []
+
 # workarounds to suppress warnings
 LOGGING = None
 STATICFILES_DIRS = []